@@ -7,7 +7,7 @@ from alembic import context
 
 # target metadata
 from sqlmodel import SQLModel
-from app.models import job  # noqa
+from app.models import job, outbox  # noqa
 
 config = context.config
 
@@ -0,0 +1,29 @@
+"""add waiting retry state
+
+Revision ID: 3c1f9a7d2b10
+Revises: fb8710dfdeb6
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a7d2b10'
+down_revision = 'fb8710dfdeb6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # committed on its own: later migrations in the same run use the new value, and Postgres
+    # rejects a value added earlier in the same transaction ("unsafe use of new value")
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE jobstatus ADD VALUE IF NOT EXISTS 'WAITING_RETRY'")
+    op.add_column('job', sa.Column('next_retry_at', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('job', 'next_retry_at')
+    # Postgres cannot drop a value from an enum type; WAITING_RETRY stays defined.
@@ -0,0 +1,64 @@
+"""partition job by created_at, add job_archive
+
+Revision ID: 7d2e4b9c1a36
+Revises: 3c1f9a7d2b10
+Create Date: 2026-10-19 15:40:02.511873
+
+"""
+import time
+from datetime import datetime, timezone
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e4b9c1a36'
+down_revision = '3c1f9a7d2b10'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+ACTIVE = "status IN ('PENDING', 'RUNNING', 'WAITING_RETRY')"
+
+
+def _month(ts: float, ahead: int) -> datetime:
+    d = datetime.fromtimestamp(ts, timezone.utc)
+    month = d.year * 12 + d.month - 1 + ahead
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def upgrade() -> None:
+    # Rebuild job as a table partitioned by month on created_at. LIKE copies whatever
+    # columns the deployed table has. Rows from before the current month land in
+    # job_default, which shrinks as they are archived; the beat task
+    # maintain_job_partitions keeps creating months ahead.
+    op.execute("ALTER TABLE job RENAME TO job_legacy")
+    op.execute("ALTER TABLE job_legacy RENAME CONSTRAINT job_pkey TO job_legacy_pkey")
+    op.execute("CREATE TABLE job (LIKE job_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    op.execute("ALTER TABLE job ADD PRIMARY KEY (id, created_at)")
+    op.execute("CREATE TABLE job_default PARTITION OF job DEFAULT")
+    now = time.time()
+    for i in range(MONTHS_AHEAD + 1):
+        lo, hi = _month(now, i), _month(now, i + 1)
+        op.execute(f"CREATE TABLE job_p{lo:%Y_%m} PARTITION OF job "
+                   f"FOR VALUES FROM ({lo.timestamp()}) TO ({hi.timestamp()})")
+    op.execute("INSERT INTO job SELECT * FROM job_legacy")
+    op.execute("DROP TABLE job_legacy")
+    # the sanity check and promotion scans only look at live jobs
+    op.execute(f"CREATE INDEX ix_job_active ON job (status, last_progress_at) WHERE {ACTIVE}")
+    op.execute("CREATE INDEX ix_job_terminal_updated_at ON job (updated_at) WHERE NOT (" + ACTIVE + ")")
+
+    # context JSON is TOASTed (compressed) once rows are this size, so no extra compression here
+    op.execute("CREATE TABLE job_archive (LIKE job INCLUDING DEFAULTS)")
+    op.execute("ALTER TABLE job_archive ADD PRIMARY KEY (id)")
+
+
+def downgrade() -> None:
+    op.execute("CREATE TABLE job_plain (LIKE job INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO job_plain SELECT * FROM job")
+    op.execute("INSERT INTO job_plain SELECT * FROM job_archive a "
+               "WHERE NOT EXISTS (SELECT 1 FROM job_plain p WHERE p.id = a.id)")
+    op.execute("DROP TABLE job")
+    op.execute("DROP TABLE job_archive")
+    op.execute("ALTER TABLE job_plain RENAME TO job")
+    op.execute("ALTER TABLE job ADD CONSTRAINT job_pkey PRIMARY KEY (id)")
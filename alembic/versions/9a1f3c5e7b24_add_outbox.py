@@ -0,0 +1,51 @@
+"""add outbox
+
+Revision ID: 9a1f3c5e7b24
+Revises: 7d2e4b9c1a36
+Create Date: 2026-10-19 17:05:44.930215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '9a1f3c5e7b24'
+down_revision = '7d2e4b9c1a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('priority', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('countdown', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.Float(), nullable=False),
+    sa.Column('sent_at', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # the relay scans unsent rows in id order; sent ones are purged by age
+    op.create_index('ix_outbox_unsent', 'outbox', ['id'], postgresql_where=sa.text('sent_at IS NULL'))
+    op.create_index('ix_outbox_sent_at', 'outbox', ['sent_at'], postgresql_where=sa.text('sent_at IS NOT NULL'))
+    # wake the relay on commit (notifications from one transaction are collapsed)
+    op.execute("""
+        CREATE FUNCTION outbox_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('outbox', '');
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("CREATE TRIGGER outbox_notify AFTER INSERT ON outbox "
+               "FOR EACH STATEMENT EXECUTE FUNCTION outbox_notify()")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER outbox_notify ON outbox")
+    op.execute("DROP FUNCTION outbox_notify()")
+    op.drop_index('ix_outbox_sent_at', table_name='outbox')
+    op.drop_index('ix_outbox_unsent', table_name='outbox')
+    op.drop_table('outbox')
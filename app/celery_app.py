@@ -1,5 +1,8 @@
 from celery import Celery
-from app.config import REDIS_URL, SANITY_CHECK_INTERVAL_SECONDS
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+from app.config import (REDIS_URL, SANITY_CHECK_INTERVAL_SECONDS, WORKER_METRICS_PORT, BULK_RESUME_INTERVAL_S,
+                        QUEUE_MAINTENANCE)
+from app.core.metrics import mark_process_dead, start_worker_exporter
 
 celery_app = Celery("cao", broker=REDIS_URL, backend=REDIS_URL)
 
@@ -15,12 +18,50 @@ celery_app.conf.beat_schedule = {
     "promote-waiting-jobs": {
         "task": "worker.tasks.promote_waiting_jobs",
         "schedule": 300.0,  # Every 5 minutes
-    }
+    },
+    "archive-terminal-jobs": {
+        "task": "worker.tasks.archive_terminal_jobs",
+        "schedule": 3600.0,
+    },
+    "ramp-resumed-jobs": {
+        "task": "worker.tasks.ramp_resumed_jobs",
+        "schedule": BULK_RESUME_INTERVAL_S,
+    },
+    "maintain-job-partitions": {
+        "task": "worker.tasks.maintain_job_partitions",
+        "schedule": 86400.0,
+    },
 }
 
+# steps are always sent to a priority queue; anything else (the beat schedule above) goes here
+# rather than Celery's own "celery" queue, which no worker listens on
+celery_app.conf.task_default_queue = QUEUE_MAINTENANCE
+
+# workers register the tasks; publishers send them by name (app/services/task_publisher.py)
+celery_app.conf.imports = ("worker.tasks",)
+
 # Enable priority support in Celery
 celery_app.conf.task_acks_late = True
 celery_app.conf.worker_prefetch_multiplier = 1
 celery_app.conf.broker_transport_options = {
     'priority_steps': list(range(10)),  # Enable 0-9 priority levels
 }
+
+
+@worker_init.connect
+def _start_metrics_exporter(**kwargs):
+    if WORKER_METRICS_PORT:
+        start_worker_exporter(WORKER_METRICS_PORT)
+
+
+@worker_process_init.connect
+def _watch_runtime_config(**kwargs):
+    # per child: the snapshot and its watcher thread don't survive the fork
+    from app.services import config_service
+    config_service.start_watcher()
+
+
+@worker_process_shutdown.connect
+def _forget_child_metrics(pid=None, **kwargs):
+    if pid:
+        mark_process_dead(pid)
@@ -6,14 +6,113 @@ load_dotenv()
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:pass@db:5432/orchestrator")
 
+# DB connection pools, per process role. Each Celery child runs one task at a time, so it needs
+# few connections; size API + workers x concurrency against Postgres max_connections.
+DB_POOL = {
+    "api": {"pool_size": int(os.getenv("API_DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("API_DB_MAX_OVERFLOW", "10"))},
+    "worker": {"pool_size": int(os.getenv("WORKER_DB_POOL_SIZE", "2")),
+               "max_overflow": int(os.getenv("WORKER_DB_MAX_OVERFLOW", "2"))},
+}
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "30"))
+DB_POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Behind PgBouncer in transaction pooling mode: no client-side pool (PgBouncer pools instead)
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
 JOB_STUCK_SECONDS = int(os.getenv("JOB_STUCK_SECONDS", "7200"))
 SANITY_CHECK_INTERVAL_SECONDS = int(os.getenv("SANITY_CHECK_INTERVAL_SECONDS", "60"))
 
+# Terminal jobs are moved to job_archive this long after their last update (JobRepository.get
+# still finds them); `job` is partitioned by month on created_at, created this many months ahead
+JOB_ARCHIVE_AFTER_S = int(os.getenv("JOB_ARCHIVE_AFTER_S", str(30 * 86400)))
+JOB_ARCHIVE_BATCH_SIZE = int(os.getenv("JOB_ARCHIVE_BATCH_SIZE", "1000"))
+JOB_ARCHIVE_MAX_BATCHES = int(os.getenv("JOB_ARCHIVE_MAX_BATCHES", "50"))
+JOB_PARTITIONS_AHEAD = int(os.getenv("JOB_PARTITIONS_AHEAD", "3"))
+
+# Outbox relay (worker/outbox_relay.py): rows published per transaction, fallback poll interval
+# when no NOTIFY arrives (the only wake-up behind PgBouncer), how long sent rows are kept
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_S = float(os.getenv("OUTBOX_POLL_S", "1.0"))
+OUTBOX_RETENTION_S = int(os.getenv("OUTBOX_RETENTION_S", "86400"))
+
+# Bulk resume of retryable failures (POST /api/v1/admin/jobs/resume): parked jobs are released
+# every BULK_RESUME_INTERVAL_S, per service, within its free lease capacity. The per-tick
+# allowance starts at BULK_RESUME_RAMP_START and doubles while the service's breaker stays closed
+BULK_RESUME_INTERVAL_S = float(os.getenv("BULK_RESUME_INTERVAL_S", "10"))
+BULK_RESUME_RAMP_START = int(os.getenv("BULK_RESUME_RAMP_START", "2"))
+BULK_RESUME_MAX_PER_TICK = int(os.getenv("BULK_RESUME_MAX_PER_TICK", "200"))
+
 HTTP_CONNECT_TIMEOUT_S = float(os.getenv("HTTP_CONNECT_TIMEOUT_S", "3.0"))
 HTTP_READ_TIMEOUT_S = float(os.getenv("HTTP_READ_TIMEOUT_S", "30.0"))
 
 INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY", "")
 
+# Job cancellation: how long cancel/task-id keys live, how often in-flight calls check them
+CANCEL_KEY_TTL_S = int(os.getenv("CANCEL_KEY_TTL_S", "86400"))
+CANCEL_POLL_INTERVAL_S = float(os.getenv("CANCEL_POLL_INTERVAL_S", "1.0"))
+
+# Automatic retries of retryable step failures (exponential backoff with full jitter)
+RETRY_BASE_DELAY_S = float(os.getenv("RETRY_BASE_DELAY_S", "5"))
+RETRY_MAX_DELAY_S = float(os.getenv("RETRY_MAX_DELAY_S", "300"))
+
+# Multi-replica services: replicas failing with these codes are taken out of rotation
+REPLICA_EJECT_SECONDS = int(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+REPLICA_EJECT_CODES = ("SERVICE_UNREACHABLE", "SERVICE_TIMEOUT")
+
+# Per-service circuit breaker (state shared in Redis)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_OPEN_SECONDS = int(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "30"))
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_PROBES", "1"))
+CIRCUIT_BREAKER_CODES = ("SERVICE_UNREACHABLE", "SERVICE_TIMEOUT", "SERVICE_HTTP_ERROR", "BAD_RESPONSE")
+
+# Per-job event log (Redis Stream) behind WebSocket/SSE replay
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "500"))
+EVENT_STREAM_TTL_S = int(os.getenv("EVENT_STREAM_TTL_S", "86400"))
+EVENT_STREAM_TERMINAL_TTL_S = int(os.getenv("EVENT_STREAM_TERMINAL_TTL_S", "3600"))
+SSE_KEEPALIVE_S = float(os.getenv("SSE_KEEPALIVE_S", "15"))
+# Buffered publishing: flush after this many events; optionally skip PUBLISH for jobs nobody
+# is subscribed to (costs a PUBSUB NUMSUB round trip per flush; events are still logged)
+WS_PUBLISH_MAX_BUFFER = int(os.getenv("WS_PUBLISH_MAX_BUFFER", "500"))
+WS_PUBLISH_SKIP_UNWATCHED = os.getenv("WS_PUBLISH_SKIP_UNWATCHED", "false").lower() == "true"
+
+# Multi-job /ws subscriptions: events are batched per frame over a short window
+WS_BATCH_WINDOW_MS = int(os.getenv("WS_BATCH_WINDOW_MS", "50"))
+WS_BATCH_MAX_EVENTS = int(os.getenv("WS_BATCH_MAX_EVENTS", "100"))
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "50"))
+WS_MAX_JOB_IDS = int(os.getenv("WS_MAX_JOB_IDS", "1000"))
+# Events a connection may fall behind by before it is dropped (clients resume by event id)
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "256"))
+
+# Background service health probing (API process); cached results feed routing
+HEALTH_PROBER_ENABLED = os.getenv("HEALTH_PROBER_ENABLED", "true").lower() == "true"
+HEALTH_PROBE_INTERVAL_S = float(os.getenv("HEALTH_PROBE_INTERVAL_S", "10"))
+HEALTH_PROBE_TIMEOUT_S = float(os.getenv("HEALTH_PROBE_TIMEOUT_S", "2"))
+HEALTH_STALE_AFTER_S = float(os.getenv("HEALTH_STALE_AFTER_S", "30"))
+# a step deferred this many times for a service reported down is dispatched anyway (and so
+# charged attempts), in case the health check itself is wrong (bad path, auth required)
+HEALTH_MAX_DEFERRALS = int(os.getenv("HEALTH_MAX_DEFERRALS", "30"))
+
+# Prometheus exporter port in each Celery worker (0 disables); see app/core/metrics.py
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# Per-step timing traces (fraction of jobs sampled; optional OTLP/HTTP export, e.g. http://otel-collector:4318/v1/traces)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_TTL_S = int(os.getenv("TRACE_TTL_S", str(3 * 86400)))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+
+# Runtime overrides of SERVICES/FEATURES (see app/services/config_service.py): each process also
+# re-checks the stored version this often in case it missed a change notification
+CONFIG_REFRESH_S = float(os.getenv("CONFIG_REFRESH_S", "30"))
+
+# Streaming services ("stream": True) may answer with NDJSON/SSE chunks; their progress and
+# partial output is relayed as STEP_PROGRESS events at most this often per step
+STREAM_PROGRESS_INTERVAL_S = float(os.getenv("STREAM_PROGRESS_INTERVAL_S", "0.5"))
+
+# Single-flight coalescing of identical in-flight service calls
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_RESULT_TTL_S = int(os.getenv("COALESCE_RESULT_TTL_S", "30"))
+
 # External API for user priority lookup
 PRIORITY_API_URL = os.getenv("PRIORITY_API_URL", "http://priority-service:8000")
 
@@ -25,6 +124,26 @@ PROMOTE_MEDIUM_TO_HIGH_AFTER = int(os.getenv("PROMOTE_MEDIUM_TO_HIGH_AFTER", "36
 QUEUE_HIGH = "high_priority"
 QUEUE_MEDIUM = "medium_priority"
 QUEUE_LOW = "low_priority"
+# beat's periodic tasks; some worker must consume it (worker_high in docker-compose)
+QUEUE_MAINTENANCE = "maintenance"
+
+def _urls(value: str):
+    """A comma-separated list configures one replica per URL."""
+    urls = [u.strip() for u in value.split(",") if u.strip()]
+    return urls if len(urls) > 1 else urls[0]
+
+def _batching(prefix: str):
+    """
+    Micro-batching is opt-in: the service must expose a batch endpoint, so the block is only
+    added when {prefix}_MAX_BATCH_SIZE is set.
+    """
+    if not os.getenv(f"{prefix}_MAX_BATCH_SIZE"):
+        return {}
+    return {"batching": {
+        "max_batch_size": int(os.getenv(f"{prefix}_MAX_BATCH_SIZE")),
+        "max_wait_ms": int(os.getenv(f"{prefix}_MAX_BATCH_WAIT_MS", "50")),
+        "execute_path": os.getenv(f"{prefix}_BATCH_PATH", "/v1/execute_batch"),
+    }}
 
 # AI Service configurations - removed queue field, keeping concurrency limits
 SERVICES = {
@@ -33,27 +152,34 @@ SERVICES = {
         "timeout": 120,
         "lease_ttl": 150,
         "max_step_attempts": 3,
-        "base_url": os.getenv("PROMPT_ENHANCER_URL", "http://prompt-enhancer:9000"),
+        "coalesce": True,
+        "base_url": _urls(os.getenv("PROMPT_ENHANCER_URL", "http://prompt-enhancer:9000")),
         "execute_path": "/v1/execute",
         "health_path": "/health",
         "auth": {"type": "api_key_header", "header": "X-Internal-Key"},
+        **_batching("PROMPT_ENHANCER"),
     },
     "fast_chat_llm": {
         "limit": 4,
         "timeout": 180,
         "lease_ttl": 210,
         "max_step_attempts": 3,
-        "base_url": os.getenv("FAST_CHAT_LLM_URL", "http://fast-chat:9000"),
+        "coalesce": True,
+        "stream": True,
+        "base_url": _urls(os.getenv("FAST_CHAT_LLM_URL", "http://fast-chat:9000")),
         "execute_path": "/v1/execute",
         "health_path": "/health",
         "auth": {"type": "api_key_header", "header": "X-Internal-Key"},
+        **_batching("FAST_CHAT_LLM"),
     },
     "image_gen": {
         "limit": 1,
         "timeout": 360,
         "lease_ttl": 400,
         "max_step_attempts": 2,
-        "base_url": os.getenv("IMAGE_GEN_URL", "http://image-gen:9000"),
+        "coalesce": True,
+        "stream": True,
+        "base_url": _urls(os.getenv("IMAGE_GEN_URL", "http://image-gen:9000")),
         "execute_path": "/v1/execute",
         "health_path": "/health",
         "auth": {"type": "api_key_header", "header": "X-Internal-Key"},
@@ -63,7 +189,9 @@ SERVICES = {
         "timeout": 420,
         "lease_ttl": 460,
         "max_step_attempts": 2,
-        "base_url": os.getenv("MODEL_3D_GEN_URL", "http://model-3d-gen:9000"),
+        "coalesce": True,
+        "stream": True,
+        "base_url": _urls(os.getenv("MODEL_3D_GEN_URL", "http://model-3d-gen:9000")),
         "execute_path": "/v1/execute",
         "health_path": "/health",
         "auth": {"type": "api_key_header", "header": "X-Internal-Key"},
@@ -0,0 +1,67 @@
+"""
+SQLAlchemy engines per process role.
+
+Pool size and overflow come from DB_POOL[role]. Engines are created at import
+in the Celery main process, before the prefork children exist, so every
+child discards the inherited pool right after fork (without closing the
+parent's sockets) and opens its own connections. With DB_PGBOUNCER the app
+keeps no pool of its own: PgBouncer in transaction mode does the pooling and
+every session gets a fresh, stateless connection.
+"""
+import os
+import time
+import weakref
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlmodel import create_engine
+from app.config import (DATABASE_URL, DB_POOL, DB_POOL_TIMEOUT_S, DB_POOL_RECYCLE_S, DB_POOL_PRE_PING,
+                        DB_PGBOUNCER)
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS
+
+_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited into DB_POOL_CHECKOUT_SECONDS."""
+
+    role = "unknown"
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.role = self.role
+        return pool
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        outcome = "ok"
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.role, outcome).observe(time.perf_counter() - t0)
+
+
+def make_engine(role: str, url: str = DATABASE_URL, pgbouncer: bool = DB_PGBOUNCER) -> Engine:
+    if pgbouncer:
+        engine = create_engine(url, poolclass=NullPool)
+    else:
+        conf = DB_POOL[role]
+        engine = create_engine(url, poolclass=TimedQueuePool,
+                               pool_size=conf["pool_size"], max_overflow=conf["max_overflow"],
+                               pool_timeout=DB_POOL_TIMEOUT_S, pool_recycle=DB_POOL_RECYCLE_S,
+                               pool_pre_ping=DB_POOL_PRE_PING)
+        engine.pool.role = role  # create_engine() won't pass extra pool arguments through
+    _engines.add(engine)
+    return engine
+
+
+def _reset_after_fork():
+    # the parent keeps using its connections; the child must never touch them
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
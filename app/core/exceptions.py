@@ -1,3 +1,8 @@
 class CAOException(Exception):
     """Base exception for CAO"""
     pass
+
+
+class ConfigVersionConflict(CAOException):
+    """Runtime config changed since the version the caller based its update on"""
+    pass
@@ -0,0 +1,169 @@
+"""
+Prometheus metrics.
+
+Histograms are observed on the hot path in API and worker processes. With
+PROMETHEUS_MULTIPROC_DIR set (required for Celery prefork and multi-worker
+uvicorn, and must be set before this module is imported) every process writes
+to that directory and the exporters aggregate it. Lease occupancy and queue
+depth are read from Redis when the API's /metrics is scraped.
+"""
+import glob
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+import redis
+from prometheus_client import (CollectorRegistry, CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest,
+                               multiprocess, start_http_server)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.config import REDIS_URL, QUEUE_HIGH, QUEUE_MEDIUM, QUEUE_LOW
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+PRIORITY_BY_QUEUE = {QUEUE_HIGH: "high", QUEUE_MEDIUM: "medium", QUEUE_LOW: "low"}
+
+# kombu's Redis transport keeps each priority level > 0 in its own list
+PRIORITY_SEP = "\x06\x16"
+PRIORITY_STEPS = range(10)
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600)
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+STEP_HTTP_SECONDS = Histogram(
+    "cao_step_http_seconds", "Service call latency per step",
+    ["service", "priority", "outcome"], buckets=_LATENCY_BUCKETS)
+LEASE_WAIT_SECONDS = Histogram(
+    "cao_lease_wait_seconds", "Time spent waiting for a limiter lease",
+    ["service", "priority", "outcome"], buckets=_WAIT_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram(
+    "cao_queue_wait_seconds", "Time from a step becoming due to a worker starting it",
+    ["priority"], buckets=_WAIT_BUCKETS)
+DB_COMMIT_SECONDS = Histogram(
+    "cao_db_commit_seconds", "Duration of each DB commit", ["service", "priority"], buckets=_FAST_BUCKETS)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "cao_db_pool_checkout_seconds", "Time to get a connection from the DB pool (connecting included)",
+    ["role", "outcome"], buckets=_FAST_BUCKETS + (5, 10, 30))
+EVENT_PUBLISH_SECONDS = Histogram(
+    "cao_event_publish_seconds", "Duration of each job event publish round trip", buckets=_FAST_BUCKETS)
+WS_OUTBOUND_EVENTS = Counter(
+    "cao_ws_outbound_events", "Events a WebSocket/SSE client's outbound queue conflated or dropped",
+    ["outcome"])
+WS_SLOW_DISCONNECTS = Counter(
+    "cao_ws_slow_disconnects", "WebSocket/SSE clients disconnected for falling too far behind")
+
+
+@contextmanager
+def timed(histogram, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - t0)
+
+
+def instrument_db_commits():
+    """Time every Session commit (flush included) into DB_COMMIT_SECONDS (see `label_commits`)."""
+    if event.contains(Session, "before_commit", _commit_started):
+        return
+    event.listen(Session, "before_commit", _commit_started)
+    event.listen(Session, "after_commit", _commit_finished)
+
+
+def label_commits(session, service: str, priority: str):
+    """Attribute the session's later commits to a step's service and job priority."""
+    session.info["commit_labels"] = {"service": service, "priority": priority}
+
+
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _commit_finished(session):
+    t0 = session.info.pop("commit_started", None)
+    if t0 is not None:
+        # commits outside a step (API requests, maintenance tasks) are labelled "none"
+        labels = session.info.get("commit_labels") or {"service": "none", "priority": "none"}
+        DB_COMMIT_SECONDS.labels(**labels).observe(time.perf_counter() - t0)
+
+
+def priority_of_queue(queue: Optional[str]) -> str:
+    return PRIORITY_BY_QUEUE.get(queue or "", "unknown")
+
+
+def queue_depth(client, queue: str) -> int:
+    keys = [queue] + [f"{queue}{PRIORITY_SEP}{p}" for p in PRIORITY_STEPS if p]
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.llen(key)
+    return sum(pipe.execute())
+
+
+class RedisStateCollector:
+    """Lease occupancy per limiter slot and Celery queue depth, read at scrape time."""
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+
+    def collect(self):
+        from app.services import config_service
+        from app.services.http_service_client import service_replicas
+        from app.services.limiter_service import LimiterService
+
+        in_use = GaugeMetricFamily("cao_leases_in_use", "Leases held per limiter slot", labels=["service", "slot"])
+        limit = GaugeMetricFamily("cao_lease_limit", "Lease limit per limiter slot", labels=["service", "slot"])
+        depth = GaugeMetricFamily("cao_queue_depth", "Messages waiting per Celery queue", labels=["queue"])
+
+        try:
+            rows = [(name, slot, rep["limit"])
+                    for name, conf in config_service.current().services.items()
+                    for slot, rep in zip(LimiterService().slots(name, service_replicas(conf)),
+                                         service_replicas(conf))]
+            values = self.redis.mget([f"conc:{slot}" for _, slot, _ in rows]) if rows else []
+            for (name, slot, lim), cur in zip(rows, values):
+                in_use.add_metric([name, slot], float(cur or 0))
+                limit.add_metric([name, slot], float(lim))
+            for queue in PRIORITY_BY_QUEUE:
+                depth.add_metric([queue], float(queue_depth(self.redis, queue)))
+        except redis.RedisError:
+            return
+        yield in_use
+        yield limit
+        yield depth
+
+
+def registry() -> CollectorRegistry:
+    """Registry for an exporter: this process's metrics, or every process's in multiprocess mode."""
+    if not MULTIPROC_DIR:
+        from prometheus_client import REGISTRY
+        return REGISTRY
+    reg = CollectorRegistry()
+    multiprocess.MultiProcessCollector(reg)
+    return reg
+
+
+_api_registry: Optional[CollectorRegistry] = None
+
+
+def render_api_metrics() -> bytes:
+    global _api_registry
+    if _api_registry is None:
+        _api_registry = registry()
+        _api_registry.register(RedisStateCollector())
+    return generate_latest(_api_registry)
+
+
+def start_worker_exporter(port: int):
+    """HTTP exporter for a Celery worker; call once in the main process before children fork."""
+    if MULTIPROC_DIR:
+        # stale files from a previous run would be summed into this one
+        for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+    start_http_server(port, registry=registry())
+
+
+def mark_process_dead(pid: int):
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
@@ -0,0 +1,49 @@
+"""
+Process-wide Redis client, created on first use.
+
+Services keep a module-level `r = get_redis()` as before, but importing them
+no longer builds a client each, and they all share one connection pool.
+The connection pool resets itself in a forked child, so this is safe to use
+in Celery prefork workers.
+"""
+import threading
+from typing import Callable, Optional
+import redis
+from app.config import REDIS_URL
+
+
+class LazyRedis:
+    """Stands in for a `redis.Redis`; the real client is made on first attribute access."""
+
+    def __init__(self, factory: Callable[[], redis.Redis]):
+        self._factory = factory
+        self._client: Optional[redis.Redis] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name: str):
+        return getattr(self.client, name)
+
+    def close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+
+_shared = LazyRedis(lambda: redis.from_url(REDIS_URL, decode_responses=True))
+
+
+def get_redis() -> LazyRedis:
+    return _shared
+
+
+def close_redis():
+    """Drop the shared client (API lifespan shutdown); it is recreated if used again."""
+    _shared.close()
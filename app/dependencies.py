@@ -1,7 +1,7 @@
-from sqlmodel import Session, create_engine
-from app.config import DATABASE_URL
+from sqlmodel import Session
+from app.core.db import make_engine
 
-engine = create_engine(DATABASE_URL)
+engine = make_engine("api")
 
 def get_session():
     with Session(engine) as session:
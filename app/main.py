@@ -1,8 +1,38 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routers import jobs, websocket, health
+from app.config import HEALTH_PROBER_ENABLED
+from app.core.metrics import instrument_db_commits
+from app.core.redis_clients import close_redis
+from app.routers import jobs, websocket, health, metrics, config, admin
+from app.services import config_service
+from app.services.health_service import run_prober
+from app.services.pubsub_hub import hub
 
-app = FastAPI(title="CAO Gateway")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prober = asyncio.create_task(run_prober()) if HEALTH_PROBER_ENABLED else None
+    watcher = config_service.start_watcher()
+    yield
+    watcher.stop()
+    if prober:
+        prober.cancel()
+        try:
+            await prober
+        except asyncio.CancelledError:
+            pass
+    await hub.close()
+    close_redis()
+
+
+instrument_db_commits()
+
+app = FastAPI(title="CAO Gateway", lifespan=lifespan)
 
 app.include_router(jobs.router, prefix="/api/v1")
 app.include_router(websocket.router)
 app.include_router(health.router, prefix="/api/v1")
+app.include_router(config.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
+app.include_router(metrics.router)
@@ -3,6 +3,7 @@ from enum import Enum
 class JobStatus(str, Enum):
     PENDING = "PENDING"
     RUNNING = "RUNNING"
+    WAITING_RETRY = "WAITING_RETRY"
     FAILED = "FAILED"
     COMPLETED = "COMPLETED"
     CANCELLED = "CANCELLED"
@@ -11,8 +12,12 @@ class WebSocketEvent(str, Enum):
     CONNECT = "WS_CONNECTED"
     WAITING = "WAITING_FOR_SLOT"
     STEP_START = "STEP_STARTED"
+    STEP_PROGRESS = "STEP_PROGRESS"
     STEP_COMPLETE = "STEP_COMPLETED"
+    RETRY_SCHEDULED = "STEP_RETRY_SCHEDULED"
     JOB_COMPLETE = "JOB_COMPLETED"
+    JOB_CANCELLED = "JOB_CANCELLED"
+    JOB_PROMOTED = "JOB_PROMOTED"
     ERROR = "JOB_ERROR"
 
 class StepStatus(str, Enum):
@@ -3,7 +3,7 @@ from typing import Dict, Optional
 from sqlmodel import SQLModel, Field, JSON
 from app.models.enums import JobStatus
 
-class Job(SQLModel, table=True):
+class JobBase(SQLModel):
     id: str = Field(primary_key=True)
     feature_name: str
     status: JobStatus = Field(default=JobStatus.PENDING)
@@ -14,6 +14,7 @@ class Job(SQLModel, table=True):
     error_log: Optional[str] = None
     error_code: Optional[str] = None
     retryable: Optional[bool] = None
+    next_retry_at: Optional[float] = None  # set while WAITING_RETRY
     
     # Priority fields
     priority: str = Field(default="medium")  # "high", "medium", "low"
@@ -25,3 +26,12 @@ class Job(SQLModel, table=True):
     created_at: float = Field(default_factory=time.time)
     updated_at: float = Field(default_factory=time.time)
     last_progress_at: float = Field(default_factory=time.time)
+
+class Job(JobBase, table=True):
+    # In Postgres the table is range-partitioned by month on created_at, so its primary
+    # key there is (id, created_at); ids are still unique (uuid4)
+    pass
+
+class JobArchive(JobBase, table=True):
+    """Terminal jobs moved out of `job` after JOB_ARCHIVE_AFTER_S (see worker.tasks.archive_terminal_jobs)."""
+    __tablename__ = "job_archive"
@@ -0,0 +1,17 @@
+import time
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+class OutboxMessage(SQLModel, table=True):
+    """
+    A job step to queue, written in the same transaction as the job change that
+    makes it due; worker/outbox_relay.py publishes it and sets `sent_at`.
+    """
+    __tablename__ = "outbox"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str
+    priority: str
+    countdown: Optional[int] = None  # seconds after created_at the step becomes due
+    created_at: float = Field(default_factory=time.time)
+    sent_at: Optional[float] = None
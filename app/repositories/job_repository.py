@@ -1,25 +1,67 @@
 import time
-from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Mapping, Sequence
+from sqlalchemy import and_, case, delete, false, func, insert, or_, select, text, update
+from sqlalchemy.orm.attributes import flag_modified
 from sqlmodel import Session
 from app.repositories.base_repository import BaseRepository
-from app.models.job import Job
+from app.models.job import Job, JobArchive
+from app.models.outbox import OutboxMessage
 from app.models.enums import JobStatus
 
+TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+
+def month_start(ts: float, months_ahead: int = 0) -> datetime:
+    d = datetime.fromtimestamp(ts, timezone.utc)
+    month = d.year * 12 + d.month - 1 + months_ahead
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
 class JobRepository(BaseRepository):
     def get(self, job_id: str) -> Optional[Job]:
-        return self.session.get(Job, job_id)
+        job = self.session.get(Job, job_id)
+        if job is None:
+            archived = self.session.get(JobArchive, job_id)
+            if archived is not None:
+                # a transient copy: saving it (e.g. resuming an archived failure) puts it back in `job`
+                job = Job(**archived.model_dump())
+        return job
 
-    def create(self, job_id: str, feature_name: str, initial_input: Dict[str, Any]) -> Job:
+    def create(self, job_id: str, feature_name: str, initial_input: Dict[str, Any],
+               priority: str = "medium", user_id: Optional[str] = None) -> Job:
         job = Job(
             id=job_id,
             feature_name=feature_name,
             status=JobStatus.PENDING,
             context={"initial_input": initial_input},
+            priority=priority,
+            original_priority=priority,
+            user_id=user_id,
         )
         self.session.add(job)
         self.session.commit()
         return job
 
+    def stage_step(self, job_id: str, priority: str, countdown: Optional[int] = None):
+        """
+        Queue the job's next step as part of the next commit, so the job change
+        and its dispatch land together or not at all (see worker/outbox_relay.py).
+        """
+        self.session.add(OutboxMessage(job_id=job_id, priority=priority, countdown=countdown))
+
+    def enqueue_step(self, job_id: str, priority: str, countdown: Optional[int] = None):
+        self.stage_step(job_id, priority, countdown)
+        self.session.commit()
+
+    def defer(self, job: Job, countdown: int):
+        """Run the step again later, keeping its deferral counters (in context)."""
+        flag_modified(job, "context")
+        job.updated_at = time.time()
+        self.session.add(job)
+        self.enqueue_step(job.id, job.priority, countdown)
+
     def set_status(self, job: Job, status: JobStatus):
         job.status = status
         job.updated_at = time.time()
@@ -35,12 +77,34 @@ class JobRepository(BaseRepository):
         self.session.add(job)
         self.session.commit()
 
+    def schedule_retry(self, job: Job, code: str, message: str, next_retry_at: float):
+        job.status = JobStatus.WAITING_RETRY
+        job.error_code = code
+        job.error_log = message
+        job.retryable = True
+        job.next_retry_at = next_retry_at
+        # retry counters live in context
+        flag_modified(job, "context")
+        job.updated_at = time.time()
+        self.session.add(job)
+        self.session.commit()
+
+    def cancel(self, job: Job) -> JobStatus:
+        prev = job.status
+        job.status = JobStatus.CANCELLED
+        job.next_retry_at = None
+        job.updated_at = time.time()
+        self.session.add(job)
+        self.session.commit()
+        return prev
+
     def clear_failure(self, job: Job) -> JobStatus:
         prev = job.status
         job.status = JobStatus.RUNNING
         job.error_code = None
         job.error_log = None
         job.retryable = None
+        job.next_retry_at = None
         job.updated_at = time.time()
         self.session.add(job)
         self.session.commit()
@@ -48,6 +112,8 @@ class JobRepository(BaseRepository):
 
     def save_step(self, job: Job, step_key: str, step_payload: Dict[str, Any]):
         job.context[step_key] = step_payload
+        # JSON column is not mutation-tracked; in-place edits must be flagged
+        flag_modified(job, "context")
         job.last_progress_at = time.time()
         job.updated_at = time.time()
         self.session.add(job)
@@ -87,7 +153,7 @@ class JobRepository(BaseRepository):
         # Jobs that should be promoted
         statement = select(Job).where(
             and_(
-                Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+                Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING, JobStatus.WAITING_RETRY]),
                 or_(
                     # Low → Medium after 30 min
                     and_(
@@ -104,3 +170,135 @@ class JobRepository(BaseRepository):
             )
         )
         return list(self.session.exec(statement).all())
+
+    def archive_terminal(self, older_than: float, limit: int) -> int:
+        """Move up to `limit` terminal jobs last updated before `older_than` into job_archive."""
+        ids = list(self.session.execute(
+            select(Job.id)
+            .where(Job.status.in_(TERMINAL_STATUSES), Job.updated_at < older_than)
+            .order_by(Job.updated_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).scalars())
+        if not ids:
+            return 0
+        columns = [c.name for c in Job.__table__.columns]
+        # a job resumed out of the archive and finished again replaces its old archived copy
+        self.session.execute(delete(JobArchive).where(JobArchive.id.in_(ids)))
+        self.session.execute(insert(JobArchive).from_select(
+            columns, select(*(Job.__table__.c[c] for c in columns)).where(Job.id.in_(ids))))
+        self.session.execute(delete(Job).where(Job.id.in_(ids)))
+        self.session.commit()
+        return len(ids)
+
+    def _partitioned(self) -> bool:
+        return self.session.get_bind().dialect.name == "postgresql"
+
+    def ensure_partitions(self, months_ahead: int) -> List[str]:
+        """Create the monthly `job` partitions up to `months_ahead` months from now (Postgres only)."""
+        if not self._partitioned():
+            return []
+        created = []
+        now = time.time()
+        for i in range(months_ahead + 1):
+            lo, hi = month_start(now, i), month_start(now, i + 1)
+            name = f"job_p{lo:%Y_%m}"
+            exists = self.session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+            if exists:
+                continue
+            self.session.execute(text(
+                f"CREATE TABLE {name} PARTITION OF job FOR VALUES FROM ({lo.timestamp()}) TO ({hi.timestamp()})"))
+            created.append(name)
+        self.session.commit()
+        return created
+
+    def drop_empty_partitions(self, before: float) -> List[str]:
+        """Drop monthly `job` partitions that end before `before` and have been fully archived."""
+        if not self._partitioned():
+            return []
+        cutoff = f"job_p{month_start(before):%Y_%m}"
+        names = self.session.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'job'::regclass AND c.relname LIKE 'job\\_p%' ORDER BY c.relname")).scalars()
+        dropped = []
+        for name in names:
+            if name >= cutoff:
+                break
+            if self.session.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is None:
+                self.session.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        self.session.commit()
+        return dropped
+
+    # Bulk resume: retryable failures are parked as WAITING_RETRY without a next_retry_at,
+    # then released a few at a time (see BulkResumeService)
+
+    def _at_service(self, features: Mapping[str, Sequence[str]], service_name: str):
+        """Jobs whose current step calls `service_name`."""
+        steps = [and_(Job.feature_name == feature, Job.current_step_index == i)
+                 for feature, recipe in features.items() for i, name in enumerate(recipe) if name == service_name]
+        return or_(*steps) if steps else false()
+
+    def _resumable(self, features, service_name: str, error_codes: Sequence[str],
+                   since: Optional[float], until: Optional[float]) -> list:
+        where = [Job.status == JobStatus.FAILED, Job.retryable.is_(True), self._at_service(features, service_name)]
+        if error_codes:
+            where.append(Job.error_code.in_(list(error_codes)))
+        if since is not None:
+            where.append(Job.updated_at >= since)
+        if until is not None:
+            where.append(Job.updated_at < until)
+        return where
+
+    def count_resumable(self, features, service_name: str, error_codes: Sequence[str] = (),
+                        since: Optional[float] = None, until: Optional[float] = None) -> int:
+        where = self._resumable(features, service_name, error_codes, since, until)
+        return self.session.execute(select(func.count()).select_from(Job).where(*where)).scalar()
+
+    def park_resumable(self, features, service_name: str, error_codes: Sequence[str] = (),
+                       since: Optional[float] = None, until: Optional[float] = None) -> int:
+        """One UPDATE moving the matching retryable failures to WAITING_RETRY, parked."""
+        where = self._resumable(features, service_name, error_codes, since, until)
+        result = self.session.execute(
+            update(Job).where(*where)
+            .values(status=JobStatus.WAITING_RETRY, next_retry_at=None, updated_at=time.time())
+            .execution_options(synchronize_session=False))
+        self.session.commit()
+        return result.rowcount
+
+    def has_parked(self) -> bool:
+        return self.session.execute(select(Job.id).where(
+            Job.status == JobStatus.WAITING_RETRY, Job.next_retry_at.is_(None)).limit(1)).first() is not None
+
+    def parked(self, features, service_name: str, limit: int) -> List[Job]:
+        """Parked jobs waiting on `service_name`, highest priority and oldest failure first."""
+        rank = case(PRIORITY_RANK, value=Job.priority, else_=len(PRIORITY_RANK))
+        return list(self.session.execute(
+            select(Job)
+            .where(Job.status == JobStatus.WAITING_RETRY, Job.next_retry_at.is_(None),
+                   self._at_service(features, service_name))
+            .order_by(rank, Job.updated_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).scalars())
+
+    def count_due_retries(self, features, service_name: str) -> int:
+        """Retries already due at `service_name` but not started yet."""
+        return self.session.execute(select(func.count()).select_from(Job).where(
+            Job.status == JobStatus.WAITING_RETRY, Job.next_retry_at <= time.time(),
+            self._at_service(features, service_name))).scalar()
+
+    def release_parked(self, jobs: List[Job], service_name: str):
+        """Queue parked jobs with fresh attempt/retry counters for their current step, in one commit."""
+        now = time.time()
+        for job in jobs:
+            step_key = f"step_{job.current_step_index}_{service_name}"
+            job.context.pop(f"{step_key}__attempts", None)
+            job.context.pop(f"{step_key}__retries", None)
+            flag_modified(job, "context")
+            job.next_retry_at = now
+            job.updated_at = now
+            self.session.add(job)
+            self.stage_step(job.id, job.priority)
+        self.session.commit()
+
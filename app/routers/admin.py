@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+from app.dependencies import get_session
+from app.repositories.job_repository import JobRepository
+from app.routers.config import require_internal_key
+from app.schemas.admin import BulkResumeRequest
+from app.services import config_service
+
+router = APIRouter(dependencies=[Depends(require_internal_key)])
+
+@router.post("/admin/jobs/resume")
+def bulk_resume(req: BulkResumeRequest, session: Session = Depends(get_session)):
+    """
+    Park the matching retryable failures for resumption. Nothing is queued here:
+    the ramp_resumed_jobs beat task releases them in priority order as the
+    service frees up, with fresh attempt counters.
+    """
+    snapshot = config_service.current()
+    if req.service not in snapshot.services:
+        raise HTTPException(400, "Unknown service")
+    repo = JobRepository(session)
+    args = (snapshot.features, req.service, req.error_codes, req.since, req.until)
+    if req.dry_run:
+        return {"service": req.service, "matched": repo.count_resumable(*args), "dry_run": True}
+    return {"service": req.service, "parked": repo.park_resumable(*args), "dry_run": False}
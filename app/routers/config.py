@@ -0,0 +1,39 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from app.config import INTERNAL_API_KEY
+from app.core.exceptions import ConfigVersionConflict
+from app.schemas.config import ConfigUpdate
+from app.services import config_service
+from app.services.config_service import ConfigService
+
+router = APIRouter()
+
+def require_internal_key(x_internal_key: Optional[str] = Header(None)):
+    if INTERNAL_API_KEY and x_internal_key != INTERNAL_API_KEY:
+        raise HTTPException(401, "Invalid internal key")
+
+@router.get("/config", dependencies=[Depends(require_internal_key)])
+def get_config():
+    snapshot = config_service.current()
+    return {
+        "stored": ConfigService().stored(),
+        "loaded_version": snapshot.version,  # in this API process
+        "services": dict(snapshot.services),
+        "features": dict(snapshot.features),
+    }
+
+@router.put("/config", dependencies=[Depends(require_internal_key)])
+def update_config(req: ConfigUpdate):
+    """Replaces all runtime overrides (send {} to go back to the deployed config)."""
+    overrides = {k: v for k, v in (("services", req.services), ("features", req.features)) if v}
+    try:
+        version = ConfigService().update(overrides, req.expected_version)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    except ConfigVersionConflict as e:
+        raise HTTPException(409, str(e))
+    return {"success": True, "version": version}
+
+@router.get("/config/history", dependencies=[Depends(require_internal_key)])
+def config_history(limit: int = 10):
+    return ConfigService().history(limit)
@@ -1,6 +1,10 @@
 from fastapi import APIRouter
-import requests
-from app.config import SERVICES
+from redis.exceptions import RedisError
+from app.services import config_service
+from app.services.circuit_breaker_service import CircuitBreakerService
+from app.services.health_service import HealthService
+from app.services.outbound_queue import STATS as WS_STATS
+from app.services.pubsub_hub import hub
 
 router = APIRouter()
 
@@ -8,14 +12,35 @@ router = APIRouter()
 def health():
     return {"ok": True}
 
+@router.get("/health/ws")
+def health_ws():
+    # this API process only
+    return {
+        "subscribers": hub.subscriber_count(),
+        "events_conflated": WS_STATS["conflated"],
+        "events_dropped": WS_STATS["dropped"],
+        "slow_disconnects": WS_STATS["slow_disconnects"],
+    }
+
 @router.get("/health/services")
 def health_services():
-    out = {}
-    for name, conf in SERVICES.items():
-        url = conf["base_url"].rstrip("/") + conf.get("health_path", "/health")
+    """Served from the prober's cache; probes once, concurrently, if it has nothing yet."""
+    health = HealthService()
+    try:
+        out = health.cached()
+    except RedisError:
+        out = {}
+    if set(out) != set(config_service.current().services):
+        out = health.probe_all()
+        try:
+            health.store(out)
+        except RedisError:
+            pass
+
+    breaker = CircuitBreakerService()
+    for name in out:
         try:
-            r = requests.get(url, timeout=(2, 2))
-            out[name] = {"ok": r.status_code == 200, "status_code": r.status_code}
-        except Exception as e:
-            out[name] = {"ok": False, "error": str(e)}
+            out[name]["circuit"] = breaker.state(name)
+        except RedisError:
+            out[name]["circuit"] = {"state": "UNKNOWN"}
     return out
@@ -1,49 +1,39 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.dependencies import get_session
 from app.schemas.jobs import StartJobRequest, JobCreateResponse
 from app.repositories.job_repository import JobRepository
-from app.config import FEATURES
-from worker.tasks import execute_job_step
+from app.models.enums import JobStatus, WebSocketEvent
+from app.services import config_service
+from app.services.cancellation_service import CancellationService
+from app.services.event_stream import sse_frames
+from app.services.pubsub_hub import hub
+from app.services.trace_service import TraceService
+from app.services.ws_service import WSService
 
 router = APIRouter()
 
 @router.post("/jobs", status_code=201)
 def start_job(req: StartJobRequest, session: Session = Depends(get_session)):
-    if req.feature_name not in FEATURES:
+    if req.feature_name not in config_service.current().features:
         raise HTTPException(400, "Unknown feature recipe")
     
     from app.services.priority_service import PriorityService
-    from app.config import QUEUE_HIGH, QUEUE_MEDIUM, QUEUE_LOW
     
     # 1. Fetch user priority from external API
     priority_service = PriorityService()
     priority = priority_service.get_user_priority(req.user_id)
     
-    # 2. Create job with priority
+    # 2. Create job with priority; its first step is queued through the outbox in the same commit
     job_id = str(uuid.uuid4())
     repo = JobRepository(session)
-    job = repo.create(job_id, req.feature_name, req.input_data)
-    
-    # Set priority fields
-    job.priority = priority
-    job.original_priority = priority
-    job.user_id = req.user_id
-    session.add(job)
-    session.commit()
-    
-    # 3. Determine target queue based on priority
-    queue_map = {
-        "high": QUEUE_HIGH,
-        "medium": QUEUE_MEDIUM,
-        "low": QUEUE_LOW
-    }
-    target_queue = queue_map[priority]
-    
-    # 4. Queue first step to priority queue
-    execute_job_step.apply_async(args=[job_id], queue=target_queue)
+    repo.stage_step(job_id, priority)
+    repo.create(job_id, req.feature_name, req.input_data, priority=priority, user_id=req.user_id)
 
     return {
         "success": True,
@@ -55,29 +45,22 @@ def start_job(req: StartJobRequest, session: Session = Depends(get_session)):
 
 @router.post("/jobs/{job_id}/resume")
 def resume_job(job_id: str, session: Session = Depends(get_session)):
-    from app.config import QUEUE_HIGH, QUEUE_MEDIUM, QUEUE_LOW
-    
     repo = JobRepository(session)
     job = repo.get(job_id)
     if not job:
         raise HTTPException(404, "Job not found")
 
+    recipe = config_service.current().features[job.feature_name]
+    finished = job.current_step_index >= len(recipe)
+    # a cancelled job would otherwise abort again as soon as its step starts
+    CancellationService().clear(job_id)
+    if not finished:
+        # Route to priority queue based on job's current priority, with the status change
+        repo.stage_step(job_id, job.priority)
     prev = repo.clear_failure(job)
-
-    recipe = FEATURES[job.feature_name]
-    if job.current_step_index >= len(recipe):
+    if finished:
         return {"success": True, "job_id": job_id, "previous_status": prev, "new_status": "COMPLETED", "resuming_from_step": None}
 
-    # Route to priority queue based on job's current priority
-    queue_map = {
-        "high": QUEUE_HIGH,
-        "medium": QUEUE_MEDIUM,
-        "low": QUEUE_LOW
-    }
-    target_queue = queue_map.get(job.priority, QUEUE_MEDIUM)
-    
-    execute_job_step.apply_async(args=[job_id], queue=target_queue)
-
     return {
         "success": True,
         "job_id": job_id,
@@ -85,3 +68,41 @@ def resume_job(job_id: str, session: Session = Depends(get_session)):
         "new_status": "RUNNING",
         "resuming_from_step": recipe[job.current_step_index]
     }
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, session: Session = Depends(get_session)):
+    repo = JobRepository(session)
+    job = repo.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    if job.status == JobStatus.COMPLETED:
+        raise HTTPException(409, "Job already completed")
+
+    prev = job.status
+    if prev != JobStatus.CANCELLED:
+        repo.cancel(job)
+    # revoke the queued step and signal a worker mid-step to abort and free its lease
+    CancellationService().request(job_id)
+    WSService().publish(job_id, {"type": WebSocketEvent.JOB_CANCELLED, "job_id": job_id,
+                                 "message": "Job cancelled"}, job=job)
+
+    return {"success": True, "job_id": job_id, "previous_status": prev, "new_status": JobStatus.CANCELLED}
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, last_event_id: Optional[str] = None,
+                     session: Session = Depends(get_session)):
+    job = await run_in_threadpool(JobRepository(session).get, job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+
+    # browsers' EventSource sends Last-Event-ID on reconnect; the query param covers other clients
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(sse_frames(hub, job_id, resume_from), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/jobs/{job_id}/trace")
+def job_trace(job_id: str, session: Session = Depends(get_session)):
+    if not JobRepository(session).get(job_id):
+        raise HTTPException(404, "Job not found")
+    tracer = TraceService()
+    return {"job_id": job_id, "sampled": tracer.sampled(job_id), "steps": tracer.get(job_id)}
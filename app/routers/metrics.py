@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Response
+from starlette.concurrency import run_in_threadpool
+from app.core.metrics import CONTENT_TYPE_LATEST, render_api_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    # gauges read Redis at scrape time
+    return Response(await run_in_threadpool(render_api_metrics), media_type=CONTENT_TYPE_LATEST)
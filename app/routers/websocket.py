@@ -1,22 +1,120 @@
-from fastapi import APIRouter, WebSocket
-import redis.asyncio as aioredis
-from app.config import REDIS_URL
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from fastapi import APIRouter, HTTPException, WebSocket
+from pydantic import ValidationError
+from app.config import WS_BATCH_WINDOW_MS, WS_BATCH_MAX_EVENTS
+from app.routers.config import require_internal_key
+from app.schemas.ws import SubscriptionCommand
+from app.services.event_stream import job_events
+from app.services.outbound_queue import OutboundQueue, record
+from app.services.pubsub_hub import hub
+from app.services.subscription_service import SubscriptionService
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
-r = aioredis.from_url(REDIS_URL, decode_responses=True)
+
+# close code for consumers that fell too far behind; they should reconnect and resume
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+
+async def _serve(websocket: WebSocket, sender: asyncio.Task, queue: OutboundQueue,
+                 on_text: Optional[Callable[[Optional[str]], Awaitable[dict]]] = None):
+    """Run until the client leaves, the sender dies or the outbound queue stalls."""
+    stalled = asyncio.create_task(queue.stalled.wait())
+    receiver = None
+    try:
+        while True:
+            # reading lets us notice a disconnect right away instead of on the next event
+            receiver = asyncio.create_task(websocket.receive())
+            done, _ = await asyncio.wait({receiver, sender, stalled}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver not in done:
+                break
+            msg = receiver.result()
+            receiver = None
+            if msg["type"] == "websocket.disconnect":
+                break
+            if on_text is not None:
+                await websocket.send_json(await on_text(msg.get("text")))
+    finally:
+        for task in (sender, stalled, receiver):
+            if task is not None:
+                task.cancel()
+        for task in (sender, receiver):
+            if task is not None:
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        if queue.conflated or queue.dropped:
+            logger.info("websocket closed: %d events conflated, %d dropped", queue.conflated, queue.dropped)
+        code = 1000
+        if queue.stalled.is_set():
+            record("slow_disconnects")
+            code = WS_CLOSE_TRY_AGAIN_LATER
+        try:
+            await websocket.close(code=code)
+        except RuntimeError:
+            pass  # already closed by the client
+
+
+async def _forward(websocket: WebSocket, job_id: str, last_event_id: Optional[str], queue: OutboundQueue):
+    async for data in job_events(hub, job_id, last_event_id, queue):
+        await websocket.send_text(data)
+
 
 @router.websocket("/ws/{job_id}")
-async def ws(job_id: str, websocket: WebSocket):
+async def ws(job_id: str, websocket: WebSocket, last_event_id: Optional[str] = None):
     await websocket.accept()
-    pubsub = r.pubsub()
-    await pubsub.subscribe(f"ws:{job_id}")
     await websocket.send_json({"type": "WS_CONNECTED", "job_id": job_id})
 
+    # replays everything after last_event_id (the whole retained log if absent), then goes live
+    queue = OutboundQueue()
+    await _serve(websocket, asyncio.create_task(_forward(websocket, job_id, last_event_id, queue)), queue)
+
+
+async def _forward_batches(websocket: WebSocket, subs: SubscriptionService):
+    while True:
+        batch = [await subs.next_event()]
+        # let a burst accumulate so it goes out as one frame
+        await asyncio.sleep(WS_BATCH_WINDOW_MS / 1000.0)
+        batch.extend(subs.drain(WS_BATCH_MAX_EVENTS - 1))
+        await websocket.send_text('{"type": "EVENTS", "events": [' + ", ".join(batch) + "]}")
+
+
+async def _handle_command(subs: SubscriptionService, text: Optional[str]) -> dict:
+    try:
+        cmd = SubscriptionCommand.model_validate_json(text or "")
+        if cmd.action == "subscribe":
+            sub_id = await subs.subscribe(cmd.job_ids, cmd.user_id, cmd.feature_name, cmd.types)
+            return {"type": "SUBSCRIBED", "subscription_id": sub_id}
+        if cmd.subscription_id is None and not cmd.job_ids:
+            raise ValueError("unsubscribe needs subscription_id or job_ids")
+        removed = await subs.unsubscribe(cmd.subscription_id, cmd.job_ids)
+        return {"type": "UNSUBSCRIBED", "subscription_ids": removed, "job_ids": cmd.job_ids}
+    except ValidationError as e:
+        return {"type": "ERROR", "message": "Invalid command", "details": e.errors(include_url=False)}
+    except ValueError as e:
+        return {"type": "ERROR", "message": str(e)}
+
+
+@router.websocket("/ws")
+async def ws_multi(websocket: WebSocket):
+    """
+    Many jobs over one socket: subscribe/unsubscribe by job ids or by user, feature and event type.
+    Filters without job ids span every job and need X-Internal-Key.
+    """
+    try:
+        require_internal_key(websocket.headers.get("x-internal-key"))
+        allow_filters = True
+    except HTTPException:
+        allow_filters = False
+    await websocket.accept()
+    subs = SubscriptionService(hub, allow_filters=allow_filters)
+    await websocket.send_json({"type": "WS_CONNECTED"})
+
     try:
-        async for msg in pubsub.listen():
-            if msg and msg.get("type") == "message":
-                await websocket.send_text(msg["data"])
+        await _serve(websocket, asyncio.create_task(_forward_batches(websocket, subs)), subs.queue,
+                     lambda text: _handle_command(subs, text))
     finally:
-        await pubsub.unsubscribe(f"ws:{job_id}")
-        await pubsub.close()
-        await websocket.close()
+        await subs.close()
@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+class BulkResumeRequest(BaseModel):
+    # jobs whose failed step calls this service
+    service: str
+    # only failures with these codes (any retryable failure when empty)
+    error_codes: List[str] = Field(default_factory=lambda: ["RESOURCE_EXHAUSTED", "SERVICE_UNREACHABLE"])
+    # failure time window (epoch seconds, on updated_at)
+    since: Optional[float] = None
+    until: Optional[float] = None
+    # only count the matching jobs
+    dry_run: bool = False
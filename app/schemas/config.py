@@ -0,0 +1,10 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+class ConfigUpdate(BaseModel):
+    # per service, only the keys to change (limit, timeout, lease_ttl, max_step_attempts, ...)
+    services: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    # recipes to add or replace
+    features: Dict[str, List[str]] = Field(default_factory=dict)
+    # reject the update if someone else changed the config since this version
+    expected_version: Optional[int] = None
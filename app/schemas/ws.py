@@ -0,0 +1,11 @@
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from app.models.enums import WebSocketEvent
+
+class SubscriptionCommand(BaseModel):
+    action: Literal["subscribe", "unsubscribe"]
+    job_ids: List[str] = Field(default_factory=list)
+    user_id: Optional[str] = None
+    feature_name: Optional[str] = None
+    types: List[WebSocketEvent] = Field(default_factory=list)
+    subscription_id: Optional[str] = None  # unsubscribe only
@@ -0,0 +1,132 @@
+import json
+import time
+import uuid
+from typing import Any, Dict, Optional
+from app.config import HTTP_CONNECT_TIMEOUT_S, REPLICA_EJECT_CODES, REPLICA_EJECT_SECONDS
+from app.core.redis_clients import get_redis
+from app.services.limiter_service import LimiterService
+from app.services.http_service_client import HTTPServiceClient, ServiceCallError, service_replicas
+from app.services.circuit_breaker_service import CircuitBreakerService
+
+r = get_redis()
+
+# results are only read by the waiting worker; keep them briefly in case it is slow to pick up
+RESULT_TTL_S = 120
+
+
+class BatchingService:
+    """
+    Micro-batching dispatch for services declaring `batching` in SERVICES.
+
+    Each step pushes its envelope onto `batch:{service}:pending` and waits on its
+    own result list. Any waiting worker may become the batch leader: it lets the
+    queue fill for up to `max_wait_ms` (or until `max_batch_size`), pops the
+    batch, sends it with a single lease and hands each item its own result.
+    """
+
+    def __init__(self, limiter: LimiterService, client: HTTPServiceClient,
+                 breaker: Optional[CircuitBreakerService] = None):
+        self.limiter = limiter
+        self.client = client
+        self.breaker = breaker
+
+    def submit(self, service_name: str, envelope: Dict[str, Any], conf: dict) -> Dict[str, Any]:
+        batching = conf["batching"]
+        max_wait_s = batching["max_wait_ms"] / 1000.0
+        queue_key = f"batch:{service_name}:pending"
+
+        item_id = str(uuid.uuid4())
+        item = json.dumps({"id": item_id, "envelope": envelope})
+        result_key = f"batch:{service_name}:result:{item_id}"
+        r.rpush(queue_key, item)
+
+        # picking the item up stands in for the lease wait of the unbatched path
+        pick_deadline = time.time() + max_wait_s + conf["timeout"]
+        while True:
+            if r.lpos(queue_key, item) is None:
+                # taken by a batch leader (possibly us): it still has to get a lease and call
+                res = r.blpop(result_key, timeout=2 * conf["timeout"] + HTTP_CONNECT_TIMEOUT_S)
+                if res:
+                    return self._unpack(res[1])
+                raise ServiceCallError("SERVICE_TIMEOUT", "No result for batched call", True)
+
+            if self._try_lead(service_name, max_wait_s):
+                self._run_batch(service_name, conf)
+                continue
+
+            res = r.blpop(result_key, timeout=max_wait_s)
+            if res:
+                return self._unpack(res[1])
+
+            if time.time() > pick_deadline:
+                if r.lrem(queue_key, 1, item):
+                    raise ServiceCallError("RESOURCE_EXHAUSTED", "Timed out waiting for a batch slot", True)
+                # popped just now; the leader will answer shortly
+                continue
+
+    def _unpack(self, raw: str) -> Dict[str, Any]:
+        res = json.loads(raw)
+        if res["status"] == "SUCCESS":
+            return res["out"]
+        err = res["error"]
+        raise ServiceCallError(err["code"], err["message"], err["retryable"], err.get("details"),
+                               err.get("retry_after"))
+
+    def _try_lead(self, service_name: str, max_wait_s: float) -> bool:
+        # held only while the batch forms; the call itself runs without it
+        ttl_ms = int(max_wait_s * 1000) + 1000
+        return bool(r.set(f"batch:{service_name}:leader", "1", nx=True, px=ttl_ms))
+
+    def _run_batch(self, service_name: str, conf: dict):
+        batching = conf["batching"]
+        queue_key = f"batch:{service_name}:pending"
+        max_size = batching["max_batch_size"]
+
+        fill_deadline = time.time() + batching["max_wait_ms"] / 1000.0
+        while r.llen(queue_key) < max_size and time.time() < fill_deadline:
+            time.sleep(0.005)
+        raw_items = r.lpop(queue_key, max_size) or []
+        r.delete(f"batch:{service_name}:leader")
+        if not raw_items:
+            return
+
+        items = [json.loads(raw) for raw in raw_items]
+        envelopes = [i["envelope"] for i in items]
+
+        replicas = service_replicas(conf)
+        picked = self.limiter.acquire_replica(service_name, replicas, conf["lease_ttl"], conf["timeout"])
+        if not picked:
+            err = ServiceCallError("RESOURCE_EXHAUSTED", f"Semaphore timeout after {conf['timeout']}s", True)
+            return self._deliver(service_name, items, [err] * len(items))
+
+        replica, slot, lease = picked
+        try:
+            try:
+                results = self.client.call_batch(service_name, envelopes, conf["timeout"], replica=replica)
+                if self.breaker:
+                    self.breaker.record(service_name)
+            except ServiceCallError as e:
+                if self.breaker:
+                    self.breaker.record(service_name, e.code)
+                if len(replicas) > 1 and e.code in REPLICA_EJECT_CODES:
+                    self.limiter.eject(slot, REPLICA_EJECT_SECONDS)
+                results = [e] * len(items)
+            extra = {"replica": replicas[replica]["url"]} if len(replicas) > 1 else {}
+            self._deliver(service_name, items, results, extra)
+        finally:
+            self.limiter.release(slot, lease)
+
+    def _deliver(self, service_name: str, items: list, results: list, extra_metrics: Optional[dict] = None):
+        pipe = r.pipeline()
+        for item, res in zip(items, results):
+            if isinstance(res, ServiceCallError):
+                msg = {"status": "FAILED", "error": {"code": res.code, "message": str(res),
+                                                     "retryable": res.retryable, "details": res.details,
+                                                     "retry_after": res.retry_after}}
+            else:
+                res["metrics"] = {**res.get("metrics", {}), **(extra_metrics or {}), "batch_size": len(items)}
+                msg = {"status": "SUCCESS", "out": res}
+            result_key = f"batch:{service_name}:result:{item['id']}"
+            pipe.rpush(result_key, json.dumps(msg))
+            pipe.expire(result_key, RESULT_TTL_S)
+        pipe.execute()
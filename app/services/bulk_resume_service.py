@@ -0,0 +1,70 @@
+from typing import Dict, Optional
+from app.config import BULK_RESUME_INTERVAL_S, BULK_RESUME_RAMP_START, BULK_RESUME_MAX_PER_TICK
+from app.core.redis_clients import get_redis
+from app.models.enums import WebSocketEvent
+from app.repositories.job_repository import JobRepository
+from app.services import config_service
+from app.services.circuit_breaker_service import CircuitBreakerService, CLOSED
+from app.services.http_service_client import service_replicas
+from app.services.limiter_service import LimiterService
+from app.services.ws_service import WSService
+
+r = get_redis()
+
+# a ramp not advanced for this long starts over
+RAMP_TTL_S = int(BULK_RESUME_INTERVAL_S * 6)
+
+
+class BulkResumeService:
+    """
+    Releases jobs parked by a bulk resume without knocking the recovering
+    backend over again.
+
+    Each tick, per service, at most `allowance` jobs are released: the
+    allowance starts at BULK_RESUME_RAMP_START and doubles after every tick
+    that released jobs while the service's circuit breaker stays closed (it
+    starts over once the breaker opens), and never exceeds the leases free
+    right now minus retries already due there. Higher priorities go first.
+    """
+
+    def __init__(self, limiter: Optional[LimiterService] = None, breaker: Optional[CircuitBreakerService] = None):
+        self.limiter = limiter or LimiterService()
+        self.breaker = breaker or CircuitBreakerService()
+
+    def _key(self, service_name: str) -> str:
+        return f"resume:ramp:{service_name}"
+
+    def allowance(self, service_name: str) -> int:
+        """Jobs this service may get this tick (0 while its breaker is not closed)."""
+        if self.breaker.state(service_name)["state"] != CLOSED:
+            r.delete(self._key(service_name))
+            return 0
+        return int(r.get(self._key(service_name)) or BULK_RESUME_RAMP_START)
+
+    def _advance(self, service_name: str, allowed: int):
+        r.set(self._key(service_name), min(BULK_RESUME_MAX_PER_TICK, allowed * 2), ex=RAMP_TTL_S)
+
+    def ramp(self, repo: JobRepository, ws: WSService) -> Dict[str, int]:
+        """One tick: release parked jobs per service; returns how many were released for each."""
+        if not repo.has_parked():
+            return {}
+        snapshot = config_service.current()
+        released = {}
+        for service_name, conf in snapshot.services.items():
+            budget = self.limiter.free_capacity(service_name, service_replicas(conf))
+            budget -= repo.count_due_retries(snapshot.features, service_name)
+            allowed = self.allowance(service_name) if budget > 0 else 0
+            if not allowed:
+                continue
+            jobs = repo.parked(snapshot.features, service_name, min(budget, allowed))
+            if not jobs:
+                continue
+            for job in jobs:
+                ws.publish(job.id, {"type": WebSocketEvent.RETRY_SCHEDULED, "job_id": job.id,
+                                    "step_name": service_name, "retry_in_s": 0,
+                                    "message": f"Resuming now that {service_name} has capacity"}, job=job)
+            ws.flush()  # ahead of the steps' own events once they are queued
+            repo.release_parked(jobs, service_name)
+            self._advance(service_name, allowed)
+            released[service_name] = len(jobs)
+        return released
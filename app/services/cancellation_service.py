@@ -0,0 +1,35 @@
+from typing import Optional
+from app.config import CANCEL_KEY_TTL_S
+from app.core.redis_clients import get_redis
+from app.celery_app import celery_app
+
+r = get_redis()
+
+
+class CancellationService:
+    """
+    Cross-process job cancellation.
+
+    The id of the last Celery task queued for a job is kept in `job:task:{job_id}`
+    so a cancel can revoke it, and `cancel:{job_id}` tells a worker already
+    running the job to abort its lease wait or HTTP call.
+    """
+
+    def remember_task(self, job_id: str, task_id: str):
+        r.set(f"job:task:{job_id}", task_id, ex=CANCEL_KEY_TTL_S)
+
+    def task_id(self, job_id: str) -> Optional[str]:
+        return r.get(f"job:task:{job_id}")
+
+    def request(self, job_id: str):
+        r.set(f"cancel:{job_id}", "1", ex=CANCEL_KEY_TTL_S)
+        task_id = self.task_id(job_id)
+        if task_id:
+            celery_app.control.revoke(task_id)
+
+    def clear(self, job_id: str):
+        """Forget a past cancel so a resumed job isn't aborted by it."""
+        r.delete(f"cancel:{job_id}", f"job:task:{job_id}")
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return bool(r.exists(f"cancel:{job_id}"))
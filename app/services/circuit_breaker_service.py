@@ -0,0 +1,113 @@
+import time
+import redis
+from typing import Tuple
+from app.config import (CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_OPEN_SECONDS,
+                        CIRCUIT_BREAKER_HALF_OPEN_PROBES, CIRCUIT_BREAKER_CODES)
+from app.core.redis_clients import get_redis
+
+r = get_redis()
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreakerService:
+    """
+    Per-service circuit breaker shared by all workers through the `cb:{service}` hash.
+
+    CLOSED counts consecutive breaker failures and opens at the threshold. OPEN
+    denies calls until the cool-down ends, then HALF_OPEN lets a limited number
+    of probe calls through: a probe success closes the breaker, a failure
+    re-opens it.
+    """
+
+    def allow(self, service_name: str, probe_timeout: int) -> Tuple[str, float]:
+        """Returns ("ALLOW" | "PROBE" | "DENY", seconds until a call may be allowed)."""
+        lua = """
+        local key = KEYS[1]
+        local now = tonumber(ARGV[1])
+        local open_s = tonumber(ARGV[2])
+        local max_probes = tonumber(ARGV[3])
+        local probe_timeout = tonumber(ARGV[4])
+
+        local state = redis.call("HGET", key, "state") or "CLOSED"
+        if state == "CLOSED" then
+            return {"ALLOW", "0"}
+        end
+        if state == "OPEN" then
+            local reopen_at = tonumber(redis.call("HGET", key, "opened_at") or "0") + open_s
+            if now < reopen_at then
+                return {"DENY", tostring(reopen_at - now)}
+            end
+            redis.call("HSET", key, "state", "HALF_OPEN", "probes", 0)
+        end
+
+        local probes = tonumber(redis.call("HGET", key, "probes") or "0")
+        local started = tonumber(redis.call("HGET", key, "probe_started_at") or "0")
+        if now >= started + probe_timeout then
+            -- probes that never reported back (worker died) no longer count
+            probes = 0
+        end
+        if probes >= max_probes then
+            return {"DENY", tostring(started + probe_timeout - now)}
+        end
+        redis.call("HSET", key, "probes", probes + 1, "probe_started_at", now)
+        return {"PROBE", "0"}
+        """
+        decision, wait_s = r.eval(lua, 1, f"cb:{service_name}", str(time.time()),
+                                  str(CIRCUIT_BREAKER_OPEN_SECONDS), str(CIRCUIT_BREAKER_HALF_OPEN_PROBES),
+                                  str(probe_timeout))
+        return decision, float(wait_s)
+
+    def is_failure(self, code: str) -> bool:
+        return code in CIRCUIT_BREAKER_CODES
+
+    def record_success(self, service_name: str):
+        lua = """
+        local key = KEYS[1]
+        local state = redis.call("HGET", key, "state") or "CLOSED"
+        local failures = tonumber(redis.call("HGET", key, "failures") or "0")
+        if state ~= "CLOSED" or failures > 0 then
+            redis.call("HSET", key, "state", "CLOSED", "failures", 0, "probes", 0)
+        end
+        return 1
+        """
+        r.eval(lua, 1, f"cb:{service_name}")
+
+    def record_failure(self, service_name: str):
+        lua = """
+        local key = KEYS[1]
+        local now = ARGV[1]
+        local threshold = tonumber(ARGV[2])
+        local state = redis.call("HGET", key, "state") or "CLOSED"
+        if state == "HALF_OPEN" then
+            redis.call("HSET", key, "state", "OPEN", "opened_at", now, "probes", 0)
+            return 1
+        end
+        if state == "OPEN" then
+            return 1
+        end
+        local failures = redis.call("HINCRBY", key, "failures", 1)
+        if failures >= threshold then
+            redis.call("HSET", key, "state", "OPEN", "opened_at", now, "probes", 0)
+        end
+        return 1
+        """
+        r.eval(lua, 1, f"cb:{service_name}", str(time.time()), str(CIRCUIT_BREAKER_FAILURE_THRESHOLD))
+
+    def record(self, service_name: str, code: str = None):
+        """Record a call outcome; any non-breaker error still proves the service is reachable."""
+        if code is not None and self.is_failure(code):
+            self.record_failure(service_name)
+        else:
+            self.record_success(service_name)
+
+    def state(self, service_name: str) -> dict:
+        h = r.hgetall(f"cb:{service_name}")
+        state = h.get("state", CLOSED)
+        out = {"state": state, "failures": int(h.get("failures", 0))}
+        if state == OPEN:
+            reopen_at = float(h.get("opened_at", 0)) + CIRCUIT_BREAKER_OPEN_SECONDS
+            out["retry_in_s"] = max(0, round(reopen_at - time.time(), 1))
+        return out
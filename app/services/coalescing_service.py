@@ -0,0 +1,114 @@
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict, Optional
+from app.config import COALESCE_RESULT_TTL_S
+from app.core.redis_clients import get_redis
+
+r = get_redis()
+
+
+class CoalescingService:
+    """
+    Single-flight coalescing of identical service calls across workers.
+
+    The first job to claim an input hash becomes the leader and makes the call;
+    later jobs with the same hash subscribe to `coalesce:{service}:{hash}` and
+    reuse the leader's output (or error) instead of taking a lease.
+    """
+
+    def input_hash(self, service_name: str, payload: Dict[str, Any]) -> str:
+        # Only the inputs a service actually sees: bookkeeping such as attempt
+        # counters and per-step timestamps/metrics differ between jobs.
+        context = payload.get("context", {})
+        steps = {
+            k: v.get("data") for k, v in context.items()
+            if k.startswith("step_") and isinstance(v, dict)
+        }
+        canonical = json.dumps(
+            {
+                "service": service_name,
+                "params": payload.get("params", {}),
+                "initial_input": context.get("initial_input"),
+                "steps": steps,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _keys(self, service_name: str, digest: str):
+        base = f"coalesce:{service_name}:{digest}"
+        return f"{base}:lock", f"{base}:result", base
+
+    def try_lead(self, service_name: str, digest: str, job_id: str, ttl: int) -> bool:
+        lock_key, result_key, _ = self._keys(service_name, digest)
+        if not r.set(lock_key, job_id, nx=True, ex=ttl):
+            return False
+        # a previous flight's result must not be served to this flight's followers
+        r.delete(result_key)
+        return True
+
+    def _finish(self, service_name: str, digest: str, message: dict):
+        lock_key, result_key, channel = self._keys(service_name, digest)
+        data = json.dumps(message)
+        pipe = r.pipeline()
+        # result key covers followers that subscribe just after the publish
+        pipe.set(result_key, data, ex=COALESCE_RESULT_TTL_S)
+        pipe.publish(channel, data)
+        pipe.delete(lock_key)
+        pipe.execute()
+
+    def publish_result(self, service_name: str, digest: str, job_id: str, out: Dict[str, Any]):
+        self._finish(service_name, digest, {"status": "SUCCESS", "leader": job_id, "out": out})
+
+    def publish_error(self, service_name: str, digest: str, job_id: str, code: str,
+                      message: str, retryable: bool, details: Optional[dict] = None,
+                      retry_after: Optional[float] = None):
+        self._finish(service_name, digest, {
+            "status": "FAILED", "leader": job_id,
+            "error": {"code": code, "message": message, "retryable": retryable, "details": details,
+                      "retry_after": retry_after},
+        })
+
+    def abandon(self, service_name: str, digest: str, job_id: str):
+        """Leader gave up without a result (e.g. DB outage); followers fall back to their own call."""
+        lock_key, _, _ = self._keys(service_name, digest)
+        if r.get(lock_key) != job_id:
+            return  # outcome already published
+        self._finish(service_name, digest, {"status": "ABANDONED", "leader": job_id})
+
+    def wait(self, service_name: str, digest: str, timeout: float,
+             cancel_check: Optional[Callable[[], bool]] = None) -> Optional[dict]:
+        """
+        Wait for the leader's outcome.
+
+        Returns the SUCCESS/FAILED message, or None when the caller should fall
+        back to making the call itself (timeout, leader vanished or abandoned)
+        or stop because `cancel_check` reports the job cancelled.
+        """
+        lock_key, result_key, channel = self._keys(service_name, digest)
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        try:
+            deadline = time.time() + timeout
+            raw = r.get(result_key)
+            while raw is None:
+                msg = pubsub.get_message(timeout=1.0)
+                if msg and msg.get("type") == "message":
+                    raw = msg["data"]
+                    break
+                if not r.exists(lock_key):
+                    # either the leader just finished or it crashed (lock expired)
+                    raw = r.get(result_key)
+                    if raw is None:
+                        return None
+                    break
+                if time.time() > deadline or (cancel_check and cancel_check()):
+                    return None
+            message = json.loads(raw)
+            return message if message.get("status") in ("SUCCESS", "FAILED") else None
+        finally:
+            pubsub.unsubscribe(channel)
+            pubsub.close()
@@ -0,0 +1,199 @@
+import copy
+import json
+import logging
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
+import redis
+from app.config import SERVICES, FEATURES, CONFIG_REFRESH_S
+from app.core.redis_clients import get_redis
+from app.core.exceptions import ConfigVersionConflict
+
+logger = logging.getLogger(__name__)
+r = get_redis()
+
+CONFIG_KEY = "config:runtime"
+HISTORY_KEY = "config:history"
+CHANGED_CHANNEL = "config:changed"
+HISTORY_LEN = 50
+
+# service settings that may be changed at runtime, with their types
+TUNABLE = {"limit": int, "timeout": int, "lease_ttl": int, "max_step_attempts": int,
+           "coalesce": bool, "stream": bool, "base_url": (str, list), "batching": dict}
+
+# compare-and-set on the version, keep a short history, tell every process
+UPDATE_LUA = """
+local v = tonumber(redis.call("HGET", KEYS[1], "version") or "0")
+if ARGV[1] ~= "" and tonumber(ARGV[1]) ~= v then
+    return -1 - v
+end
+v = v + 1
+redis.call("HSET", KEYS[1], "version", v, "overrides", ARGV[2], "updated_at", ARGV[3])
+redis.call("LPUSH", KEYS[2], cjson.encode({version = v, overrides = ARGV[2], updated_at = ARGV[3]}))
+redis.call("LTRIM", KEYS[2], 0, tonumber(ARGV[4]) - 1)
+redis.call("PUBLISH", ARGV[5], v)
+return v
+"""
+
+
+class RuntimeConfig(NamedTuple):
+    version: int
+    services: Mapping[str, Dict[str, Any]]
+    features: Mapping[str, List[str]]
+
+
+# version 0 is app.config as deployed (a live view, so tests can patch SERVICES/FEATURES)
+_BASELINE = RuntimeConfig(0, MappingProxyType(SERVICES), MappingProxyType(FEATURES))
+_current = _BASELINE
+
+
+def current() -> RuntimeConfig:
+    """
+    The config snapshot in effect in this process. No I/O: the watcher swaps
+    in a new snapshot when the stored version changes, so callers that read a
+    snapshot once per step see one consistent version.
+    """
+    return _current
+
+
+def _positive_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def _valid_nested(key: str, value) -> bool:
+    """Shape of the dict/list settings, which the step path reads without checking."""
+    if key == "batching":
+        return (set(value) == {"max_batch_size", "max_wait_ms", "execute_path"}
+                and _positive_int(value["max_batch_size"]) and _positive_int(value["max_wait_ms"])
+                and isinstance(value["execute_path"], str))
+    if key == "base_url" and isinstance(value, list):
+        # replicas: plain URLs (sharing the service limit) or {"url", "limit"}
+        return bool(value) and all(
+            isinstance(entry, str) or (isinstance(entry, dict) and set(entry) == {"url", "limit"}
+                                       and isinstance(entry["url"], str) and _positive_int(entry["limit"]))
+            for entry in value)
+    return True
+
+
+def build(version: int, overrides: dict) -> RuntimeConfig:
+    """Apply overrides on top of app.config; raises ValueError if they are invalid."""
+    if not overrides:
+        return RuntimeConfig(version, _BASELINE.services, _BASELINE.features)
+    services = copy.deepcopy(dict(SERVICES))
+    for name, changes in (overrides.get("services") or {}).items():
+        if name not in services:
+            raise ValueError(f"unknown service {name!r}")
+        for key, value in changes.items():
+            if key not in TUNABLE:
+                raise ValueError(f"{name}.{key} cannot be changed at runtime")
+            if (not isinstance(value, TUNABLE[key]) or (TUNABLE[key] is int and not _positive_int(value))
+                    or not _valid_nested(key, value)):
+                raise ValueError(f"invalid value for {name}.{key}: {value!r}")
+        services[name].update(changes)
+        if services[name].get("batching") and services[name].get("stream"):
+            # a batch can't relay one job's streamed output, so batching would be ignored
+            raise ValueError(f"{name} cannot both stream and batch")
+
+    features = copy.deepcopy(dict(FEATURES))
+    for name, steps in (overrides.get("features") or {}).items():
+        if not isinstance(steps, list):
+            raise ValueError(f"recipe {name!r} must be a list of services")
+        unknown = [s for s in steps if s not in services]
+        if not steps or unknown:
+            raise ValueError(f"invalid recipe {name!r}: unknown steps {unknown}" if unknown
+                             else f"recipe {name!r} is empty")
+        features[name] = list(steps)
+    return RuntimeConfig(version, MappingProxyType(services), MappingProxyType(features))
+
+
+class ConfigService:
+    """
+    Versioned runtime overrides of SERVICES/FEATURES, stored in Redis.
+
+    `update()` replaces the whole override document and bumps the version;
+    every API and worker process picks it up through `ConfigWatcher`.
+    """
+
+    def stored(self) -> dict:
+        raw = r.hgetall(CONFIG_KEY)
+        return {"version": int(raw.get("version", 0)),
+                "overrides": json.loads(raw.get("overrides") or "{}"),
+                "updated_at": float(raw["updated_at"]) if raw.get("updated_at") else None}
+
+    def update(self, overrides: dict, expected_version: Optional[int] = None) -> int:
+        build(0, overrides)  # validate before anyone can load it
+        v = int(r.eval(UPDATE_LUA, 2, CONFIG_KEY, HISTORY_KEY,
+                       "" if expected_version is None else str(expected_version),
+                       json.dumps(overrides, sort_keys=True), str(time.time()), str(HISTORY_LEN),
+                       CHANGED_CHANNEL))
+        if v < 0:
+            raise ConfigVersionConflict(f"config is at version {-1 - v}, not {expected_version}")
+        refresh()  # this process needn't wait for the notification
+        return v
+
+    def history(self, limit: int = 10) -> List[dict]:
+        out = []
+        for raw in r.lrange(HISTORY_KEY, 0, limit - 1):
+            entry = json.loads(raw)
+            out.append({**entry, "overrides": json.loads(entry["overrides"])})
+        return out
+
+
+def refresh() -> RuntimeConfig:
+    """Load the stored config if its version differs from this process's snapshot."""
+    global _current
+    version, raw = r.hmget(CONFIG_KEY, "version", "overrides")
+    version = int(version or 0)
+    if version == _current.version:
+        return _current
+    try:
+        snapshot = build(version, json.loads(raw or "{}"))
+    except ValueError:
+        logger.exception("ignoring invalid runtime config version %s", version)
+        return _current
+    _current = snapshot
+    logger.info("runtime config version %s loaded", version)
+    return snapshot
+
+
+class ConfigWatcher(threading.Thread):
+    """
+    Keeps this process's snapshot current: reloads on change notifications,
+    and every CONFIG_REFRESH_S in case one was missed while disconnected.
+    """
+
+    def __init__(self, interval_s: float = CONFIG_REFRESH_S):
+        super().__init__(name="config-watcher", daemon=True)
+        self.interval_s = interval_s
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.is_set():
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(CHANGED_CHANNEL)
+                refresh()  # after subscribing, so no change falls in between
+                while not self._stopping.is_set():
+                    pubsub.get_message(timeout=self.interval_s)
+                    refresh()
+            except redis.RedisError:
+                logger.warning("config watcher lost Redis; retrying", exc_info=True)
+                self._stopping.wait(self.interval_s)
+            finally:
+                pubsub.close()
+
+    def stop(self):
+        self._stopping.set()
+
+
+_watcher: Optional[ConfigWatcher] = None
+
+
+def start_watcher() -> ConfigWatcher:
+    """Start the watcher for this process (once; call after forking)."""
+    global _watcher
+    if _watcher is None or not _watcher.is_alive():
+        _watcher = ConfigWatcher()
+        _watcher.start()
+    return _watcher
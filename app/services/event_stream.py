@@ -0,0 +1,100 @@
+import asyncio
+import json
+from typing import AsyncIterator, Optional, Tuple
+from redis.exceptions import ResponseError
+from app.config import SSE_KEEPALIVE_S
+from app.services.outbound_queue import OutboundQueue, record
+from app.services.pubsub_hub import PubSubHub
+from app.services.ws_service import is_terminal
+
+
+def _id_tuple(event_id: str) -> Tuple[int, int]:
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _with_event_id(data: str, event_id: str) -> str:
+    event = json.loads(data)
+    event["event_id"] = event_id
+    return json.dumps(event)
+
+
+async def job_events(hub: PubSubHub, job_id: str, last_event_id: Optional[str] = None,
+                     queue: Optional[OutboundQueue] = None) -> AsyncIterator[str]:
+    """
+    Yield a job's events as JSON strings, each carrying its `event_id`.
+
+    Subscribes for live events first (into `queue` if given), then replays the
+    job's stream after `last_event_id` (everything still retained when None),
+    then follows live events, skipping any already replayed.
+    """
+    channel = f"ws:{job_id}"
+    queue = await hub.subscribe(channel, queue)
+    try:
+        last = None
+        if last_event_id:
+            try:
+                last = _id_tuple(last_event_id)
+            except ValueError:
+                last_event_id = None
+
+        start = f"({last_event_id}" if last_event_id else "-"
+        try:
+            entries = await hub.redis.xrange(f"events:{job_id}", min=start, max="+")
+        except ResponseError:
+            entries = []
+        for event_id, fields in entries:
+            last = _id_tuple(event_id)
+            yield _with_event_id(fields["data"], event_id)
+
+        while True:
+            data = await queue.get()
+            event_id = json.loads(data).get("event_id")
+            if event_id and last and _id_tuple(event_id) <= last:
+                continue
+            if event_id:
+                last = _id_tuple(event_id)
+            yield data
+    finally:
+        await hub.unsubscribe(channel, queue)
+
+
+async def sse_frames(hub: PubSubHub, job_id: str, last_event_id: Optional[str] = None,
+                     keepalive_s: float = SSE_KEEPALIVE_S) -> AsyncIterator[str]:
+    """
+    Format `job_events` as Server-Sent Events. The stream ends after a terminal
+    event, or when the client falls too far behind (EventSource reconnects
+    with Last-Event-ID and catches up from the log).
+    """
+    queue = OutboundQueue()
+    events = job_events(hub, job_id, last_event_id, queue)
+    stalled = asyncio.ensure_future(queue.stalled.wait())
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(events.__anext__())
+            done, _ = await asyncio.wait({pending, stalled}, timeout=keepalive_s,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if stalled in done:
+                record("slow_disconnects")
+                return
+            if not done:
+                # comment frame keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            data = pending.result()
+            pending = None
+            event = json.loads(data)
+            yield f"id: {event['event_id']}\nevent: {event.get('type', 'message')}\ndata: {data}\n\n"
+            if is_terminal(event):
+                return
+    finally:
+        stalled.cancel()
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        await events.aclose()
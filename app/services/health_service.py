@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import redis
+import requests
+from app.config import (HEALTH_PROBE_INTERVAL_S, HEALTH_PROBE_TIMEOUT_S,
+                        HEALTH_STALE_AFTER_S)
+from app.core.redis_clients import get_redis
+from app.services import config_service
+from app.services.http_service_client import service_replicas
+from app.services.limiter_service import LimiterService
+
+logger = logging.getLogger(__name__)
+r = get_redis()
+
+HEALTH_KEY = "health:services"
+PROBER_LOCK_KEY = "health:prober"
+
+# take or keep the prober lock; only the holder probes
+LEAD_LUA = """
+local holder = redis.call("GET", KEYS[1])
+if holder == false or holder == ARGV[1] then
+    redis.call("SET", KEYS[1], ARGV[1], "PX", ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class HealthService:
+    """
+    Service health, probed in the background and cached in Redis.
+
+    Every replica of every service is probed concurrently; results (with
+    latency) live in the `health:services` hash, one JSON field per service.
+    Entries older than HEALTH_STALE_AFTER_S count as unknown, never as down.
+    """
+
+    def __init__(self, limiter: Optional[LimiterService] = None):
+        self.limiter = limiter
+
+    def probe_replica(self, url: str, health_path: str) -> dict:
+        t0 = time.time()
+        try:
+            resp = requests.get(url.rstrip("/") + health_path,
+                                timeout=(HEALTH_PROBE_TIMEOUT_S, HEALTH_PROBE_TIMEOUT_S))
+            out = {"url": url, "ok": resp.status_code == 200, "status_code": resp.status_code}
+        except Exception as e:
+            out = {"url": url, "ok": False, "error": str(e)}
+        out["latency_ms"] = int((time.time() - t0) * 1000)
+        return out
+
+    def probe_all(self) -> Dict[str, dict]:
+        targets = [(name, rep["url"], conf.get("health_path", "/health"))
+                   for name, conf in config_service.current().services.items() for rep in service_replicas(conf)]
+        with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+            probed = list(pool.map(lambda t: self.probe_replica(t[1], t[2]), targets))
+
+        now = time.time()
+        by_service: Dict[str, List[dict]] = {}
+        for (name, _, _), result in zip(targets, probed):
+            by_service.setdefault(name, []).append(result)
+
+        out = {}
+        for name, replicas in by_service.items():
+            if len(replicas) == 1:
+                out[name] = {k: v for k, v in replicas[0].items() if k != "url"}
+            else:
+                out[name] = {"ok": any(rep["ok"] for rep in replicas),
+                             "latency_ms": max(rep["latency_ms"] for rep in replicas),
+                             "replicas": replicas}
+            out[name]["checked_at"] = now
+        return out
+
+    def store(self, results: Dict[str, dict]):
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(HEALTH_KEY, mapping={name: json.dumps(res) for name, res in results.items()})
+        pipe.expire(HEALTH_KEY, int(HEALTH_STALE_AFTER_S * 2))
+        pipe.execute()
+
+    def cached(self) -> Dict[str, dict]:
+        return {name: json.loads(raw) for name, raw in r.hgetall(HEALTH_KEY).items()}
+
+    def is_down(self, service_name: str) -> bool:
+        """True only on a fresh result saying no replica is healthy."""
+        raw = r.hget(HEALTH_KEY, service_name)
+        if not raw:
+            return False
+        res = json.loads(raw)
+        return not res["ok"] and time.time() - res.get("checked_at", 0) < HEALTH_STALE_AFTER_S
+
+    def run_once(self) -> Dict[str, dict]:
+        results = self.probe_all()
+        self.store(results)
+        if self.limiter:
+            # keep failing replicas out of rotation until the next probe
+            for name, res in results.items():
+                replicas = res.get("replicas", [])
+                for i, rep in enumerate(replicas):
+                    if not rep["ok"]:
+                        self.limiter.eject(self.limiter.slot(name, i, len(replicas)),
+                                           int(HEALTH_PROBE_INTERVAL_S * 2))
+        return results
+
+    def try_lead(self, token: str, ttl_s: float) -> bool:
+        return bool(r.eval(LEAD_LUA, 1, PROBER_LOCK_KEY, token, int(ttl_s * 1000)))
+
+
+async def run_prober(service: Optional[HealthService] = None, interval_s: float = HEALTH_PROBE_INTERVAL_S):
+    """Background loop for the API process; one process at a time holds the prober lock."""
+    service = service or HealthService(LimiterService())
+    token = uuid.uuid4().hex
+    while True:
+        try:
+            if await asyncio.to_thread(service.try_lead, token, interval_s * 3):
+                await asyncio.to_thread(service.run_once)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("health probe failed")
+        await asyncio.sleep(interval_s)
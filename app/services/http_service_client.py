@@ -1,13 +1,73 @@
+import hashlib
+import json
+import time
 import requests
-from typing import Dict, Any, Optional
-from app.config import SERVICES, INTERNAL_API_KEY, HTTP_CONNECT_TIMEOUT_S, HTTP_READ_TIMEOUT_S
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Union
+from app.config import INTERNAL_API_KEY, HTTP_CONNECT_TIMEOUT_S, HTTP_READ_TIMEOUT_S, CANCEL_POLL_INTERVAL_S
+from app.services import config_service
+
+
+def service_replicas(conf: dict) -> List[Dict[str, Any]]:
+    """
+    Normalise `base_url` into a list of {"url", "limit"} replicas.
+
+    `base_url` may be a single URL, a list of URLs (each replica gets the
+    service `limit`) or a list of {"url": ..., "limit": ...} dicts.
+    """
+    base = conf["base_url"]
+    entries = base if isinstance(base, list) else [base]
+    replicas = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            replicas.append({"url": entry["url"], "limit": int(entry.get("limit", conf["limit"]))})
+        else:
+            replicas.append({"url": entry, "limit": conf["limit"]})
+    return replicas
+
+STREAM_ACCEPT = "application/x-ndjson, text/event-stream;q=0.9, application/json;q=0.5"
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+SSE_TYPE = "text/event-stream"
+
 
 class ServiceCallError(RuntimeError):
-    def __init__(self, code: str, message: str, retryable: bool, details: Optional[dict] = None):
+    def __init__(self, code: str, message: str, retryable: bool, details: Optional[dict] = None,
+                 retry_after: Optional[float] = None):
         super().__init__(message)
         self.code = code
         self.retryable = retryable
         self.details = details
+        # seconds the service asked us to wait (Retry-After), if any
+        self.retry_after = retry_after
+
+
+def _chunk(text: str) -> Dict[str, Any]:
+    try:
+        chunk = json.loads(text)
+    except ValueError:
+        raise ServiceCallError("BAD_RESPONSE", "Stream chunk is not JSON", True)
+    if not isinstance(chunk, dict):
+        raise ServiceCallError("BAD_RESPONSE", "Stream chunk must be an object", True)
+    return chunk
+
+
+def stream_chunks(lines: Iterable[str], sse: bool) -> Iterator[Dict[str, Any]]:
+    """JSON objects from NDJSON lines, or from the `data:` fields of SSE events."""
+    data: List[str] = []
+    for line in lines:
+        if not sse:
+            if line.strip():
+                yield _chunk(line)
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip(" "))
+        elif not line and data:
+            yield _chunk("\n".join(data))
+            data = []
+        # other SSE fields (event:, id:, retry:) and comments are ignored
+    if data:
+        yield _chunk("\n".join(data))
+
 
 class HTTPServiceClient:
     def _headers(self, service_conf: dict, idempotency_key: str) -> Dict[str, str]:
@@ -22,6 +82,20 @@ class HTTPServiceClient:
                 h["Authorization"] = f"Bearer {INTERNAL_API_KEY}"
         return h
 
+    def _retry_after(self, resp: requests.Response) -> Optional[float]:
+        value = resp.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            # HTTP-date form
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
     def _parse_error(self, resp: requests.Response) -> dict:
         try:
             body = resp.json()
@@ -35,6 +109,7 @@ class HTTPServiceClient:
                 "message": err.get("message", f"HTTP {resp.status_code}"),
                 "retryable": bool(err.get("retryable", resp.status_code >= 500)),
                 "details": err,
+                "retry_after": self._retry_after(resp),
             }
 
         return {
@@ -42,22 +117,39 @@ class HTTPServiceClient:
             "message": f"Service returned HTTP {resp.status_code}",
             "retryable": resp.status_code >= 500,
             "details": body if isinstance(body, dict) else None,
+            "retry_after": self._retry_after(resp),
         }
 
-    def call(self, service_name: str, envelope: Dict[str, Any], timeout_s: int) -> Dict[str, Any]:
-        conf = SERVICES.get(service_name)
-        if not conf:
-            raise ServiceCallError("UNKNOWN_SERVICE", f"No config for {service_name}", False)
-
-        url = conf["base_url"].rstrip("/") + conf["execute_path"]
-        idem = f"{envelope['meta']['job_id']}:{envelope['meta']['step_index']}:{service_name}"
+    def _idempotency_key(self, service_name: str, envelope: Dict[str, Any]) -> str:
+        return f"{envelope['meta']['job_id']}:{envelope['meta']['step_index']}:{service_name}"
 
+    def _timeout(self, timeout_s: int):
         connect_t = HTTP_CONNECT_TIMEOUT_S
         read_t = min(float(timeout_s), float(HTTP_READ_TIMEOUT_S))
-        timeout = (connect_t, read_t)
+        return (connect_t, read_t)
+
+    def _send(self, url: str, body: Dict[str, Any], headers: Dict[str, str], timeout_s: int,
+              cancel_check: Optional[Callable[[], bool]], stream: bool = False) -> requests.Response:
+        kwargs = {"json": body, "headers": headers, "timeout": self._timeout(timeout_s), "stream": stream}
+        if cancel_check is None:
+            return requests.post(url, **kwargs)
 
+        # Run the request off-thread so a cancel can stop waiting on it and free
+        # the lease immediately; the abandoned request ends at its read timeout.
+        pool = ThreadPoolExecutor(max_workers=1)
+        future = pool.submit(requests.post, url, **kwargs)
+        pool.shutdown(wait=False)
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_INTERVAL_S)
+            except FutureTimeout:
+                if cancel_check():
+                    raise ServiceCallError("CANCELLED", "Job cancelled", False)
+
+    def _request(self, url: str, body: Dict[str, Any], headers: Dict[str, str], timeout_s: int,
+                 cancel_check: Optional[Callable[[], bool]] = None, stream: bool = False) -> requests.Response:
         try:
-            resp = requests.post(url, json=envelope, headers=self._headers(conf, idem), timeout=timeout)
+            resp = self._send(url, body, headers, timeout_s, cancel_check, stream)
         except requests.Timeout as e:
             raise ServiceCallError("SERVICE_TIMEOUT", str(e), True)
         except requests.RequestException as e:
@@ -65,19 +157,85 @@ class HTTPServiceClient:
 
         if resp.status_code < 200 or resp.status_code >= 300:
             err = self._parse_error(resp)
+            resp.close()
 
             # map common "busy" scenarios
             if resp.status_code in (429, 503):
                 err["code"] = "RESOURCE_EXHAUSTED"
                 err["retryable"] = True
 
-            raise ServiceCallError(err["code"], err["message"], err["retryable"], err.get("details"))
+            raise ServiceCallError(err["code"], err["message"], err["retryable"], err.get("details"),
+                                   err.get("retry_after"))
+        return resp
 
+    def _json(self, resp: requests.Response) -> Dict[str, Any]:
         try:
-            out = resp.json()
+            return resp.json()
         except Exception:
             raise ServiceCallError("BAD_RESPONSE", "Service returned non-JSON", True)
 
+    def _post(self, url: str, body: Dict[str, Any], headers: Dict[str, str], timeout_s: int,
+              cancel_check: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        return self._json(self._request(url, body, headers, timeout_s, cancel_check))
+
+    def _post_stream(self, url: str, body: Dict[str, Any], headers: Dict[str, str], timeout_s: int,
+                     cancel_check: Optional[Callable[[], bool]],
+                     on_progress: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        POST asking for a streamed answer and read it chunk by chunk.
+
+        Each chunk is a JSON object. One carrying "status" is the final output,
+        shaped like a plain response; if it has no "data", the "delta" fields
+        of the earlier chunks (strings are concatenated) make up its data.
+        Other chunks may carry "progress" (0..1), "message" and "delta"; each
+        is reported to `on_progress` with the partial data so far. A service
+        that answers with plain JSON is handled as a normal call.
+        """
+        deadline = time.monotonic() + timeout_s
+        resp = self._request(url, body, {**headers, "Accept": STREAM_ACCEPT}, timeout_s, cancel_check,
+                             stream=True)
+        with resp:
+            ctype = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if ctype not in NDJSON_TYPES + (SSE_TYPE,):
+                return self._json(resp)
+            if "charset" not in resp.headers.get("Content-Type", "").lower():
+                # both formats are UTF-8; requests would assume ISO-8859-1 for text/event-stream
+                # and leave NDJSON lines as bytes
+                resp.encoding = "utf-8"
+
+            partial: Dict[str, Any] = {}
+            checked_at = time.monotonic()
+            try:
+                for chunk in stream_chunks(resp.iter_lines(decode_unicode=True), sse=ctype == SSE_TYPE):
+                    if "status" in chunk:
+                        if chunk["status"] == "SUCCESS" and "data" not in chunk:
+                            chunk["data"] = partial
+                        return chunk
+                    delta = chunk.get("delta")
+                    for key, value in (delta.items() if isinstance(delta, dict) else ()):
+                        if isinstance(value, str) and isinstance(partial.get(key, ""), str):
+                            partial[key] = partial.get(key, "") + value
+                        else:
+                            partial[key] = value
+                    on_progress({"progress": chunk.get("progress"), "message": chunk.get("message"),
+                                 "partial": dict(partial)})
+
+                    now = time.monotonic()
+                    if now > deadline:
+                        raise ServiceCallError("SERVICE_TIMEOUT", f"Stream still open after {timeout_s}s", True)
+                    if cancel_check and now - checked_at >= CANCEL_POLL_INTERVAL_S:
+                        checked_at = now
+                        if cancel_check():
+                            # leaving the block closes the connection, which tells the service to stop
+                            raise ServiceCallError("CANCELLED", "Job cancelled", False)
+            except requests.RequestException as e:
+                raise ServiceCallError("SERVICE_UNREACHABLE", f"Stream interrupted: {e}", True)
+        raise ServiceCallError("BAD_RESPONSE", "Stream ended without a result", True)
+
+    def _check_output(self, service_name: str, out: Any) -> Dict[str, Any]:
+        if not isinstance(out, dict):
+            raise ServiceCallError("BAD_RESPONSE", "Output must be an object", True)
+
         if out.get("status") != "SUCCESS":
             err = out.get("error", {})
             raise ServiceCallError(
@@ -95,3 +253,67 @@ class HTTPServiceClient:
 
         out.setdefault("metrics", {})
         return out
+
+    def _replica_url(self, conf: dict, replica: int) -> str:
+        return service_replicas(conf)[replica]["url"].rstrip("/")
+
+    def call(self, service_name: str, envelope: Dict[str, Any], timeout_s: int, replica: int = 0,
+             cancel_check: Optional[Callable[[], bool]] = None,
+             on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Execute one step. With `on_progress` and a service configured with
+        "stream": True, the answer may be streamed (see `_post_stream`).
+        """
+        conf = config_service.current().services.get(service_name)
+        if not conf:
+            raise ServiceCallError("UNKNOWN_SERVICE", f"No config for {service_name}", False)
+
+        url = self._replica_url(conf, replica) + conf["execute_path"]
+        idem = self._idempotency_key(service_name, envelope)
+
+        if on_progress is not None and conf.get("stream"):
+            out = self._post_stream(url, envelope, self._headers(conf, idem), timeout_s, cancel_check, on_progress)
+        else:
+            out = self._post(url, envelope, self._headers(conf, idem), timeout_s, cancel_check)
+        return self._check_output(service_name, out)
+
+    def call_batch(self, service_name: str, envelopes: List[Dict[str, Any]],
+                   timeout_s: int, replica: int = 0) -> List[Union[Dict[str, Any], ServiceCallError]]:
+        """
+        Send several envelopes in one request to the service's batch endpoint.
+
+        Request body is {"items": [envelope, ...]}; the response must carry
+        {"status": "SUCCESS", "results": [output, ...]} in the same order. Each
+        result is validated like a single call, so the returned list holds
+        either the output dict or the ServiceCallError for that item.
+        Transport/HTTP failures affect the whole batch and are raised.
+        """
+        conf = config_service.current().services.get(service_name)
+        if not conf or not conf.get("batching"):
+            raise ServiceCallError("UNKNOWN_SERVICE", f"No batch config for {service_name}", False)
+
+        url = self._replica_url(conf, replica) + conf["batching"]["execute_path"]
+        item_keys = ",".join(self._idempotency_key(service_name, e) for e in envelopes)
+        idem = "batch:" + hashlib.sha1(item_keys.encode()).hexdigest()
+
+        out = self._post(url, {"items": envelopes}, self._headers(conf, idem), timeout_s)
+        if out.get("status") != "SUCCESS":
+            err = out.get("error", {})
+            raise ServiceCallError(
+                err.get("code", "SERVICE_FAILED"),
+                err.get("message", f"{service_name} batch failed"),
+                bool(err.get("retryable", True)),
+                err
+            )
+
+        results = out.get("results")
+        if not isinstance(results, list) or len(results) != len(envelopes):
+            raise ServiceCallError("BAD_RESPONSE", "results must be a list matching items", True)
+
+        checked: List[Union[Dict[str, Any], ServiceCallError]] = []
+        for item in results:
+            try:
+                checked.append(self._check_output(service_name, item))
+            except ServiceCallError as e:
+                checked.append(e)
+        return checked
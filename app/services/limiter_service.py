@@ -1,42 +1,92 @@
 import time
 import uuid
 import redis
-from typing import Optional
-from app.config import REDIS_URL
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.redis_clients import get_redis
 
-r = redis.from_url(REDIS_URL, decode_responses=True)
+r = get_redis()
 
 class LimiterService:
-    def acquire(self, service_name: str, limit: int, lease_ttl: int, wait_timeout: int) -> Optional[str]:
+    @staticmethod
+    def slot(service_name: str, index: int, count: int) -> str:
+        """Limiter slot for one replica; a single-replica service keeps its plain name."""
+        return service_name if count == 1 else f"{service_name}#{index}"
+
+    def slots(self, service_name: str, replicas: List[Dict]) -> List[str]:
+        return [self.slot(service_name, i, len(replicas)) for i in range(len(replicas))]
+
+    def acquire_replica(self, service_name: str, replicas: List[Dict], lease_ttl: int, wait_timeout: int,
+                        cancel_check: Optional[Callable[[], bool]] = None) -> Optional[Tuple[int, str, str]]:
+        """
+        Take a lease on the replica with the fewest outstanding leases.
+
+        Each replica has its own counter and limit. Ejected replicas are skipped
+        unless every replica is ejected, in which case all are considered again.
+        Returns (replica_index, slot, lease_key), or None on timeout or when
+        `cancel_check` reports the job cancelled.
+        """
         token = str(uuid.uuid4())
-        counter_key = f"conc:{service_name}"
-        lease_key = f"lease:{service_name}:{token}"
+        slots = self.slots(service_name, replicas)
+        keys = ([f"conc:{s}" for s in slots] + [f"eject:{s}" for s in slots]
+                + [f"lease:{s}:{token}" for s in slots])
+        args = [str(len(slots)), str(lease_ttl)] + [str(rep["limit"]) for rep in replicas]
 
         lua = """
-        local counter_key = KEYS[1]
-        local lease_key = KEYS[2]
-        local limit = tonumber(ARGV[1])
+        local n = tonumber(ARGV[1])
         local ttl = tonumber(ARGV[2])
 
-        local cur = tonumber(redis.call("GET", counter_key) or "0")
-        if cur >= limit then
+        local all_ejected = true
+        for i = 1, n do
+            if redis.call("EXISTS", KEYS[n + i]) == 0 then
+                all_ejected = false
+                break
+            end
+        end
+
+        local best = nil
+        local best_cur = nil
+        for i = 1, n do
+            local cur = tonumber(redis.call("GET", KEYS[i]) or "0")
+            local limit = tonumber(ARGV[2 + i])
+            local usable = all_ejected or redis.call("EXISTS", KEYS[n + i]) == 0
+            if usable and cur < limit and (best == nil or cur < best_cur) then
+                best = i
+                best_cur = cur
+            end
+        end
+        if best == nil then
             return nil
         end
 
-        redis.call("INCR", counter_key)
-        redis.call("SET", lease_key, "1", "EX", ttl)
-        return lease_key
+        redis.call("INCR", KEYS[best])
+        redis.call("SET", KEYS[2 * n + best], "1", "EX", ttl)
+        return best - 1
         """
 
         start = time.time()
         while True:
-            lease = r.eval(lua, 2, counter_key, lease_key, str(limit), str(lease_ttl))
-            if lease:
-                return lease
+            index = r.eval(lua, len(keys), *keys, *args)
+            if index is not None:
+                index = int(index)
+                return index, slots[index], f"lease:{slots[index]}:{token}"
             if time.time() - start > wait_timeout:
                 return None
+            if cancel_check and cancel_check():
+                return None
             time.sleep(0.5)
 
+    def free_capacity(self, service_name: str, replicas: List[Dict]) -> int:
+        """Leases that could be taken right now across the service's usable replicas."""
+        slots = self.slots(service_name, replicas)
+        values = r.mget([f"conc:{s}" for s in slots] + [f"eject:{s}" for s in slots])
+        in_use, ejected = values[:len(slots)], values[len(slots):]
+        usable = [i for i in range(len(slots)) if not ejected[i]] or range(len(slots))
+        return sum(max(0, int(replicas[i]["limit"]) - int(in_use[i] or 0)) for i in usable)
+
+    def eject(self, slot: str, seconds: int):
+        """Take a replica out of rotation for `seconds` (health-aware ejection)."""
+        r.set(f"eject:{slot}", "1", ex=seconds)
+
     def release(self, service_name: str, lease_key: str):
         counter_key = f"conc:{service_name}"
         lua = """
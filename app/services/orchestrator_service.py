@@ -1,51 +1,92 @@
+import logging
+import math
+import random
 import time
+from contextlib import nullcontext
+from typing import Optional
 from sqlalchemy.exc import OperationalError
-from app.config import FEATURES, SERVICES
+from app.config import (COALESCE_ENABLED, REPLICA_EJECT_CODES, REPLICA_EJECT_SECONDS,
+                        RETRY_BASE_DELAY_S, RETRY_MAX_DELAY_S, HEALTH_PROBE_INTERVAL_S,
+                        HEALTH_MAX_DEFERRALS, STREAM_PROGRESS_INTERVAL_S)
+from app.core.metrics import LEASE_WAIT_SECONDS, STEP_HTTP_SECONDS, label_commits
 from app.models.enums import JobStatus, WebSocketEvent, StepStatus
 from app.repositories.job_repository import JobRepository
 from app.services.ws_service import WSService
 from app.services.limiter_service import LimiterService
-from app.services.http_service_client import HTTPServiceClient, ServiceCallError
+from app.services.http_service_client import HTTPServiceClient, ServiceCallError, service_replicas
+from app.services.coalescing_service import CoalescingService
+from app.services.batching_service import BatchingService
+from app.services.circuit_breaker_service import CircuitBreakerService
+from app.services.cancellation_service import CancellationService
+from app.services import config_service
+from app.services.health_service import HealthService
+from app.services.trace_service import TraceService
+
+logger = logging.getLogger(__name__)
+
+# services already warned about having both batching and streaming configured
+_STREAM_OVER_BATCHING = set()
 
 class OrchestratorService:
-    def __init__(self, repo: JobRepository, ws: WSService, limiter: LimiterService, client: HTTPServiceClient):
+    def __init__(self, repo: JobRepository, ws: WSService, limiter: LimiterService, client: HTTPServiceClient,
+                 coalescer: Optional[CoalescingService] = None, batcher: Optional[BatchingService] = None,
+                 breaker: Optional[CircuitBreakerService] = None,
+                 cancellation: Optional[CancellationService] = None,
+                 health: Optional[HealthService] = None,
+                 tracer: Optional[TraceService] = None):
         self.repo = repo
         self.ws = ws
         self.limiter = limiter
         self.client = client
+        self.coalescer = coalescer
+        self.batcher = batcher
+        self.breaker = breaker
+        self.cancellation = cancellation
+        self.health = health
+        self.tracer = tracer
+        # seconds until a DEFERRED / RETRY_SCHEDULED step is re-run (it is queued through the outbox)
+        self.countdown: Optional[int] = None
+        self.config = config_service.current()
 
     def execute_one_step(self, job_id: str) -> str:
+        self.countdown = None
+        # one snapshot for the whole step, so a reload mid-step can't mix versions
+        self.config = config_service.current()
         job = self.repo.get(job_id)
         if not job:
             return "JOB_NOT_FOUND"
         if job.status in (JobStatus.CANCELLED, JobStatus.COMPLETED):
             return f"STOPPED_{job.status}"
-        if job.feature_name not in FEATURES:
+        if job.feature_name not in self.config.features:
             self.repo.fail(job, "INVALID_FEATURE", f"Unknown feature {job.feature_name}", False)
             self.ws.publish(job_id, {"type": WebSocketEvent.ERROR, "job_id": job_id,
                                     "error_code": "INVALID_FEATURE", "message": "Unknown feature",
-                                    "action": "CONTACT_SUPPORT"})
+                                    "action": "CONTACT_SUPPORT"}, job=job)
             return "FAILED"
 
-        recipe = FEATURES[job.feature_name]
+        recipe = self.config.features[job.feature_name]
         total_steps = len(recipe)
 
         if job.current_step_index >= total_steps:
             self.repo.set_status(job, JobStatus.COMPLETED)
-            self.ws.publish(job_id, {"type": WebSocketEvent.JOB_COMPLETE, "job_id": job_id, "message": "Job completed"})
+            self.ws.publish(job_id, {"type": WebSocketEvent.JOB_COMPLETE, "job_id": job_id, "message": "Job completed"}, job=job)
             return "DONE"
 
         step_index = job.current_step_index
         service_name = recipe[step_index]
-        conf = SERVICES[service_name]
+        conf = self.config.services[service_name]
 
         step_key = f"step_{step_index}_{service_name}"
         attempts_key = f"{step_key}__attempts"
+        if self.tracer:
+            self.tracer.annotate(step_index=step_index, service=service_name)
+        label_commits(self.repo.session, service_name, job.priority)
 
         # Idempotency at orchestrator level: skip if already recorded
         existing = job.context.get(step_key)
         if existing and existing.get("status") == StepStatus.SUCCESS:
             prev = job.current_step_index
+            self._stage_next(job, total_steps)
             self.repo.bump_step_index(job)
             if job.current_step_index <= prev:
                 self.repo.fail(job, "LOOP_DETECTED", "Step index did not advance", True)
@@ -57,29 +98,95 @@ class OrchestratorService:
             self.repo.fail(job, "MAX_STEP_ATTEMPTS", f"Exceeded attempts for {step_key}", False)
             self.ws.publish(job_id, {"type": WebSocketEvent.ERROR, "job_id": job_id,
                                     "error_code": "MAX_STEP_ATTEMPTS",
-                                    "message": "Exceeded attempts for step", "action": "CONTACT_SUPPORT"})
+                                    "message": "Exceeded attempts for step", "action": "CONTACT_SUPPORT"}, job=job)
             return "FAILED"
 
+        deferrals_key = f"{step_key}__health_deferrals"
+        deferrals = int(job.context.get(deferrals_key, 0))
+        if self.health and deferrals < HEALTH_MAX_DEFERRALS and self.health.is_down(service_name):
+            # the prober saw every replica failing; check again after its next round. Past the
+            # budget the step is dispatched anyway, so a health check that never passes can't
+            # park it forever without spending attempts
+            job.context[deferrals_key] = deferrals + 1
+            return self._defer(job, service_name, step_index, total_steps, HEALTH_PROBE_INTERVAL_S)
+
+        if self.breaker:
+            # fail fast while the backend is down: no attempt, no lease
+            decision, wait_s = self.breaker.allow(service_name, conf["lease_ttl"])
+            if decision == "DENY":
+                return self._defer(job, service_name, step_index, total_steps, wait_s)
+
+        flight = None
+        if self.coalescer and COALESCE_ENABLED and conf.get("coalesce"):
+            digest = self.coalescer.input_hash(service_name, {
+                "params": job.context.get("params", {}),
+                "context": job.context,
+            })
+            if self.coalescer.try_lead(service_name, digest, job_id, conf["lease_ttl"]):
+                flight = digest
+            else:
+                result = self._follow(job, service_name, step_index, total_steps, step_key, attempts_key, digest)
+                if result is not None:
+                    return result
+                # leader timed out, crashed or gave up: make the call ourselves
+
+        settled = False
+        try:
+            result = self._run_step(job, service_name, step_index, total_steps, step_key, attempts_key, flight)
+            settled = True
+            return result
+        finally:
+            if flight and not settled:
+                self.coalescer.abandon(service_name, flight, job_id)
+
+    def _run_step(self, job, service_name: str, step_index: int, total_steps: int,
+                  step_key: str, attempts_key: str, flight: Optional[str]) -> str:
+        job_id = job.id
+        conf = self.config.services[service_name]
+        attempts = int(job.context.get(attempts_key, 0))
+
         self.ws.publish(job_id, {"type": WebSocketEvent.WAITING, "job_id": job_id,
                                 "step_name": service_name, "step_index": step_index,
-                                "total_steps": total_steps, "message": "Waiting for capacity..."})
+                                "total_steps": total_steps, "message": "Waiting for capacity..."}, job=job)
 
-        lease = self.limiter.acquire(service_name, conf["limit"], conf["lease_ttl"], conf["timeout"])
-        if not lease:
-            self.repo.fail(job, "RESOURCE_EXHAUSTED", f"Semaphore timeout after {conf['timeout']}s", True)
-            self.ws.publish(job_id, {"type": WebSocketEvent.ERROR, "job_id": job_id,
-                                    "error_code": "RESOURCE_EXHAUSTED",
-                                    "message": "Service busy. Resume available.", "action": "RETRY_AVAILABLE"})
-            return "FAILED"
+        # batched services take one lease per batch inside the batcher; a batch can't relay
+        # one job's streamed output, so streaming services always call on their own
+        batched = self.batcher is not None and bool(conf.get("batching")) and not conf.get("stream")
+        if conf.get("batching") and conf.get("stream") and service_name not in _STREAM_OVER_BATCHING:
+            _STREAM_OVER_BATCHING.add(service_name)
+            logger.warning("%s is configured to both stream and batch; batching is ignored", service_name)
+        replicas = service_replicas(conf)
+        cancel_check = self._cancel_check(job_id)
+        with self._span("publish"):
+            self.ws.flush()  # acquiring can block until a lease frees up
+        picked = None
+        if not batched:
+            t_acquire = time.perf_counter()
+            with self._span("acquire"):
+                picked = self.limiter.acquire_replica(
+                    service_name, replicas, conf["lease_ttl"], conf["timeout"], cancel_check=cancel_check)
+            LEASE_WAIT_SECONDS.labels(service_name, job.priority or "unknown",
+                                      "acquired" if picked else "timeout").observe(time.perf_counter() - t_acquire)
+        if not batched and not picked:
+            if cancel_check and cancel_check():
+                return self._stop_cancelled(service_name, flight, job_id)
+            message = f"Semaphore timeout after {conf['timeout']}s"
+            if flight:
+                self.coalescer.publish_error(service_name, flight, job_id, "RESOURCE_EXHAUSTED", message, True)
+            return self._fail_step(job, service_name, step_key,
+                                   ServiceCallError("RESOURCE_EXHAUSTED", message, True))
 
+        replica, slot, lease = picked or (None, None, None)
         try:
             # bump attempts
             job.context[attempts_key] = attempts + 1
-            self.repo.set_status(job, JobStatus.RUNNING)
+            if self.tracer:
+                self.tracer.annotate(attempt=attempts + 1)
+            self._mark_running(job)
 
             self.ws.publish(job_id, {"type": WebSocketEvent.STEP_START, "job_id": job_id,
                                     "step_name": service_name, "step_index": step_index,
-                                    "total_steps": total_steps, "message": f"Running {service_name}..."})
+                                    "total_steps": total_steps, "message": f"Running {service_name}..."}, job=job)
 
             envelope = {
                 "meta": {
@@ -95,9 +202,37 @@ class OrchestratorService:
                 }
             }
 
+            with self._span("publish"):
+                self.ws.flush()
             t0 = time.time()
-            out = self.client.call(service_name, envelope, conf["timeout"])
+            try:
+                with self._span("call"):
+                    if batched:
+                        out = self.batcher.submit(service_name, envelope, conf)
+                    else:
+                        on_progress = (self._progress_relay(job, service_name, step_index, total_steps)
+                                       if conf.get("stream") else None)
+                        out = self.client.call(service_name, envelope, conf["timeout"], replica=replica,
+                                               cancel_check=cancel_check, on_progress=on_progress)
+            except ServiceCallError as e:
+                STEP_HTTP_SECONDS.labels(service_name, job.priority or "unknown", e.code).observe(time.time() - t0)
+                if e.code == "CANCELLED":
+                    # lease is released below as soon as we return
+                    return self._stop_cancelled(service_name, flight, job_id)
+                if self.breaker and not batched:
+                    self.breaker.record(service_name, e.code)
+                if lease and len(replicas) > 1 and e.code in REPLICA_EJECT_CODES:
+                    self.limiter.eject(slot, REPLICA_EJECT_SECONDS)
+                if flight:
+                    self.coalescer.publish_error(service_name, flight, job_id, e.code, str(e), e.retryable,
+                                                 e.details, e.retry_after)
+                raise
             exec_ms = int((time.time() - t0) * 1000)
+            STEP_HTTP_SECONDS.labels(service_name, job.priority or "unknown", "SUCCESS").observe(exec_ms / 1000.0)
+            if self.breaker and not batched:
+                self.breaker.record(service_name)
+            if flight:
+                self.coalescer.publish_result(service_name, flight, job_id, out)
 
             step_payload = {
                 "status": StepStatus.SUCCESS,
@@ -105,29 +240,171 @@ class OrchestratorService:
                 "metrics": {**out.get("metrics", {}), "execution_time_ms": exec_ms},
                 "timestamp": int(time.time()),
             }
-            self.repo.save_step(job, step_key, step_payload)
-
-            prev = job.current_step_index
-            self.repo.bump_step_index(job)
-            if job.current_step_index <= prev:
-                self.repo.fail(job, "LOOP_DETECTED", "Step index did not advance", True)
-                return "FAILED"
-
-            self.ws.publish(job_id, {"type": WebSocketEvent.STEP_COMPLETE, "job_id": job_id,
-                                    "step_name": service_name, "step_index": step_index,
-                                    "total_steps": total_steps, "message": f"Completed {service_name}"})
-            return "OK"
+            if lease and len(replicas) > 1:
+                step_payload["metrics"]["replica"] = replicas[replica]["url"]
+            return self._complete_step(job, service_name, step_index, total_steps, step_key, step_payload)
 
         except OperationalError as e:
             # Let Celery retry for DB outages (handled in worker)
             raise
 
         except ServiceCallError as e:
-            self.repo.fail(job, e.code, str(e), e.retryable)
-            self.ws.publish(job_id, {"type": WebSocketEvent.ERROR, "job_id": job_id,
-                                    "error_code": e.code, "message": str(e),
-                                    "action": "RETRY_AVAILABLE" if e.retryable else "CONTACT_SUPPORT"})
-            return "FAILED"
+            return self._fail_step(job, service_name, step_key, e)
 
         finally:
-            self.limiter.release(service_name, lease)
+            if lease:
+                self.limiter.release(slot, lease)
+
+    def _span(self, name: str):
+        return self.tracer.span(name) if self.tracer else nullcontext()
+
+    def _cancel_check(self, job_id: str):
+        if not self.cancellation:
+            return None
+        return lambda: self.cancellation.is_cancelled(job_id)
+
+    def _stop_cancelled(self, service_name: str, flight: Optional[str], job_id: str) -> str:
+        if flight:
+            # followers are not cancelled; let them make their own call
+            self.coalescer.abandon(service_name, flight, job_id)
+        return "CANCELLED"
+
+    def _defer(self, job, service_name: str, step_index: int, total_steps: int, wait_s: float) -> str:
+        self.countdown = max(1, math.ceil(wait_s))
+        self.repo.defer(job, self.countdown)
+        self.ws.publish(job.id, {"type": WebSocketEvent.WAITING, "job_id": job.id,
+                                "step_name": service_name, "step_index": step_index,
+                                "total_steps": total_steps,
+                                "message": f"{service_name} unavailable, retrying in {self.countdown}s"}, job=job)
+        return "DEFERRED"
+
+    def _follow(self, job, service_name: str, step_index: int, total_steps: int,
+                step_key: str, attempts_key: str, digest: str) -> Optional[str]:
+        """Wait for an identical in-flight call instead of taking a lease. None means fall back."""
+        job_id = job.id
+        conf = self.config.services[service_name]
+
+        self.ws.publish(job_id, {"type": WebSocketEvent.WAITING, "job_id": job_id,
+                                "step_name": service_name, "step_index": step_index,
+                                "total_steps": total_steps,
+                                "message": "Waiting for an identical request in flight..."}, job=job)
+
+        with self._span("publish"):
+            self.ws.flush()
+        t0 = time.time()
+        cancel_check = self._cancel_check(job_id)
+        with self._span("coalesce_wait"):
+            message = self.coalescer.wait(service_name, digest, conf["timeout"], cancel_check=cancel_check)
+        if message is None:
+            if cancel_check and cancel_check():
+                return "CANCELLED"
+            return None
+
+        job.context[attempts_key] = int(job.context.get(attempts_key, 0)) + 1
+        self._mark_running(job)
+
+        if message["status"] != "SUCCESS":
+            err = message.get("error", {})
+            return self._fail_step(job, service_name, step_key, ServiceCallError(
+                err.get("code", "SERVICE_FAILED"),
+                err.get("message", f"{service_name} failed"),
+                bool(err.get("retryable", True)),
+                err.get("details"),
+                err.get("retry_after"),
+            ))
+
+        out = message["out"]
+        step_payload = {
+            "status": StepStatus.SUCCESS,
+            "data": out.get("data", {}),
+            "metrics": {**out.get("metrics", {}),
+                        "execution_time_ms": int((time.time() - t0) * 1000),
+                        "coalesced_from": message.get("leader")},
+            "timestamp": int(time.time()),
+        }
+        return self._complete_step(job, service_name, step_index, total_steps, step_key, step_payload)
+
+    def _complete_step(self, job, service_name: str, step_index: int, total_steps: int,
+                       step_key: str, step_payload: dict) -> str:
+        job_id = job.id
+        with self._span("save"):
+            self.repo.save_step(job, step_key, step_payload)
+        # the next step is dispatched as soon as the bump commits, so its events must
+        # not overtake this one
+        self.ws.publish(job_id, {"type": WebSocketEvent.STEP_COMPLETE, "job_id": job_id,
+                                "step_name": service_name, "step_index": step_index,
+                                "total_steps": total_steps, "message": f"Completed {service_name}"}, job=job)
+        with self._span("publish"):
+            self.ws.flush()
+        with self._span("save"):
+            prev = job.current_step_index
+            self._stage_next(job, total_steps)
+            self.repo.bump_step_index(job)
+        if job.current_step_index <= prev:
+            self.repo.fail(job, "LOOP_DETECTED", "Step index did not advance", True)
+            return "FAILED"
+        return "OK"
+
+    def _stage_next(self, job, total_steps: int):
+        # committed together with the step index bump that follows
+        if job.current_step_index + 1 < total_steps:
+            self.repo.stage_step(job.id, job.priority)
+
+    def _progress_relay(self, job, service_name: str, step_index: int, total_steps: int):
+        """
+        Publish streamed progress as STEP_PROGRESS, at most every STREAM_PROGRESS_INTERVAL_S.
+        Events carry the partial output so far rather than a delta: slow clients
+        only get the latest queued progress event of a step (see OutboundQueue).
+        """
+        last_sent = [float("-inf")]
+
+        def relay(update: dict):
+            now = time.monotonic()
+            if now - last_sent[0] < STREAM_PROGRESS_INTERVAL_S:
+                return
+            last_sent[0] = now
+            event = {"type": WebSocketEvent.STEP_PROGRESS, "job_id": job.id, "step_name": service_name,
+                     "step_index": step_index, "total_steps": total_steps}
+            event.update({k: v for k, v in update.items() if v is not None})
+            self.ws.publish(job.id, event, job=job)
+            self.ws.flush()  # the worker buffers events; progress must not wait for the step to end
+
+        return relay
+
+    def _mark_running(self, job):
+        if job.status == JobStatus.WAITING_RETRY:
+            # leaving a scheduled retry: drop the error recorded when it was scheduled
+            self.repo.clear_failure(job)
+        else:
+            self.repo.set_status(job, JobStatus.RUNNING)
+
+    def _retry_delay(self, retries: int, retry_after: Optional[float]) -> int:
+        cap = min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * (2 ** retries))
+        delay = random.uniform(RETRY_BASE_DELAY_S, max(RETRY_BASE_DELAY_S, cap))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return max(1, math.ceil(delay))
+
+    def _fail_step(self, job, service_name: str, step_key: str, e: ServiceCallError) -> str:
+        job_id = job.id
+        conf = self.config.services[service_name]
+        retries_key = f"{step_key}__retries"
+        retries = int(job.context.get(retries_key, 0))
+        attempts = int(job.context.get(f"{step_key}__attempts", 0))
+
+        if e.retryable and retries < conf["max_step_attempts"] and attempts < conf["max_step_attempts"]:
+            self.countdown = self._retry_delay(retries, e.retry_after)
+            job.context[retries_key] = retries + 1
+            self.repo.stage_step(job_id, job.priority, countdown=self.countdown)
+            self.repo.schedule_retry(job, e.code, str(e), time.time() + self.countdown)
+            self.ws.publish(job_id, {"type": WebSocketEvent.RETRY_SCHEDULED, "job_id": job_id,
+                                    "step_name": service_name, "error_code": e.code,
+                                    "retry_in_s": self.countdown,
+                                    "message": f"{service_name} unavailable, retrying in {self.countdown}s"}, job=job)
+            return "RETRY_SCHEDULED"
+
+        self.repo.fail(job, e.code, str(e), e.retryable)
+        self.ws.publish(job_id, {"type": WebSocketEvent.ERROR, "job_id": job_id,
+                                "error_code": e.code, "message": str(e),
+                                "action": "RETRY_AVAILABLE" if e.retryable else "CONTACT_SUPPORT"}, job=job)
+        return "FAILED"
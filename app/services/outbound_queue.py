@@ -0,0 +1,85 @@
+import asyncio
+import json
+from collections import Counter
+from typing import Callable, Optional, Tuple
+from app.config import WS_OUTBOUND_QUEUE_SIZE
+from app.core.metrics import WS_OUTBOUND_EVENTS, WS_SLOW_DISCONNECTS
+from app.models.enums import WebSocketEvent
+
+# superseded by the next one for the same job step
+CONFLATE_TYPES = {WebSocketEvent.WAITING.value, WebSocketEvent.STEP_PROGRESS.value}
+# delivered even past the bound
+NEVER_DROP_TYPES = {WebSocketEvent.JOB_COMPLETE.value, WebSocketEvent.ERROR.value,
+                    WebSocketEvent.JOB_CANCELLED.value}
+
+# per-process totals across connections (served by /health/ws), mirrored to Prometheus
+STATS: Counter = Counter()
+_PROMETHEUS = {"conflated": WS_OUTBOUND_EVENTS.labels("conflated"),
+               "dropped": WS_OUTBOUND_EVENTS.labels("dropped"),
+               "slow_disconnects": WS_SLOW_DISCONNECTS}
+
+
+def record(stat: str):
+    STATS[stat] += 1
+    _PROMETHEUS[stat].inc()
+
+
+def _conflation_key(event: dict) -> Optional[Tuple]:
+    if event.get("type") not in CONFLATE_TYPES:
+        return None
+    return event.get("job_id"), event.get("step_index"), event.get("type")
+
+
+class OutboundQueue(asyncio.Queue):
+    """
+    Bounded per-connection event queue fed by the pubsub hub.
+
+    A waiting/progress event supersedes the one still queued for the same job
+    step, which is dropped; the new one goes to the tail so event ids stay in
+    order. Once the connection is `limit` events behind, further events are
+    dropped (terminal ones excepted) and `stalled` is set so the handler can
+    disconnect; clients resume from their last event id.
+    """
+
+    def __init__(self, limit: int = WS_OUTBOUND_QUEUE_SIZE, accept: Optional[Callable[[dict], bool]] = None):
+        super().__init__()  # the bound is enforced in put_nowait
+        self.limit = limit
+        self.accept = accept
+        self.conflated = 0
+        self.dropped = 0
+        self.stalled = asyncio.Event()
+        self._latest = {}
+
+    def put_nowait(self, data: str):
+        try:
+            event = json.loads(data)
+        except ValueError:
+            event = {}
+        if self.accept is not None and not self.accept(event):
+            return
+
+        key = _conflation_key(event)
+        superseded = self._latest.get(key) if key else None
+        if superseded is not None:
+            # drop the older event and queue this one at the tail: replacing it in place
+            # would put a newer event id ahead of events queued after it, and clients
+            # skip ids at or below the last one they saw
+            self._queue.remove(superseded)
+            self.conflated += 1
+            record("conflated")
+        elif self.qsize() >= self.limit and event.get("type") not in NEVER_DROP_TYPES:
+            self.dropped += 1
+            record("dropped")
+            self.stalled.set()
+            return
+
+        entry = [key, data]
+        if key:
+            self._latest[key] = entry
+        super().put_nowait(entry)
+
+    def _get(self):
+        entry = self._queue.popleft()
+        if entry[0] and self._latest.get(entry[0]) is entry:
+            del self._latest[entry[0]]
+        return entry[1]
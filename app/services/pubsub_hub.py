@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+import redis.asyncio as aioredis
+from app.config import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+
+class PubSubHub:
+    """
+    One Redis subscriber per API process, shared by every WebSocket.
+
+    Sockets get an asyncio queue per channel (or share one across channels and
+    patterns); the Redis SUBSCRIBE/PSUBSCRIBE is sent when the first socket for
+    a channel arrives and UNSUBSCRIBE when the last one leaves. A single reader
+    task fans incoming messages out to the queues.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        # the client and lock bind to the running loop, so both are made on first use
+        self._redis_url = redis_url
+        self._redis: Optional[aioredis.Redis] = None
+        self._pubsub = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._psubscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._reader: Optional[asyncio.Task] = None
+        self._lock_obj: Optional[asyncio.Lock] = None
+
+    @property
+    def _lock(self) -> asyncio.Lock:
+        if self._lock_obj is None:
+            self._lock_obj = asyncio.Lock()
+        return self._lock_obj
+
+    async def subscribe(self, channel: str, queue: Optional[asyncio.Queue] = None) -> asyncio.Queue:
+        """Deliver messages on `channel` to `queue` (a new one unless given)."""
+        return await self._add(self._subscribers, channel, queue, pattern=False)
+
+    async def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        await self._remove(self._subscribers, channel, queue, pattern=False)
+
+    async def psubscribe(self, pattern: str, queue: Optional[asyncio.Queue] = None) -> asyncio.Queue:
+        """Deliver messages on every channel matching `pattern` to `queue`."""
+        return await self._add(self._psubscribers, pattern, queue, pattern=True)
+
+    async def punsubscribe(self, pattern: str, queue: asyncio.Queue):
+        await self._remove(self._psubscribers, pattern, queue, pattern=True)
+
+    async def _add(self, table: Dict[str, Set[asyncio.Queue]], key: str,
+                   queue: Optional[asyncio.Queue], pattern: bool) -> asyncio.Queue:
+        queue = queue if queue is not None else asyncio.Queue()
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            subs = table.setdefault(key, set())
+            subs.add(queue)
+            if len(subs) == 1:
+                await (self._pubsub.psubscribe(key) if pattern else self._pubsub.subscribe(key))
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+        return queue
+
+    async def _remove(self, table: Dict[str, Set[asyncio.Queue]], key: str,
+                      queue: asyncio.Queue, pattern: bool):
+        async with self._lock:
+            subs = table.get(key)
+            if not subs or queue not in subs:
+                return
+            subs.discard(queue)
+            if not subs:
+                del table[key]
+                await (self._pubsub.punsubscribe(key) if pattern else self._pubsub.unsubscribe(key))
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        """This process's async client, for reads (e.g. stream replay) alongside the subscription."""
+        if self._redis is None:
+            self._redis = aioredis.from_url(self._redis_url, decode_responses=True)
+        return self._redis
+
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for table in (self._subscribers, self._psubscribers) for subs in table.values())
+
+    async def _read(self):
+        while True:
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # redis-py reconnects and re-subscribes on the next read
+                logger.exception("pubsub hub read failed; retrying")
+                await asyncio.sleep(1.0)
+                continue
+            if not msg:
+                continue
+            if msg.get("type") == "message":
+                self._dispatch(msg["channel"], msg["data"])
+            elif msg.get("type") == "pmessage":
+                self._dispatch(msg["pattern"], msg["data"], self._psubscribers)
+
+    def _dispatch(self, channel: str, data: str, table: Optional[Dict[str, Set[asyncio.Queue]]] = None):
+        for queue in list((self._subscribers if table is None else table).get(channel, ())):
+            queue.put_nowait(data)
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+        self._lock_obj = None  # a restarted app runs on a new loop
+
+
+hub = PubSubHub()
@@ -0,0 +1,142 @@
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+from app.config import WS_MAX_SUBSCRIPTIONS, WS_MAX_JOB_IDS
+from app.services.outbound_queue import OutboundQueue
+from app.services.pubsub_hub import PubSubHub
+
+ALL_JOBS = "ws:*"
+SEEN_EVENT_IDS = 1024
+
+
+class Subscription:
+    """Events matching every criterion given; unset criteria match anything."""
+
+    def __init__(self, sub_id: str, job_ids: Iterable[str] = (), user_id: Optional[str] = None,
+                 feature_name: Optional[str] = None, types: Iterable[str] = ()):
+        self.id = sub_id
+        self.job_ids = set(job_ids)
+        self.user_id = user_id
+        self.feature_name = feature_name
+        self.types = {str(getattr(t, "value", t)) for t in types}
+
+    def channels(self) -> List[str]:
+        # filters without job ids need every job's events
+        return [f"ws:{job_id}" for job_id in self.job_ids] if self.job_ids else [ALL_JOBS]
+
+    def matches(self, event: dict) -> bool:
+        if self.job_ids and event.get("job_id") not in self.job_ids:
+            return False
+        if self.user_id is not None and event.get("user_id") != self.user_id:
+            return False
+        if self.feature_name is not None and event.get("feature_name") != self.feature_name:
+            return False
+        return not self.types or event.get("type") in self.types
+
+
+class SubscriptionService:
+    """
+    One connection's subscriptions on the shared pubsub hub.
+
+    All of them feed a single outbound queue; job-id subscriptions use per-job
+    channels and filter-only ones a `ws:*` pattern, so an event can arrive
+    twice and is de-duplicated by `event_id` before matching. Unwanted events
+    are discarded before they take up queue space.
+
+    Filter-only subscriptions see every job's events, so they are refused
+    unless `allow_filters` (the connection presented the internal key).
+    """
+
+    def __init__(self, hub: PubSubHub, allow_filters: bool = False):
+        self.hub = hub
+        self.allow_filters = allow_filters
+        self.queue = OutboundQueue(accept=self.wants)
+        self._subs: Dict[str, Subscription] = {}
+        self._channels: Counter = Counter()
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+    async def subscribe(self, job_ids: Iterable[str] = (), user_id: Optional[str] = None,
+                        feature_name: Optional[str] = None, types: Iterable[str] = ()) -> str:
+        sub = Subscription(uuid.uuid4().hex[:12], job_ids, user_id, feature_name, types)
+        if not (sub.job_ids or sub.user_id or sub.feature_name or sub.types):
+            raise ValueError("Subscription needs job_ids or at least one filter")
+        if not sub.job_ids and not self.allow_filters:
+            raise ValueError("Subscriptions without job_ids need the internal key")
+        if len(self._subs) >= WS_MAX_SUBSCRIPTIONS:
+            raise ValueError(f"At most {WS_MAX_SUBSCRIPTIONS} subscriptions per connection")
+        if sum(len(s.job_ids) for s in self._subs.values()) + len(sub.job_ids) > WS_MAX_JOB_IDS:
+            raise ValueError(f"At most {WS_MAX_JOB_IDS} job ids per connection")
+
+        self._subs[sub.id] = sub
+        await self._watch(sub.channels())
+        return sub.id
+
+    async def unsubscribe(self, sub_id: Optional[str] = None, job_ids: Iterable[str] = ()) -> List[str]:
+        """Drop a subscription by id, or job ids from every subscription. Returns ids removed."""
+        if sub_id is not None:
+            sub = self._subs.pop(sub_id, None)
+            if sub is None:
+                raise ValueError(f"Unknown subscription {sub_id}")
+            await self._unwatch(sub.channels())
+            return [sub_id]
+
+        drop = set(job_ids)
+        removed = []
+        for sub in list(self._subs.values()):
+            gone = sub.job_ids & drop
+            if not gone:
+                continue
+            sub.job_ids -= gone
+            await self._unwatch(f"ws:{job_id}" for job_id in gone)
+            if not sub.job_ids:
+                # what is left would widen it to every job
+                del self._subs[sub.id]
+                removed.append(sub.id)
+        return removed
+
+    async def close(self):
+        await self._unwatch(list(self._channels.elements()))
+        self._subs.clear()
+
+    async def next_event(self) -> str:
+        return await self.queue.get()
+
+    def drain(self, limit: int) -> List[str]:
+        """Events already queued, up to `limit`, without waiting."""
+        out: List[str] = []
+        while len(out) < limit and not self.queue.empty():
+            out.append(self.queue.get_nowait())
+        return out
+
+    def wants(self, event: dict) -> bool:
+        event_id = event.get("event_id")
+        if event_id:
+            # stream ids are per job, so two jobs can share one
+            seen_key = f"{event.get('job_id')}/{event_id}"
+            if seen_key in self._seen:
+                return False
+            self._seen[seen_key] = None
+            if len(self._seen) > SEEN_EVENT_IDS:
+                self._seen.popitem(last=False)
+        return any(sub.matches(event) for sub in self._subs.values())
+
+    async def _watch(self, channels: Iterable[str]):
+        for channel in channels:
+            self._channels[channel] += 1
+            if self._channels[channel] == 1:
+                if channel == ALL_JOBS:
+                    await self.hub.psubscribe(channel, self.queue)
+                else:
+                    await self.hub.subscribe(channel, self.queue)
+
+    async def _unwatch(self, channels: Iterable[str]):
+        for channel in channels:
+            if not self._channels[channel]:
+                continue
+            self._channels[channel] -= 1
+            if not self._channels[channel]:
+                del self._channels[channel]
+                if channel == ALL_JOBS:
+                    await self.hub.punsubscribe(channel, self.queue)
+                else:
+                    await self.hub.unsubscribe(channel, self.queue)
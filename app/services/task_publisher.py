@@ -0,0 +1,26 @@
+import time
+from typing import Optional
+from app.celery_app import celery_app
+from app.config import QUEUE_HIGH, QUEUE_MEDIUM, QUEUE_LOW
+from app.services.cancellation_service import CancellationService
+
+# Tasks are sent by name, so publishers (the API) never import worker.tasks
+# and with it the orchestrator stack and the worker's DB engine.
+EXECUTE_JOB_STEP = "worker.tasks.execute_job_step"
+
+QUEUE_BY_PRIORITY = {"high": QUEUE_HIGH, "medium": QUEUE_MEDIUM, "low": QUEUE_LOW}
+
+
+def priority_queue(priority: str) -> str:
+    return QUEUE_BY_PRIORITY.get(priority, QUEUE_MEDIUM)
+
+
+def enqueue_job_step(job_id: str, priority: str, countdown: Optional[int] = None,
+                     due_at: Optional[float] = None, producer=None):
+    """Queue the job's next step on its priority queue, remembering the task id for cancellation."""
+    # enqueued_at is when the step became due, for the queue-wait metric
+    enqueued_at = due_at if due_at is not None else time.time() + (countdown or 0)
+    res = celery_app.send_task(EXECUTE_JOB_STEP, args=[job_id], kwargs={"enqueued_at": enqueued_at},
+                               queue=priority_queue(priority), countdown=countdown, producer=producer)
+    CancellationService().remember_task(job_id, res.id)
+    return res
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import redis
+import requests
+from app.config import TRACE_SAMPLE_RATE, TRACE_TTL_S, TRACE_OTLP_ENDPOINT
+from app.core.redis_clients import get_redis
+
+logger = logging.getLogger(__name__)
+r = get_redis()
+
+
+class TraceService:
+    """
+    Timed spans for one task run of a job step (queue, acquire, call, save, publish).
+
+    Sampling is decided per job, so a sampled job is traced on every step.
+    Each run is one field of the `trace:{job_id}` hash holding compact JSON
+    `{"t": start_ms, "r": result, "s": [[name, offset_ms, duration_ms], ...]}`;
+    nothing goes into the job's `context`. Runs can also be exported to an
+    OTLP/HTTP collector (TRACE_OTLP_ENDPOINT).
+    """
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, otlp_endpoint: str = TRACE_OTLP_ENDPOINT):
+        self.sample_rate = sample_rate
+        self.otlp_endpoint = otlp_endpoint
+        self.job_id: Optional[str] = None
+        self._spans: Optional[List[tuple]] = None
+        self._attrs: Dict[str, object] = {}
+        self._t0 = 0.0
+
+    def sampled(self, job_id: str) -> bool:
+        if self.sample_rate <= 0:
+            return False
+        bucket = int(hashlib.sha1(job_id.encode()).hexdigest()[:8], 16) / float(0x100000000)
+        return bucket < self.sample_rate
+
+    def start(self, job_id: str):
+        self.job_id = job_id
+        self._t0 = time.time()
+        self._spans = [] if self.sampled(job_id) else None
+        self._attrs = {}
+
+    @property
+    def active(self) -> bool:
+        return self._spans is not None
+
+    def annotate(self, **attrs):
+        if self.active:
+            self._attrs.update(attrs)
+
+    def add(self, name: str, start: float, end: float):
+        if self.active:
+            self._spans.append((name, start, end))
+
+    @contextmanager
+    def span(self, name: str):
+        if not self.active:
+            yield
+            return
+        t = time.time()
+        try:
+            yield
+        finally:
+            self._spans.append((name, t, time.time()))
+
+    def finish(self, result: str):
+        if not self.active:
+            return
+        spans, self._spans = self._spans, None
+        t0 = min([self._t0] + [start for _, start, _ in spans])
+        record = {
+            "t": int(t0 * 1000),
+            "r": result,
+            "d": int((time.time() - t0) * 1000),
+            "s": [[name, int((start - t0) * 1000), int((end - start) * 1000)] for name, start, end in spans],
+        }
+        if self._attrs:
+            record["a"] = self._attrs
+        field = f"{self._attrs.get('step_index', '-')}.{self._attrs.get('attempt', 0)}.{record['t']}"
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.hset(f"trace:{self.job_id}", field, json.dumps(record, separators=(",", ":")))
+            pipe.expire(f"trace:{self.job_id}", TRACE_TTL_S)
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning("could not store trace for job %s", self.job_id, exc_info=True)
+        if self.otlp_endpoint:
+            self._export(t0, record, spans)
+
+    def get(self, job_id: str) -> List[dict]:
+        """Stored runs for a job, oldest first."""
+        runs = []
+        for raw in r.hgetall(f"trace:{job_id}").values():
+            rec = json.loads(raw)
+            attrs = rec.get("a", {})
+            runs.append({
+                "step_index": attrs.get("step_index"),
+                "service": attrs.get("service"),
+                "attempt": attrs.get("attempt"),
+                "started_at": rec["t"] / 1000.0,
+                "result": rec["r"],
+                "total_ms": rec["d"],
+                "spans": [{"name": n, "offset_ms": o, "duration_ms": d} for n, o, d in rec["s"]],
+            })
+        return sorted(runs, key=lambda run: run["started_at"])
+
+    def _export(self, t0: float, record: dict, spans: List[tuple]):
+        trace_id = hashlib.md5(self.job_id.encode()).hexdigest()  # one trace per job
+        parent_id = os.urandom(8).hex()
+        attrs = [{"key": "job.id", "value": {"stringValue": self.job_id}}] + [
+            {"key": f"step.{k}", "value": {"stringValue": str(v)}} for k, v in record.get("a", {}).items()]
+
+        def _span(span_id, name, start, end, parent=None):
+            out = {"traceId": trace_id, "spanId": span_id, "name": name, "kind": 1,
+                   "startTimeUnixNano": str(int(start * 1e9)), "endTimeUnixNano": str(int(end * 1e9)),
+                   "attributes": attrs}
+            if parent:
+                out["parentSpanId"] = parent
+            return out
+
+        otlp_spans = [_span(parent_id, f"step {record.get('a', {}).get('service', '')}".strip(),
+                            t0, t0 + record["d"] / 1000.0)]
+        otlp_spans += [_span(os.urandom(8).hex(), name, start, end, parent_id) for name, start, end in spans]
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "cao-worker"}}]},
+            "scopeSpans": [{"scope": {"name": "cao"}, "spans": otlp_spans}],
+        }]}
+        try:
+            requests.post(self.otlp_endpoint, json=body, timeout=(0.5, 1.0))
+        except requests.RequestException:
+            logger.debug("OTLP export failed", exc_info=True)
@@ -1,9 +1,114 @@
 import json
-import redis
-from app.config import REDIS_URL
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+from redis.commands.core import Script
+from app.config import (EVENT_STREAM_MAXLEN, EVENT_STREAM_TTL_S, EVENT_STREAM_TERMINAL_TTL_S,
+                        WS_PUBLISH_MAX_BUFFER, WS_PUBLISH_SKIP_UNWATCHED)
+from app.core.redis_clients import get_redis
+from app.core.metrics import EVENT_PUBLISH_SECONDS, timed
+from app.models.enums import WebSocketEvent
+
+r = get_redis()
+
+# Append to the capped per-job stream and publish the event, tagged with its
+# stream id, in one round trip so stream order and live order always agree.
+# ARGV[5] == "0" keeps the event in the log without publishing it. The live
+# message is ARGV[6] .. id .. '"}' (see `_live_prefix`): the payload is not
+# re-encoded, as cjson would turn [] into {} and round floats.
+PUBLISH_LUA = """
+local id = redis.call("XADD", KEYS[1], "MAXLEN", "~", ARGV[1], "*", "data", ARGV[2])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+if ARGV[5] ~= "0" then
+    redis.call("PUBLISH", ARGV[4], ARGV[6] .. id .. '"}')
+end
+return id
+"""
+_publish_script = Script(r, PUBLISH_LUA.encode())  # bytes, so nothing connects at import
+
+
+def _live_prefix(data: str) -> str:
+    """
+    `data` (a json.dumps'd object) opened up to take `"event_id": "<id>"}` as
+    its last member, giving the same text the replay path builds with json.
+    """
+    return data[:-1] + ('"event_id": "' if data == "{}" else ', "event_id": "')
+
+
+def is_terminal(payload: dict) -> bool:
+    """True for events after which the job will not emit anything else on its own."""
+    t = payload.get("type")
+    if t in (WebSocketEvent.JOB_COMPLETE, WebSocketEvent.JOB_CANCELLED):
+        return True
+    return t == WebSocketEvent.ERROR and payload.get("action") != "RETRY_AVAILABLE"
 
-r = redis.from_url(REDIS_URL, decode_responses=True)
 
 class WSService:
-    def publish(self, job_id: str, payload: dict):
-        r.publish(f"ws:{job_id}", json.dumps(payload))
+    """
+    Job event publisher. Inside `buffered()` events are held and sent in order
+    through one pipeline on `flush()` (or when the block exits); callers flush
+    before anything that may block so clients are not kept waiting.
+    """
+
+    def __init__(self, skip_unwatched: bool = WS_PUBLISH_SKIP_UNWATCHED):
+        self.skip_unwatched = skip_unwatched
+        self._buffer: Optional[List[Tuple[str, str, int]]] = None
+
+    def publish(self, job_id: str, payload: dict, job=None) -> Optional[str]:
+        """Returns the event id, or None when buffered."""
+        if job is not None:
+            # lets filtered /ws subscriptions match on these without a DB lookup
+            payload = {**payload, "user_id": job.user_id, "feature_name": job.feature_name}
+        # terminal jobs keep their log only long enough for late clients to catch up
+        ttl = EVENT_STREAM_TERMINAL_TTL_S if is_terminal(payload) else EVENT_STREAM_TTL_S
+        event = (job_id, json.dumps(payload), ttl)
+
+        if self._buffer is None:
+            with timed(EVENT_PUBLISH_SECONDS):
+                return self._send([event], r)[0]
+        self._buffer.append(event)
+        if len(self._buffer) >= WS_PUBLISH_MAX_BUFFER:
+            self.flush()
+        return None
+
+    @contextmanager
+    def buffered(self):
+        if self._buffer is not None:
+            yield self  # nested: the outer block flushes
+            return
+        self._buffer = []
+        try:
+            yield self
+        finally:
+            try:
+                self.flush()
+            finally:
+                self._buffer = None
+
+    def flush(self):
+        if not self._buffer:
+            return
+        events, self._buffer = self._buffer, []
+        with timed(EVENT_PUBLISH_SECONDS):
+            pipe = r.pipeline(transaction=False)
+            self._send(events, pipe)
+            pipe.execute()
+
+    def _send(self, events: List[Tuple[str, str, int]], client) -> list:
+        watched = self._watched({job_id for job_id, _, _ in events}) if self.skip_unwatched else None
+        return [
+            _publish_script(keys=[f"events:{job_id}"],
+                            args=[EVENT_STREAM_MAXLEN, data, ttl, f"ws:{job_id}",
+                                  int(watched is None or job_id in watched), _live_prefix(data)],
+                            client=client)
+            for job_id, data, ttl in events
+        ]
+
+    def _watched(self, job_ids) -> set:
+        """Jobs with a live subscriber; anyone on a pattern counts as watching every job."""
+        pipe = r.pipeline(transaction=False)
+        pipe.pubsub_numpat()
+        pipe.pubsub_numsub(*(f"ws:{job_id}" for job_id in job_ids))
+        numpat, numsub = pipe.execute()
+        if numpat:
+            return set(job_ids)
+        return {channel[len("ws:"):] for channel, count in numsub if count}
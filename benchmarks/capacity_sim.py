@@ -0,0 +1,420 @@
+"""
+Offline capacity simulator: predict per-tier throughput, queue wait and
+starvation for a SERVICES/FEATURES/worker setup without touching production.
+
+A discrete-event replay of the parts that decide who waits:
+
+  - one Celery task per step, routed to the job's current priority queue;
+    worker pools consume fixed queues (default: the docker-compose topology)
+  - a worker holds its slot while it waits for a limiter lease (up to the
+    service `timeout`) and while the call runs; a lease timeout is a retryable
+    RESOURCE_EXHAUSTED failure with the orchestrator's backoff, failing the
+    job after `max_step_attempts`
+  - promote_waiting_jobs every `promote_interval` s: low -> medium and
+    medium -> high by age, re-queueing jobs whose first step has not started
+
+Not modelled: coalescing, batching (every call takes its own lease), service
+errors other than lease timeouts, and broker/DB overhead beyond `--set step_overhead_ms=...`.
+
+Inputs
+  arrivals   --rate/--duration with --features/--priorities mixes, a JSON-lines
+             trace ({"t": seconds, "feature": ..., "priority": ...}), or
+             --arrivals-from-db to replay recent job creations
+  latencies  --latencies file ({service: [ms, ...]}), --latencies-from-db
+             (execution_time_ms of recorded steps), else the fake-service defaults
+
+    python benchmarks/capacity_sim.py --rate 0.5 --duration 7200
+    python benchmarks/capacity_sim.py --latencies-from-db --arrivals-from-db --since 86400 \\
+        --sweep limit.image_gen=1,2,3 --sweep workers.low_priority=3,6 --sweep promote_low_to_medium=900,1800
+
+Sweep mode runs the cartesian product of --sweep values in parallel processes,
+all on the same arrivals and latency draws, and prints one summary line per config.
+"""
+import argparse
+import copy
+import heapq
+import itertools
+import json
+import math
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.config import (DATABASE_URL, FEATURES, SERVICES, PROMOTE_LOW_TO_MEDIUM_AFTER,  # noqa: E402
+                        PROMOTE_MEDIUM_TO_HIGH_AFTER, QUEUE_HIGH, QUEUE_MEDIUM, QUEUE_LOW,
+                        RETRY_BASE_DELAY_S, RETRY_MAX_DELAY_S)
+from app.services.http_service_client import service_replicas  # noqa: E402
+
+QUEUE_BY_PRIORITY = {"high": QUEUE_HIGH, "medium": QUEUE_MEDIUM, "low": QUEUE_LOW}
+TIERS = ("high", "medium", "low")
+PROMOTE_INTERVAL_S = 300.0  # beat schedule of promote_waiting_jobs
+
+# default fake-service latencies (median ms, sigma), matching benchmarks/fake_services.py
+DEFAULT_LATENCY = {"prompt_enhancer": (300, 0.3), "fast_chat_llm": (1500, 0.5),
+                   "image_gen": (6000, 0.4), "model_3d_gen": (12000, 0.4)}
+
+
+def default_config() -> dict:
+    return {
+        "limit": {name: sum(rep["limit"] for rep in service_replicas(conf)) for name, conf in SERVICES.items()},
+        "timeout": {name: conf["timeout"] for name, conf in SERVICES.items()},
+        "max_step_attempts": {name: conf["max_step_attempts"] for name, conf in SERVICES.items()},
+        # queues consumed by each pool -> concurrency (docker-compose.yml)
+        "workers": {QUEUE_HIGH: 5, QUEUE_MEDIUM: 5, QUEUE_LOW: 3},
+        "promote_low_to_medium": PROMOTE_LOW_TO_MEDIUM_AFTER,
+        "promote_medium_to_high": PROMOTE_MEDIUM_TO_HIGH_AFTER,
+        "promote_interval": PROMOTE_INTERVAL_S,
+        "retry_base": RETRY_BASE_DELAY_S,
+        "retry_max": RETRY_MAX_DELAY_S,
+        "step_overhead_ms": 20,
+        "starvation_s": PROMOTE_LOW_TO_MEDIUM_AFTER,
+    }
+
+
+class LatencyModel:
+    """Per-service call duration: resampled from recorded values, else lognormal."""
+
+    def __init__(self, samples: Optional[Dict[str, List[float]]] = None):
+        self.samples = {name: [ms / 1000.0 for ms in values] for name, values in (samples or {}).items() if values}
+
+    def draw(self, rng: random.Random, service: str) -> float:
+        if service in self.samples:
+            return rng.choice(self.samples[service])
+        median_ms, sigma = DEFAULT_LATENCY.get(service, (500, 0.3))
+        return rng.lognormvariate(math.log(median_ms / 1000.0), sigma)
+
+
+class _Job:
+    __slots__ = ("id", "feature", "priority", "original", "arrived", "step", "started", "retries",
+                 "queue_wait", "lease_wait", "max_queue_wait", "done_at", "failed")
+
+    def __init__(self, job_id: int, feature: str, priority: str, arrived: float):
+        self.id, self.feature, self.priority, self.original, self.arrived = job_id, feature, priority, priority, arrived
+        self.step = 0
+        self.started = False
+        self.retries = 0
+        self.queue_wait = self.lease_wait = self.max_queue_wait = 0.0
+        self.done_at: Optional[float] = None
+        self.failed = False
+
+
+class Simulation:
+    def __init__(self, config: dict, arrivals: List[Tuple[float, str, str]], latency: LatencyModel,
+                 seed: int = 0, horizon: Optional[float] = None):
+        self.c = config
+        self.arrivals = arrivals
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.horizon = horizon if horizon is not None else (arrivals[-1][0] if arrivals else 0) * 4 + 3600
+        self.now = 0.0
+        self._events: list = []
+        self._seq = itertools.count()
+
+        self.pools = [{"queues": [q.strip() for q in spec.split(",")], "idle": n, "size": n, "busy_s": 0.0}
+                      for spec, n in config["workers"].items()]
+        self.queues: Dict[str, deque] = {}
+        for pool in self.pools:
+            for q in pool["queues"]:
+                self.queues.setdefault(q, deque())
+        self.in_use = {name: 0 for name in SERVICES}
+        self.lease_busy_s = {name: 0.0 for name in SERVICES}
+        self.waiters: Dict[str, deque] = {name: deque() for name in SERVICES}
+        self.jobs: List[_Job] = []
+        self.promotions = 0
+
+    # --- event loop -------------------------------------------------------
+    def _at(self, t: float, fn, *args):
+        heapq.heappush(self._events, (t, next(self._seq), fn, args))
+
+    def run(self) -> dict:
+        for i, (t, feature, priority) in enumerate(self.arrivals):
+            self._at(t, self._arrive, i, feature, priority)
+        self._at(self.c["promote_interval"], self._promote)
+        while self._events:
+            t, _, fn, args = heapq.heappop(self._events)
+            if t > self.horizon:
+                break
+            self.now = t
+            fn(*args)
+        return self.summary()
+
+    # --- jobs and queues --------------------------------------------------
+    def _arrive(self, i: int, feature: str, priority: str):
+        job = _Job(i, feature, priority, self.now)
+        self.jobs.append(job)
+        self._enqueue(job)
+
+    def _enqueue(self, job: _Job):
+        queue = QUEUE_BY_PRIORITY[job.priority]
+        if queue not in self.queues:
+            raise ValueError(f"no worker pool consumes {queue}")
+        self.queues[queue].append((job, self.now))
+        self._dispatch()
+
+    def _dispatch(self):
+        for pool in self.pools:
+            while pool["idle"]:
+                queue = next((q for q in pool["queues"] if self.queues[q]), None)
+                if queue is None:
+                    break
+                job, ready_at = self.queues[queue].popleft()
+                pool["idle"] -= 1
+                wait = self.now - ready_at
+                job.queue_wait += wait
+                job.max_queue_wait = max(job.max_queue_wait, wait)
+                job.started = True
+                self._start_step(pool, job)
+
+    def _release_worker(self, pool: dict, since: float):
+        pool["idle"] += 1
+        pool["busy_s"] += self.now - since
+        self._dispatch()
+
+    # --- steps and the limiter --------------------------------------------
+    def _start_step(self, pool: dict, job: _Job):
+        service = FEATURES[job.feature][job.step]
+        started = self.now
+        if self.in_use[service] < self.c["limit"][service]:
+            self._run_call(pool, job, service, started, started)
+            return
+        waiter = {"pool": pool, "job": job, "since": started, "active": True}
+        self.waiters[service].append(waiter)
+        self._at(self.now + self.c["timeout"][service], self._lease_timeout, service, waiter)
+
+    def _run_call(self, pool: dict, job: _Job, service: str, started: float, waited_from: float):
+        self.in_use[service] += 1
+        job.lease_wait += self.now - waited_from
+        duration = self.latency.draw(self.rng, service) + self.c["step_overhead_ms"] / 1000.0
+        self._at(self.now + duration, self._call_done, pool, job, service, started, self.now)
+
+    def _call_done(self, pool: dict, job: _Job, service: str, started: float, leased_at: float):
+        self.in_use[service] -= 1
+        self.lease_busy_s[service] += self.now - leased_at
+        self._grant(service)
+        job.step += 1
+        job.retries = 0
+        if job.step >= len(FEATURES[job.feature]):
+            job.done_at = self.now
+        else:
+            self._enqueue(job)
+        self._release_worker(pool, started)
+
+    def _grant(self, service: str):
+        waiters = self.waiters[service]
+        while waiters and self.in_use[service] < self.c["limit"][service]:
+            waiter = waiters.popleft()
+            if waiter["active"]:
+                waiter["active"] = False
+                self._run_call(waiter["pool"], waiter["job"], service, waiter["since"], waiter["since"])
+
+    def _lease_timeout(self, service: str, waiter: dict):
+        if not waiter["active"]:
+            return
+        waiter["active"] = False
+        job = waiter["job"]
+        job.lease_wait += self.now - waiter["since"]
+        if job.retries < self.c["max_step_attempts"][service]:
+            cap = min(self.c["retry_max"], self.c["retry_base"] * (2 ** job.retries))
+            job.retries += 1
+            self._at(self.now + self.rng.uniform(self.c["retry_base"], max(self.c["retry_base"], cap)),
+                     self._enqueue, job)
+        else:
+            job.failed = True
+            job.done_at = self.now
+        self._release_worker(waiter["pool"], waiter["since"])
+
+    # --- promotion ---------------------------------------------------------
+    def _promote(self):
+        for job in self.jobs:
+            if job.done_at is not None:
+                continue
+            age = self.now - job.arrived
+            new = None
+            if job.priority == "low" and age > self.c["promote_low_to_medium"]:
+                new = "medium"
+            elif job.priority == "medium" and job.original != "high" and age > self.c["promote_medium_to_high"]:
+                new = "high"
+            if not new:
+                continue
+            self.promotions += 1
+            old_queue = self.queues[QUEUE_BY_PRIORITY[job.priority]]
+            job.priority = new
+            if not job.started:
+                for i, (queued, ready_at) in enumerate(old_queue):
+                    if queued is job:
+                        del old_queue[i]
+                        job.queue_wait += self.now - ready_at
+                        break
+                self._enqueue(job)
+        if len(self.jobs) < len(self.arrivals) or any(j.done_at is None for j in self.jobs):
+            self._at(self.now + self.c["promote_interval"], self._promote)
+
+    # --- report ------------------------------------------------------------
+    def summary(self) -> dict:
+        # up to the last completion, or the horizon if jobs were still running
+        unfinished = any(j.done_at is None for j in self.jobs)
+        span = max([self.now if unfinished else 0.0] + [j.done_at or 0.0 for j in self.jobs] + [1e-9])
+        tiers = {}
+        for tier in TIERS:
+            jobs = [j for j in self.jobs if j.original == tier]
+            if not jobs:
+                continue
+            done = [j for j in jobs if j.done_at is not None and not j.failed]
+            tiers[tier] = {
+                "jobs": len(jobs),
+                "completed": len(done),
+                "failed": sum(j.failed for j in jobs),
+                "unfinished": sum(j.done_at is None for j in jobs),
+                "jobs_per_hour": round(len(done) / span * 3600, 1),
+                "queue_wait_s": _quantiles([j.queue_wait for j in jobs]),
+                "lease_wait_s": _quantiles([j.lease_wait for j in jobs]),
+                "completion_s": _quantiles([j.done_at - j.arrived for j in done]),
+                # a single wait longer than the threshold, or still waiting at the end
+                "starved": sum(j.max_queue_wait > self.c["starvation_s"] or
+                               (j.done_at is None and self.now - j.arrived > self.c["starvation_s"])
+                               for j in jobs),
+            }
+        return {
+            "simulated_s": round(self.now, 1),
+            "tiers": tiers,
+            "promotions": self.promotions,
+            "worker_utilization": {",".join(p["queues"]): round(p["busy_s"] / (p["size"] * span), 3)
+                                   for p in self.pools},
+            "lease_utilization": {name: round(busy / (self.c["limit"][name] * span), 3)
+                                  for name, busy in self.lease_busy_s.items() if self.c["limit"][name]},
+        }
+
+
+def _quantiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[max(0, math.ceil(q * len(ordered)) - 1)], 1)  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 1)}
+
+
+# --- inputs -----------------------------------------------------------------
+def poisson_arrivals(rng: random.Random, rate: float, duration: float,
+                     features: Dict[str, float], priorities: Dict[str, float]) -> List[Tuple[float, str, str]]:
+    out, t = [], rng.expovariate(rate)
+    while t < duration:
+        out.append((t, rng.choices(list(features), list(features.values()))[0],
+                    rng.choices(list(priorities), list(priorities.values()))[0]))
+        t += rng.expovariate(rate)
+    return out
+
+
+def load_arrivals(path: str) -> List[Tuple[float, str, str]]:
+    rows = [json.loads(line) for line in Path(path).read_text().splitlines() if line.strip()]
+    t0 = min((row["t"] for row in rows), default=0)
+    return sorted((row["t"] - t0, row["feature"], row.get("priority", "medium")) for row in rows)
+
+
+def arrivals_from_db(dsn: str, since_s: float) -> List[Tuple[float, str, str]]:
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute("SELECT created_at, feature_name, original_priority FROM job "
+                    "WHERE created_at > extract(epoch from now()) - %s ORDER BY created_at", (since_s,))
+        rows = [row for row in cur.fetchall() if row[1] in FEATURES]
+    t0 = rows[0][0] if rows else 0
+    return [(created - t0, feature, priority or "medium") for created, feature, priority in rows]
+
+
+def latencies_from_db(dsn: str, limit: int = 5000) -> Dict[str, List[float]]:
+    """execution_time_ms of recorded steps, per service."""
+    import psycopg2
+    out: Dict[str, List[float]] = {}
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute("SELECT context FROM job WHERE status = 'COMPLETED' ORDER BY updated_at DESC LIMIT %s", (limit,))
+        for (context,) in cur.fetchall():
+            for key, value in (context or {}).items():
+                if not key.startswith("step_") or "__" in key or not isinstance(value, dict):
+                    continue
+                service = key.split("_", 2)[2]
+                ms = (value.get("metrics") or {}).get("execution_time_ms")
+                if service in SERVICES and ms is not None and not value["metrics"].get("coalesced_from"):
+                    out.setdefault(service, []).append(float(ms))
+    return out
+
+
+def apply_override(config: dict, key: str, value):
+    """`limit.image_gen=2`, `workers.low_priority=6`, `promote_low_to_medium=900`."""
+    head, _, rest = key.partition(".")
+    if head not in config:
+        raise KeyError(f"unknown setting {key}")
+    if rest:
+        config[head][rest] = value
+    else:
+        config[head] = value
+
+
+def _run_one(args: tuple) -> dict:
+    overrides, config, arrivals, samples, seed, horizon = args
+    config = copy.deepcopy(config)
+    for key, value in overrides.items():
+        apply_override(config, key, value)
+    return {"overrides": overrides, **Simulation(config, arrivals, LatencyModel(samples), seed, horizon).run()}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    out = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        out[name.strip()] = float(weight or 1)
+    return out
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rate", type=float, default=0.5, help="jobs per second (generated arrivals)")
+    p.add_argument("--duration", type=float, default=3600.0, help="seconds of generated arrivals")
+    p.add_argument("--features", default=",".join(f"{name}=1" for name in FEATURES))
+    p.add_argument("--priorities", default="high=1,medium=1,low=1")
+    p.add_argument("--arrivals", help="JSON-lines arrival trace")
+    p.add_argument("--arrivals-from-db", action="store_true")
+    p.add_argument("--since", type=float, default=86400.0, help="seconds of history for --arrivals-from-db")
+    p.add_argument("--latencies", help="JSON file {service: [ms, ...]}")
+    p.add_argument("--latencies-from-db", action="store_true")
+    p.add_argument("--database-url", default=DATABASE_URL)
+    p.add_argument("--set", action="append", default=[], metavar="KEY=JSON", help="override one setting")
+    p.add_argument("--sweep", action="append", default=[], metavar="KEY=V1,V2,...")
+    p.add_argument("--horizon", type=float, help="stop simulating at this time (default: well past the last arrival)")
+    p.add_argument("--processes", type=int)
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.arrivals:
+        arrivals = load_arrivals(args.arrivals)
+    elif args.arrivals_from_db:
+        arrivals = arrivals_from_db(args.database_url, args.since)
+    else:
+        arrivals = poisson_arrivals(rng, args.rate, args.duration, parse_mix(args.features), parse_mix(args.priorities))
+    samples = (json.loads(Path(args.latencies).read_text()) if args.latencies
+               else latencies_from_db(args.database_url) if args.latencies_from_db else None)
+
+    config = default_config()
+    for item in args.set:
+        key, value = item.split("=", 1)
+        apply_override(config, key, json.loads(value))
+
+    if not args.sweep:
+        print(json.dumps(_run_one(({}, config, arrivals, samples, args.seed, args.horizon)), indent=2))
+        return
+
+    axes = []
+    for item in args.sweep:
+        key, values = item.split("=", 1)
+        axes.append([(key, json.loads(v)) for v in values.split(",")])
+    runs = [(dict(combo), config, arrivals, samples, args.seed, args.horizon) for combo in itertools.product(*axes)]
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        for result in pool.map(_run_one, runs):
+            print(json.dumps(result, separators=(",", ":")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Simulated AI backends for load tests: one fake per SERVICES entry plus the priority API.
+
+Each fake serves /health, its execute path and (for batching services) its
+batch path on its own port, starting at --base-port in SERVICES order, with the
+priority API on the next port. Per service, from the profile file:
+
+  latency_ms     {"median": ..., "sigma": ...}  lognormal service time per call
+                 (a batch call takes one draw plus `batch_item_ms` per extra item)
+  capacity       calls served at once; more get a 429 like a saturated GPU box
+  p_429, p_503   chance of answering 429 (with Retry-After) / 503
+  p_timeout      chance of hanging for `hang_s` (set it above the worker's read timeout)
+
+Missing keys fall back to DEFAULT_PROFILE; --set overrides single keys:
+
+    python benchmarks/fake_services.py --profile profile.json \\
+        --set image_gen.latency_ms.median=8000 --set fast_chat_llm.p_429=0.05
+
+The priority API answers with the tier embedded in the user id
+(`bench-high-17` -> high, anything else -> medium), so the driver controls the mix.
+On startup the env for the API and workers is printed (PROMPT_ENHANCER_URL=...).
+"""
+import argparse
+import asyncio
+import copy
+import json
+import math
+import random
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.config import SERVICES  # noqa: E402
+
+DEFAULT_PROFILE: Dict[str, Dict[str, Any]] = {
+    "prompt_enhancer": {"latency_ms": {"median": 300, "sigma": 0.3}, "capacity": 16, "batch_item_ms": 20},
+    "fast_chat_llm": {"latency_ms": {"median": 1500, "sigma": 0.5}, "capacity": 8, "batch_item_ms": 100},
+    "image_gen": {"latency_ms": {"median": 6000, "sigma": 0.4}, "capacity": 2},
+    "model_3d_gen": {"latency_ms": {"median": 12000, "sigma": 0.4}, "capacity": 2},
+}
+DEFAULT_KEYS = {"latency_ms": {"median": 500, "sigma": 0.3}, "capacity": 8, "batch_item_ms": 0,
+                "p_429": 0.0, "p_503": 0.0, "p_timeout": 0.0, "hang_s": 60, "retry_after_s": 1}
+
+# service name -> env var the API and workers read its URL from
+URL_ENV = {name: f"{name.upper()}_URL" for name in SERVICES}
+
+
+def load_profile(path: str = None, overrides=()) -> Dict[str, Dict[str, Any]]:
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    if path:
+        for name, conf in json.loads(Path(path).read_text()).items():
+            profile.setdefault(name, {}).update(conf)
+    for item in overrides:
+        key, value = item.split("=", 1)
+        *parents, leaf = key.split(".")
+        node = profile
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = json.loads(value)
+    return {name: {**copy.deepcopy(DEFAULT_KEYS), **profile.get(name, {})} for name in SERVICES}
+
+
+def _latency_s(conf: dict) -> float:
+    lat = conf["latency_ms"]
+    return random.lognormvariate(math.log(lat["median"] / 1000.0), lat.get("sigma", 0.0))
+
+
+def _output(name: str, envelope: dict) -> dict:
+    meta = envelope.get("meta", {})
+    return {"status": "SUCCESS",
+            "data": {"text": f"{name} output for {meta.get('job_id')}#{meta.get('step_index')}"},
+            "metrics": {"fake": True}}
+
+
+def make_service_app(name: str, conf: dict) -> FastAPI:
+    app = FastAPI()
+    app.state.stats = {"calls": 0, "ok": 0, "429": 0, "503": 0, "timeout": 0, "busy": 0}
+    in_flight = 0
+    stats = app.state.stats
+
+    async def serve(run_s: float, body):
+        nonlocal in_flight
+        stats["calls"] += 1
+        roll = random.random()
+        if in_flight >= conf["capacity"]:
+            stats["busy"] += 1
+            return JSONResponse({"status": "FAILED", "error": {"code": "BUSY", "message": "at capacity"}},
+                                status_code=429, headers={"Retry-After": str(conf["retry_after_s"])})
+        if roll < conf["p_429"]:
+            stats["429"] += 1
+            return JSONResponse({"status": "FAILED", "error": {"code": "RATE_LIMITED", "message": "slow down"}},
+                                status_code=429, headers={"Retry-After": str(conf["retry_after_s"])})
+        roll -= conf["p_429"]
+        if roll < conf["p_503"]:
+            stats["503"] += 1
+            return JSONResponse({"status": "FAILED", "error": {"code": "UNAVAILABLE", "message": "overloaded"}},
+                                status_code=503)
+        roll -= conf["p_503"]
+        in_flight += 1
+        try:
+            if roll < conf["p_timeout"]:
+                stats["timeout"] += 1
+                await asyncio.sleep(conf["hang_s"])
+            else:
+                await asyncio.sleep(run_s)
+                stats["ok"] += 1
+        finally:
+            in_flight -= 1
+        return body
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True, "in_flight": in_flight, **stats}
+
+    @app.post(SERVICES[name]["execute_path"])
+    async def execute(request: Request):
+        envelope = await request.json()
+        return await serve(_latency_s(conf), _output(name, envelope))
+
+    batching = SERVICES[name].get("batching")
+    if batching:
+        @app.post(batching["execute_path"])
+        async def execute_batch(request: Request):
+            items = (await request.json())["items"]
+            run_s = _latency_s(conf) + conf["batch_item_ms"] / 1000.0 * max(0, len(items) - 1)
+            return await serve(run_s, {"status": "SUCCESS", "results": [_output(name, e) for e in items]})
+
+    return app
+
+
+def make_priority_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/users/{user_id}/priority")
+    async def priority(user_id: str):
+        parts = user_id.split("-")
+        tier = parts[1] if len(parts) > 2 and parts[1] in ("high", "medium", "low") else "medium"
+        return {"priority": tier}
+
+    return app
+
+
+async def serve_all(profile: dict, host: str, base_port: int):
+    servers, env = [], {}
+    for i, name in enumerate(SERVICES):
+        port = base_port + i
+        servers.append(uvicorn.Server(uvicorn.Config(make_service_app(name, profile[name]), host=host,
+                                                     port=port, log_level="warning")))
+        env[URL_ENV[name]] = f"http://{host}:{port}"
+    port = base_port + len(SERVICES)
+    servers.append(uvicorn.Server(uvicorn.Config(make_priority_app(), host=host, port=port, log_level="warning")))
+    env["PRIORITY_API_URL"] = f"http://{host}:{port}"
+
+    for key, value in env.items():
+        print(f"export {key}={value}")
+    sys.stdout.flush()
+    await asyncio.gather(*(s.serve() for s in servers))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--profile", help="JSON file: {service: {latency_ms: {...}, capacity: ..., p_429: ...}}")
+    p.add_argument("--set", action="append", default=[], metavar="SERVICE.KEY=JSON")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--base-port", type=int, default=9300)
+    p.add_argument("--seed", type=int)
+    args = p.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    asyncio.run(serve_all(load_profile(args.profile, args.set), args.host, args.base_port))
@@ -0,0 +1,219 @@
+"""
+End-to-end throughput benchmark: drive POST /api/v1/jobs at a target rate and
+measure how the whole system (API, workers, limiter, Redis, Postgres) keeps up.
+
+Start Redis/Postgres, the fakes, then the API and workers with the printed env
+(the workers' --concurrency and SERVICES limits are what you are tuning):
+
+    python benchmarks/fake_services.py > /tmp/fakes.env &
+    set -a; . /tmp/fakes.env; set +a
+    uvicorn app.main:app --port 8000 &
+    celery -A app.celery_app.celery_app worker -Q high_priority,medium_priority,low_priority,maintenance --concurrency=16 &
+    python -m worker.outbox_relay &
+    python benchmarks/loadtest.py --rate 5 --duration 120 \\
+        --features full_pipeline=1,text_only=3 --priorities high=1,medium=2,low=2
+
+Jobs arrive as a Poisson process. After the submit window the driver waits
+(up to --drain) for them to finish, then prints a JSON report:
+
+  - submitted/completed/failed counts and completed jobs/sec
+  - p50/p95/p99 completion time (submit -> COMPLETED) per original priority tier
+  - lease utilization per limiter slot (mean/max leases held over limit, sampled)
+  - Redis commands run (INFO commandstats delta, top commands)
+  - Postgres commits and row operations (pg_stat_database delta)
+
+Redis and Postgres counters are server-wide, so run it on an otherwise idle box.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import psycopg2
+import redis
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.config import DATABASE_URL, FEATURES, REDIS_URL, SERVICES  # noqa: E402
+from app.services.http_service_client import service_replicas  # noqa: E402
+from app.services.limiter_service import LimiterService  # noqa: E402
+
+TERMINAL = ("COMPLETED", "FAILED", "CANCELLED")
+PG_COUNTERS = ("xact_commit", "xact_rollback", "tup_inserted", "tup_updated", "tup_fetched", "tup_returned")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """"a=1,b=3" -> weights."""
+    out = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        out[name.strip()] = float(weight or 1)
+    return out
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+
+def redis_commandstats(client) -> Dict[str, int]:
+    return {name: int(stats["calls"]) for name, stats in client.info("commandstats").items()}
+
+
+def pg_counters(dsn: str) -> Dict[str, int]:
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(PG_COUNTERS)} FROM pg_stat_database WHERE datname = current_database()")
+        return dict(zip(PG_COUNTERS, cur.fetchone()))
+
+
+def job_rows(dsn: str, job_ids: List[str]) -> Dict[str, tuple]:
+    out = {}
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        for i in range(0, len(job_ids), 1000):
+            cur.execute("SELECT id, status, updated_at FROM job WHERE id = ANY(%s)", (job_ids[i:i + 1000],))
+            out.update({row[0]: row[1:] for row in cur.fetchall()})
+    return out
+
+
+class LeaseSampler:
+    """Samples leases held per limiter slot against its limit."""
+
+    def __init__(self, client):
+        self.client = client
+        limiter = LimiterService()
+        self.slots = [(slot, rep["limit"])
+                      for name, conf in SERVICES.items()
+                      for slot, rep in zip(limiter.slots(name, service_replicas(conf)), service_replicas(conf))]
+        self.samples: Dict[str, List[float]] = {slot: [] for slot, _ in self.slots}
+
+    def sample(self):
+        values = self.client.mget([f"conc:{slot}" for slot, _ in self.slots])
+        for (slot, limit), cur in zip(self.slots, values):
+            self.samples[slot].append(min(float(cur or 0), limit) / limit)
+
+    def report(self) -> Dict[str, dict]:
+        return {slot: {"mean": round(sum(v) / len(v), 3) if v else None, "max": round(max(v), 3) if v else None}
+                for slot, v in self.samples.items()}
+
+
+async def submit(http: httpx.AsyncClient, feature: str, priority: str, submitted: dict, errors: list):
+    user_id = f"bench-{priority}-{uuid.uuid4().hex[:8]}"
+    t = time.time()
+    try:
+        resp = await http.post("/api/v1/jobs", json={"feature_name": feature, "user_id": user_id,
+                                                     "input_data": {"prompt": f"bench {uuid.uuid4().hex}"}})
+        resp.raise_for_status()
+        submitted[resp.json()["job_id"]] = (priority, feature, t)
+    except httpx.HTTPError as e:
+        errors.append(str(e))
+
+
+async def run(args) -> dict:
+    features, priorities = parse_mix(args.features), parse_mix(args.priorities)
+    rng = random.Random(args.seed)
+    rc = redis.from_url(args.redis_url, decode_responses=True)
+    dsn = args.database_url
+    leases = LeaseSampler(rc)
+    redis_before, pg_before = redis_commandstats(rc), pg_counters(dsn)
+
+    submitted: Dict[str, tuple] = {}
+    errors: List[str] = []
+
+    async def sample_leases(stop: asyncio.Event):
+        while not stop.is_set():
+            await asyncio.to_thread(leases.sample)
+            try:
+                await asyncio.wait_for(stop.wait(), args.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_leases(stop))
+    t0 = time.time()
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=30,
+                                 limits=httpx.Limits(max_connections=args.max_in_flight)) as http:
+        tasks = []
+        next_at = t0
+        while next_at < t0 + args.duration:
+            await asyncio.sleep(max(0.0, next_at - time.time()))
+            feature = rng.choices(list(features), list(features.values()))[0]
+            priority = rng.choices(list(priorities), list(priorities.values()))[0]
+            tasks.append(asyncio.create_task(submit(http, feature, priority, submitted, errors)))
+            next_at += rng.expovariate(args.rate)
+        await asyncio.gather(*tasks)
+    submit_s = time.time() - t0
+
+    # wait for the backlog to drain
+    rows: Dict[str, tuple] = {}
+    deadline = time.time() + args.drain
+    while time.time() < deadline:
+        rows = await asyncio.to_thread(job_rows, dsn, list(submitted))
+        if all(status in TERMINAL for status, _ in rows.values()) and len(rows) == len(submitted):
+            break
+        await asyncio.sleep(args.poll_interval)
+    stop.set()
+    await sampler
+    elapsed = time.time() - t0
+
+    redis_after, pg_after = redis_commandstats(rc), pg_counters(dsn)
+    redis_delta = {k: v - redis_before.get(k, 0) for k, v in redis_after.items() if v - redis_before.get(k, 0)}
+
+    latencies: Dict[str, List[float]] = {tier: [] for tier in priorities}
+    completed = failed = 0
+    last_done = t0
+    for job_id, (priority, _, t_submit) in submitted.items():
+        status, updated_at = rows.get(job_id, (None, None))
+        if status == "COMPLETED":
+            completed += 1
+            latencies[priority].append(updated_at - t_submit)
+            last_done = max(last_done, updated_at)
+        elif status in TERMINAL:
+            failed += 1
+
+    return {
+        "config": {"rate": args.rate, "duration_s": args.duration, "features": features, "priorities": priorities},
+        "submitted": len(submitted),
+        "submit_errors": len(errors),
+        "completed": completed,
+        "failed": failed,
+        "unfinished": len(submitted) - completed - failed,
+        "submit_seconds": round(submit_s, 1),
+        "elapsed_seconds": round(elapsed, 1),
+        "jobs_per_sec": round(completed / max(last_done - t0, 1e-9), 3),
+        "completion_seconds": {
+            tier: {"n": len(v), "p50": round(percentile(v, 50), 2), "p95": round(percentile(v, 95), 2),
+                   "p99": round(percentile(v, 99), 2)}
+            for tier, v in latencies.items()
+        },
+        "lease_utilization": leases.report(),
+        "redis": {"commands": sum(redis_delta.values()),
+                  "per_job": round(sum(redis_delta.values()) / max(len(submitted), 1), 1),
+                  "top": dict(sorted(redis_delta.items(), key=lambda kv: -kv[1])[:args.top])},
+        "postgres": {k: pg_after[k] - pg_before[k] for k in PG_COUNTERS},
+    }
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--api-url", default="http://localhost:8000")
+    p.add_argument("--redis-url", default=REDIS_URL)
+    p.add_argument("--database-url", default=DATABASE_URL)
+    p.add_argument("--rate", type=float, default=2.0, help="job submissions per second")
+    p.add_argument("--duration", type=float, default=60.0, help="seconds to keep submitting")
+    p.add_argument("--drain", type=float, default=600.0, help="max seconds to wait for jobs to finish")
+    p.add_argument("--features", default=",".join(f"{name}=1" for name in FEATURES))
+    p.add_argument("--priorities", default="high=1,medium=1,low=1")
+    p.add_argument("--max-in-flight", type=int, default=100, help="concurrent submit requests")
+    p.add_argument("--sample-interval", type=float, default=0.5, help="seconds between lease samples")
+    p.add_argument("--poll-interval", type=float, default=2.0)
+    p.add_argument("--top", type=int, default=15, help="Redis commands to list")
+    p.add_argument("--seed", type=int)
+    print(json.dumps(asyncio.run(run(p.parse_args())), indent=2))
@@ -0,0 +1,65 @@
+"""
+Startup cost per process type: import time and peak RSS after import.
+
+Each role is imported in a fresh interpreter (best of --runs):
+
+  api     app.main (what uvicorn loads)
+  worker  app.celery_app + worker.tasks (every worker queue runs the same code;
+          --concurrency multiplies the child RSS)
+  beat    app.celery_app
+
+Also lists heavy modules a role pulls in that it shouldn't (e.g. worker.tasks
+in the API). Nothing connects to Redis or Postgres during import, so no
+services are needed:
+
+    python benchmarks/startup_cost.py --runs 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+ROLES = {
+    "api": ["app.main"],
+    "worker": ["app.celery_app", "worker.tasks"],
+    "beat": ["app.celery_app"],
+}
+WATCH = ["worker.tasks", "app.services.orchestrator_service", "app.services.batching_service"]
+
+PROBE = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "import_s": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    "modules": len(sys.modules),
+    "loaded": [m for m in {watch!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(modules, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(modules=modules, watch=WATCH)],
+                             cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    best = min(samples, key=lambda s: s["import_s"])
+    return {"import_s": round(best["import_s"], 3),
+            "max_rss_mb": round(max(s["max_rss_mb"] for s in samples), 1),
+            "modules": best["modules"],
+            "unexpected": best["loaded"] if modules == ROLES["api"] else []}
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--role", action="append", choices=sorted(ROLES))
+    args = p.parse_args()
+    print(json.dumps({role: measure(ROLES[role], args.runs) for role in (args.role or ROLES)}, indent=2))
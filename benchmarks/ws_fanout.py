@@ -0,0 +1,104 @@
+"""
+WebSocket fan-out benchmark: API memory and Redis connections at N open sockets.
+
+Opens N sockets to /ws/{job_id} against a running API, holds them, publishes
+one event per job and reports:
+  - API process RSS before and with all sockets open (from /proc/<pid>/status)
+  - Redis connected_clients before and with all sockets open
+  - how many sockets received their event
+
+Run it once on a build before the shared subscriber and once after:
+
+    ulimit -n 65536
+    uvicorn app.main:app --port 8000 &
+    python benchmarks/ws_fanout.py --sockets 10000 --api-pid $!
+
+Use a single uvicorn worker so RSS refers to one process.
+"""
+import argparse
+import asyncio
+import json
+import time
+import redis.asyncio as aioredis
+import websockets
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return float("nan")
+
+
+async def redis_clients(r) -> int:
+    info = await r.info("clients")
+    return int(info["connected_clients"])
+
+
+async def open_socket(url: str, sem: asyncio.Semaphore, sockets: list):
+    async with sem:
+        ws = await websockets.connect(url, open_timeout=60, max_queue=4)
+        await ws.recv()  # WS_CONNECTED
+        sockets.append(ws)
+
+
+async def main(args):
+    r = aioredis.from_url(args.redis_url, decode_responses=True)
+    base_clients = await redis_clients(r)
+    base_rss = rss_mb(args.api_pid) if args.api_pid else float("nan")
+
+    job_ids = [f"bench-{i}" for i in range(args.sockets // args.per_job)]
+    urls = [f"{args.api_url}/ws/{job_ids[i % len(job_ids)]}" for i in range(args.sockets)]
+
+    sockets: list = []
+    sem = asyncio.Semaphore(args.connect_concurrency)
+    t0 = time.time()
+    await asyncio.gather(*(open_socket(u, sem, sockets) for u in urls))
+    connect_s = time.time() - t0
+    await asyncio.sleep(args.settle)
+
+    open_clients = await redis_clients(r)
+    open_rss = rss_mb(args.api_pid) if args.api_pid else float("nan")
+
+    pipe = r.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.publish(f"ws:{job_id}", json.dumps({"type": "BENCH", "job_id": job_id}))
+    await pipe.execute()
+
+    async def recv_one(ws):
+        try:
+            await asyncio.wait_for(ws.recv(), timeout=args.recv_timeout)
+            return 1
+        except Exception:
+            return 0
+    received = sum(await asyncio.gather(*(recv_one(ws) for ws in sockets)))
+
+    await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+    await r.close()
+
+    print(json.dumps({
+        "sockets": len(sockets),
+        "jobs": len(job_ids),
+        "connect_seconds": round(connect_s, 2),
+        "redis_clients_before": base_clients,
+        "redis_clients_open": open_clients,
+        "redis_clients_added": open_clients - base_clients,
+        "api_rss_mb_before": round(base_rss, 1),
+        "api_rss_mb_open": round(open_rss, 1),
+        "api_rss_kb_per_socket": round((open_rss - base_rss) * 1024 / max(len(sockets), 1), 2),
+        "events_received": received,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--api-url", default="ws://localhost:8000")
+    p.add_argument("--redis-url", default="redis://localhost:6379/0")
+    p.add_argument("--api-pid", type=int, help="uvicorn process id, for RSS")
+    p.add_argument("--sockets", type=int, default=10000)
+    p.add_argument("--per-job", type=int, default=1, help="sockets watching the same job")
+    p.add_argument("--connect-concurrency", type=int, default=200)
+    p.add_argument("--settle", type=float, default=2.0)
+    p.add_argument("--recv-timeout", type=float, default=10.0)
+    asyncio.run(main(p.parse_args()))
@@ -44,6 +44,13 @@ run_migrations_as_user() {
     return 1
 }
 
+# Prometheus multiprocess mode (Celery workers): start each container with an empty, writable dir
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    chmod 777 "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 if [ -d /app ]; then
     cd /app
     app_uid="$(stat -c '%u' /app)"
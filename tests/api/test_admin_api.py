@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+from app.models.enums import JobStatus
+from app.repositories.job_repository import JobRepository
+
+
+def _failed_at_image_gen(session, job_id):
+    repo = JobRepository(session)
+    job = repo.create(job_id, "full_pipeline", {})
+    job.current_step_index = 2
+    repo.fail(job, "RESOURCE_EXHAUSTED", "busy", True)
+
+
+def test_bulk_resume_parks_matching_failures(client: TestClient, session):
+    _failed_at_image_gen(session, "job-a")
+    _failed_at_image_gen(session, "job-b")
+
+    dry = client.post("/api/v1/admin/jobs/resume", json={"service": "image_gen", "dry_run": True})
+    assert dry.json() == {"service": "image_gen", "matched": 2, "dry_run": True}
+
+    response = client.post("/api/v1/admin/jobs/resume", json={"service": "image_gen"})
+    assert response.status_code == 200
+    assert response.json()["parked"] == 2
+    session.expire_all()
+    assert JobRepository(session).get("job-a").status == JobStatus.WAITING_RETRY
+
+
+def test_bulk_resume_rejects_unknown_service(client: TestClient):
+    response = client.post("/api/v1/admin/jobs/resume", json={"service": "nope"})
+    assert response.status_code == 400
@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+
+def test_config_update_returns_new_version(client: TestClient, mocker):
+    from app.services import config_service
+    mocker.patch.object(config_service, "_current", config_service._BASELINE)
+    config_service.r.eval.return_value = 4
+    config_service.r.hmget.return_value = ["4", '{"services": {"image_gen": {"limit": 2}}}']
+
+    response = client.put("/api/v1/config", json={"services": {"image_gen": {"limit": 2}}})
+
+    assert response.status_code == 200
+    assert response.json()["version"] == 4
+    assert config_service.current().services["image_gen"]["limit"] == 2
+    assert client.put("/api/v1/config", json={"services": {"image_gen": {"limit": 0}}}).status_code == 422
+
+
+def test_config_update_rejects_malformed_nested_overrides(client: TestClient):
+    bad_batching = {"services": {"prompt_enhancer": {"batching": {"max_batch_size": -1}}}}
+    bad_replicas = {"services": {"image_gen": {"base_url": [{"url": "http://ig-1:9000", "limit": "2"}]}}}
+
+    assert client.put("/api/v1/config", json=bad_batching).status_code == 422
+    assert client.put("/api/v1/config", json=bad_replicas).status_code == 422
@@ -16,3 +16,33 @@ def test_health_services_endpoint(client: TestClient, requests_mock):
     for service_name in SERVICES.keys():
         assert payload[service_name]["ok"] is True
         assert payload[service_name]["status_code"] == 200
+
+
+def test_health_services_reports_circuit_state(client: TestClient, requests_mock, mocker):
+    for service_name, conf in SERVICES.items():
+        url = conf["base_url"].rstrip("/") + conf.get("health_path", "/health")
+        requests_mock.get(url, status_code=200)
+    mocker.patch("app.routers.health.CircuitBreakerService.state",
+                 side_effect=lambda name: {"state": "OPEN" if name == "fast_chat_llm" else "CLOSED", "failures": 0})
+
+    payload = client.get("/api/v1/health/services").json()
+
+    assert payload["fast_chat_llm"]["circuit"]["state"] == "OPEN"
+    assert payload["image_gen"]["circuit"]["state"] == "CLOSED"
+
+
+def test_health_ws_reports_counters(client: TestClient):
+    payload = client.get("/api/v1/health/ws").json()
+    assert set(payload) == {"subscribers", "events_conflated", "events_dropped", "slow_disconnects"}
+
+
+def test_health_services_served_from_cache(client: TestClient, requests_mock, mocker):
+    cached = {name: {"ok": name != "image_gen", "latency_ms": 5, "checked_at": 1.0} for name in SERVICES}
+    mocker.patch("app.routers.health.HealthService.cached", return_value=cached)
+    mocker.patch("app.routers.health.CircuitBreakerService.state", return_value={"state": "CLOSED", "failures": 0})
+
+    payload = client.get("/api/v1/health/services").json()
+
+    assert not requests_mock.called
+    assert payload["image_gen"]["ok"] is False
+    assert payload["fast_chat_llm"]["latency_ms"] == 5
@@ -44,3 +44,58 @@ def test_resume_job_success(client: TestClient):
     assert payload["job_id"] == job_id
     assert payload["new_status"] == "RUNNING"
     assert payload["resuming_from_step"] == "prompt_enhancer"
+
+
+def test_cancel_job_not_found(client: TestClient):
+    response = client.post("/api/v1/jobs/missing-job/cancel")
+    assert response.status_code == 404
+
+
+def test_cancel_job_revokes_and_signals(client: TestClient, session, mocker):
+    from app.repositories.job_repository import JobRepository
+    request = mocker.patch("app.routers.jobs.CancellationService.request")
+    JobRepository(session).create("job-c", "full_pipeline", {})
+
+    response = client.post("/api/v1/jobs/job-c/cancel")
+
+    assert response.status_code == 200
+    assert response.json()["new_status"] == "CANCELLED"
+    assert JobRepository(session).get("job-c").status == "CANCELLED"
+    request.assert_called_once_with("job-c")
+
+
+def test_resume_after_cancel_clears_cancel_flag(client: TestClient, session):
+    from app.repositories.job_repository import JobRepository
+    from app.services import cancellation_service
+    repo = JobRepository(session)
+    repo.cancel(repo.create("job-r", "full_pipeline", {}))
+
+    response = client.post("/api/v1/jobs/job-r/resume")
+
+    assert response.status_code == 200
+    assert response.json()["previous_status"] == "CANCELLED"
+    cancellation_service.r.delete.assert_called_once_with("cancel:job-r", "job:task:job-r")
+
+
+def test_cancel_completed_job_conflicts(client: TestClient, session):
+    from app.models.enums import JobStatus
+    from app.repositories.job_repository import JobRepository
+    repo = JobRepository(session)
+    repo.set_status(repo.create("job-d", "full_pipeline", {}), JobStatus.COMPLETED)
+
+    assert client.post("/api/v1/jobs/job-d/cancel").status_code == 409
+
+
+def test_job_events_not_found(client: TestClient):
+    response = client.get("/api/v1/jobs/missing-job/events")
+    assert response.status_code == 404
+
+
+def test_job_trace(client: TestClient, session):
+    from app.repositories.job_repository import JobRepository
+    JobRepository(session).create("job-t", "full_pipeline", {})
+
+    assert client.get("/api/v1/jobs/missing-job/trace").status_code == 404
+    response = client.get("/api/v1/jobs/job-t/trace")
+    assert response.status_code == 200
+    assert response.json()["steps"] == []
@@ -0,0 +1,21 @@
+from unittest.mock import AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+
+
+def _subscribe(client: TestClient, headers=None) -> dict:
+    with client.websocket_connect("/ws", headers=headers or {}) as ws:
+        assert ws.receive_json()["type"] == "WS_CONNECTED"
+        ws.send_json({"action": "subscribe", "feature_name": "full_pipeline"})
+        return ws.receive_json()
+
+
+def test_filter_subscription_requires_internal_key(client: TestClient, mocker):
+    mocker.patch("app.routers.config.INTERNAL_API_KEY", "secret")
+    hub = mocker.patch("app.routers.websocket.hub", MagicMock(psubscribe=AsyncMock(), punsubscribe=AsyncMock()))
+
+    reply = _subscribe(client)
+    assert reply["type"] == "ERROR"
+    hub.psubscribe.assert_not_awaited()
+
+    assert _subscribe(client, {"X-Internal-Key": "secret"})["type"] == "SUBSCRIBED"
+    hub.psubscribe.assert_awaited_once()
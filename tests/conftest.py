@@ -5,6 +5,7 @@ from starlette.testclient import TestClient
 from app.main import app
 from app.dependencies import get_session
 from app.celery_app import celery_app
+from app.config import SERVICES
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -15,6 +16,14 @@ def session_fixture():
     with Session(engine) as session:
         yield session
 
+@pytest.fixture
+def batching(mocker):
+    """prompt_enhancer with a batch endpoint (batching is off unless configured)."""
+    conf = {**SERVICES["prompt_enhancer"],
+            "batching": {"max_batch_size": 8, "max_wait_ms": 50, "execute_path": "/v1/execute_batch"}}
+    mocker.patch.dict(SERVICES, {"prompt_enhancer": conf})
+    return conf["batching"]
+
 @pytest.fixture(name="client")
 def client_fixture(session: Session, mocker):
     def get_session_override():
@@ -22,8 +31,13 @@ def client_fixture(session: Session, mocker):
 
     app.dependency_overrides[get_session] = get_session_override
     
-    # Mock Celery apply_async to avoid Redis connection
-    mocker.patch("worker.tasks.execute_job_step.apply_async")
+    # Mock Celery send_task to avoid Redis connection
+    mocker.patch("app.celery_app.celery_app.send_task")
+    mocker.patch("app.services.cancellation_service.r")
+    mocker.patch("app.services.ws_service.r")
+    mocker.patch("app.services.health_service.r").hgetall.return_value = {}
+    mocker.patch("app.services.trace_service.r").hgetall.return_value = {}
+    mocker.patch("app.services.config_service.r")
     
     client = TestClient(app)
     yield client
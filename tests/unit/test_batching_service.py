@@ -0,0 +1,52 @@
+import json
+from unittest.mock import MagicMock
+from app.config import SERVICES, _batching
+from app.services.batching_service import BatchingService
+from app.services.http_service_client import ServiceCallError
+
+
+def test_run_batch_uses_one_lease_and_delivers_per_item(mocker, batching):
+    r = mocker.patch("app.services.batching_service.r")
+    pipe = r.pipeline.return_value
+    r.llen.return_value = 2
+    r.lpop.return_value = [json.dumps({"id": "a", "envelope": {"n": 1}}),
+                           json.dumps({"id": "b", "envelope": {"n": 2}})]
+    limiter, client = MagicMock(), MagicMock()
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call_batch.return_value = [
+        {"status": "SUCCESS", "data": {"x": 1}, "metrics": {}},
+        ServiceCallError("SERVICE_FAILED", "boom", True),
+    ]
+
+    BatchingService(limiter, client)._run_batch("prompt_enhancer", SERVICES["prompt_enhancer"])
+
+    limiter.acquire_replica.assert_called_once()
+    limiter.release.assert_called_once_with("prompt_enhancer", "lease-token")
+    client.call_batch.assert_called_once_with("prompt_enhancer", [{"n": 1}, {"n": 2}], 120, replica=0)
+    pushed = {c.args[0]: json.loads(c.args[1]) for c in pipe.rpush.call_args_list}
+    assert pushed["batch:prompt_enhancer:result:a"]["out"]["metrics"]["batch_size"] == 2
+    assert pushed["batch:prompt_enhancer:result:b"]["error"]["code"] == "SERVICE_FAILED"
+
+
+def test_submit_raises_item_error(mocker, batching):
+    r = mocker.patch("app.services.batching_service.r")
+    r.lpos.return_value = None
+    r.blpop.return_value = ("k", json.dumps({"status": "FAILED", "error": {
+        "code": "INVALID_INPUT", "message": "bad", "retryable": False}}))
+
+    service = BatchingService(MagicMock(), MagicMock())
+    try:
+        service.submit("prompt_enhancer", {"n": 1}, SERVICES["prompt_enhancer"])
+        assert False, "expected ServiceCallError"
+    except ServiceCallError as e:
+        assert e.code == "INVALID_INPUT"
+        assert e.retryable is False
+
+
+def test_batching_is_opt_in(monkeypatch):
+    monkeypatch.delenv("PROMPT_ENHANCER_MAX_BATCH_SIZE", raising=False)
+    assert _batching("PROMPT_ENHANCER") == {}
+
+    monkeypatch.setenv("PROMPT_ENHANCER_MAX_BATCH_SIZE", "4")
+    assert _batching("PROMPT_ENHANCER") == {"batching": {
+        "max_batch_size": 4, "max_wait_ms": 50, "execute_path": "/v1/execute_batch"}}
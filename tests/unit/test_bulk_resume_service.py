@@ -0,0 +1,71 @@
+from unittest.mock import MagicMock
+import pytest
+from app.services import bulk_resume_service
+from app.services.bulk_resume_service import BulkResumeService
+
+
+@pytest.fixture
+def ramp_store(mocker):
+    store = {}
+    r = mocker.patch.object(bulk_resume_service, "r")
+    r.get.side_effect = store.get
+    r.set.side_effect = lambda key, value, ex=None: store.__setitem__(key, value)
+    r.delete.side_effect = lambda key: store.pop(key, None)
+    return store
+
+
+def _service(free=100, state="CLOSED"):
+    limiter, breaker = MagicMock(), MagicMock()
+    limiter.free_capacity.side_effect = lambda name, replicas: free if name == "image_gen" else 0
+    breaker.state.return_value = {"state": state}
+    return BulkResumeService(limiter, breaker)
+
+
+def _repo(parked=5, due=0):
+    repo = MagicMock()
+    repo.count_due_retries.return_value = due
+    repo.parked.side_effect = lambda features, name, limit: [MagicMock(id=f"job-{i}") for i in range(min(limit, parked))]
+    return repo
+
+
+def test_ramp_doubles_the_allowance_each_tick(ramp_store):
+    service, ws = _service(), MagicMock()
+
+    assert service.ramp(_repo(parked=100), ws) == {"image_gen": 2}
+    assert service.ramp(_repo(parked=100), ws) == {"image_gen": 4}
+    assert service.ramp(_repo(parked=100), ws) == {"image_gen": 8}
+
+
+def test_ramp_is_capped_by_free_capacity_minus_due_retries(ramp_store):
+    ramp_store["resume:ramp:image_gen"] = 64
+    repo = _repo(parked=100, due=7)
+
+    assert _service(free=10).ramp(repo, MagicMock()) == {"image_gen": 3}
+    assert repo.parked.call_args.args[2] == 3
+
+
+def test_ramp_holds_and_resets_while_breaker_is_open(ramp_store):
+    ramp_store["resume:ramp:image_gen"] = 64
+    repo = _repo()
+
+    assert _service(state="OPEN").ramp(repo, MagicMock()) == {}
+    repo.release_parked.assert_not_called()
+    assert "resume:ramp:image_gen" not in ramp_store
+
+
+def test_ramp_publishes_before_releasing(ramp_store):
+    calls = MagicMock()
+    repo, ws = _repo(parked=1), calls.ws
+    repo.release_parked.side_effect = lambda *a: calls.release()
+
+    _service().ramp(repo, ws)
+
+    assert [name for name, _, _ in calls.mock_calls] == ["ws.publish", "ws.flush", "release"]
+
+
+def test_ramp_skips_everything_when_nothing_is_parked(ramp_store):
+    repo = _repo()
+    repo.has_parked.return_value = False
+
+    assert _service().ramp(repo, MagicMock()) == {}
+    repo.parked.assert_not_called()
@@ -0,0 +1,24 @@
+from app.services.coalescing_service import CoalescingService
+
+
+def test_input_hash_ignores_per_job_bookkeeping():
+    svc = CoalescingService()
+    a = {"params": {}, "context": {
+        "initial_input": {"prompt": "a cat"},
+        "step_0_prompt_enhancer": {"status": "SUCCESS", "data": {"text": "x"}, "timestamp": 1},
+        "step_1_fast_chat_llm__attempts": 1,
+    }}
+    b = {"params": {}, "context": {
+        "initial_input": {"prompt": "a cat"},
+        "step_0_prompt_enhancer": {"status": "SUCCESS", "data": {"text": "x"}, "timestamp": 99,
+                                   "metrics": {"execution_time_ms": 5}},
+    }}
+    assert svc.input_hash("fast_chat_llm", a) == svc.input_hash("fast_chat_llm", b)
+
+
+def test_input_hash_differs_by_input_and_service():
+    svc = CoalescingService()
+    a = {"params": {}, "context": {"initial_input": {"prompt": "a cat"}}}
+    b = {"params": {}, "context": {"initial_input": {"prompt": "a dog"}}}
+    assert svc.input_hash("image_gen", a) != svc.input_hash("image_gen", b)
+    assert svc.input_hash("image_gen", a) != svc.input_hash("model_3d_gen", a)
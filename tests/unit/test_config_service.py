@@ -0,0 +1,92 @@
+import json
+import pytest
+from app.config import SERVICES, FEATURES
+from app.core.exceptions import ConfigVersionConflict
+from app.services import config_service
+from app.services.config_service import ConfigService, build, current, refresh
+
+
+@pytest.fixture
+def r(mocker):
+    mocker.patch.object(config_service, "_current", config_service._BASELINE)
+    return mocker.patch.object(config_service, "r")
+
+
+def test_build_merges_overrides_without_touching_app_config():
+    snap = build(3, {"services": {"image_gen": {"limit": 3, "timeout": 60}},
+                     "features": {"image_only": ["prompt_enhancer", "image_gen"]}})
+
+    assert snap.version == 3
+    assert snap.services["image_gen"]["limit"] == 3
+    assert snap.services["image_gen"]["execute_path"] == SERVICES["image_gen"]["execute_path"]
+    assert snap.features["image_only"] == ["prompt_enhancer", "image_gen"]
+    assert SERVICES["image_gen"]["limit"] == 1
+    assert "image_only" not in FEATURES
+    with pytest.raises(TypeError):
+        snap.services["image_gen"] = {}
+
+
+@pytest.mark.parametrize("overrides", [
+    {"services": {"nope": {"limit": 1}}},
+    {"services": {"image_gen": {"execute_path": "/x"}}},
+    {"services": {"image_gen": {"limit": 0}}},
+    {"services": {"image_gen": {"timeout": "60"}}},
+    {"features": {"broken": ["prompt_enhancer", "nope"]}},
+    {"features": {"empty": []}},
+    {"services": {"prompt_enhancer": {"batching": {}}}},
+    {"services": {"prompt_enhancer": {"batching": {"max_batch_size": 0, "max_wait_ms": 50,
+                                                   "execute_path": "/v1/execute_batch"}}}},
+    {"services": {"prompt_enhancer": {"batching": {"max_batch_size": 8, "max_wait_ms": "50",
+                                                   "execute_path": "/v1/execute_batch"}}}},
+    {"services": {"prompt_enhancer": {"batching": {"max_batch_size": 8, "max_wait_ms": 50,
+                                                   "execute_path": None}}}},
+    {"services": {"image_gen": {"base_url": []}}},
+    {"services": {"image_gen": {"base_url": [{"url": "http://ig-1:9000"}]}}},
+    {"services": {"image_gen": {"base_url": [{"url": "http://ig-1:9000", "limit": 0}]}}},
+    {"services": {"image_gen": {"base_url": [{"url": 1, "limit": 2}]}}},
+    {"services": {"image_gen": {"base_url": [["http://ig-1:9000"]]}}},
+    {"services": {"image_gen": {"batching": {"max_batch_size": 8, "max_wait_ms": 50,
+                                             "execute_path": "/v1/execute_batch"}}}},
+])
+def test_build_rejects_invalid_overrides(overrides):
+    with pytest.raises(ValueError):
+        build(1, overrides)
+
+
+def test_build_accepts_nested_overrides():
+    batching = {"max_batch_size": 4, "max_wait_ms": 20, "execute_path": "/v1/execute_batch"}
+    replicas = ["http://ig-1:9000", {"url": "http://ig-2:9000", "limit": 2}]
+    snap = build(1, {"services": {"prompt_enhancer": {"batching": batching},
+                                  "image_gen": {"base_url": replicas}}})
+
+    assert snap.services["prompt_enhancer"]["batching"] == batching
+    assert snap.services["image_gen"]["base_url"] == replicas
+
+
+def test_refresh_swaps_snapshot_only_on_new_version(r):
+    r.hmget.return_value = ["2", json.dumps({"services": {"image_gen": {"limit": 4}}})]
+
+    snap = refresh()
+
+    assert current() is snap
+    assert snap.version == 2 and snap.services["image_gen"]["limit"] == 4
+    assert refresh() is snap
+
+
+def test_refresh_keeps_snapshot_when_stored_config_is_invalid(r):
+    r.hmget.return_value = ["5", json.dumps({"services": {"image_gen": {"limit": -1}}})]
+
+    assert refresh() is config_service._BASELINE
+
+
+def test_update_rejects_stale_version(r):
+    r.eval.return_value = -1 - 7  # stored version is 7
+
+    with pytest.raises(ConfigVersionConflict):
+        ConfigService().update({"services": {"image_gen": {"limit": 2}}}, expected_version=6)
+
+
+def test_update_validates_before_storing(r):
+    with pytest.raises(ValueError):
+        ConfigService().update({"services": {"image_gen": {"limit": 0}}})
+    r.eval.assert_not_called()
@@ -0,0 +1,65 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import exc, text
+from sqlalchemy.pool import NullPool
+from app.core import db
+
+
+def _checkouts(role, outcome):
+    return REGISTRY.get_sample_value("cao_db_pool_checkout_seconds_count", {"role": role, "outcome": outcome}) or 0
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'pool.db'}"
+
+
+def test_make_engine_sizes_pool_per_role(mocker, sqlite_url):
+    mocker.patch.dict(db.DB_POOL, {"worker": {"pool_size": 2, "max_overflow": 1}})
+
+    engine = db.make_engine("worker", sqlite_url, pgbouncer=False)
+
+    assert isinstance(engine.pool, db.TimedQueuePool)
+    assert engine.pool.size() == 2
+    assert engine.pool._max_overflow == 1
+    assert engine.pool.role == "worker"
+
+
+def test_make_engine_keeps_no_pool_behind_pgbouncer(sqlite_url):
+    assert isinstance(db.make_engine("api", sqlite_url, pgbouncer=True).pool, NullPool)
+
+
+def test_checkout_wait_is_observed(sqlite_url):
+    engine = db.make_engine("api", sqlite_url, pgbouncer=False)
+    before = _checkouts("api", "ok")
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    assert _checkouts("api", "ok") == before + 1
+
+
+def test_checkout_timeout_is_observed(mocker, sqlite_url):
+    mocker.patch.dict(db.DB_POOL, {"worker": {"pool_size": 1, "max_overflow": 0}})
+    mocker.patch.object(db, "DB_POOL_TIMEOUT_S", 0.01)
+    engine = db.make_engine("worker", sqlite_url, pgbouncer=False)
+    before = _checkouts("worker", "timeout")
+
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    assert _checkouts("worker", "timeout") == before + 1
+
+
+def test_fork_gives_the_child_a_fresh_pool(sqlite_url):
+    engine = db.make_engine("worker", sqlite_url, pgbouncer=False)
+    inherited = engine.pool
+    conn = engine.connect()
+
+    db._reset_after_fork()
+
+    assert engine.pool is not inherited
+    assert engine.pool.role == "worker"
+    assert engine.pool.checkedout() == 0
+    conn.close()
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock
+from app.services.event_stream import job_events, sse_frames
+from app.services.pubsub_hub import PubSubHub
+
+
+@pytest.fixture
+def hub(mocker):
+    hub = PubSubHub()
+    hub.live = []  # published before the test subscribes
+
+    def subscribe(channel, queue=None):
+        queue = queue if queue is not None else asyncio.Queue()
+        for data in hub.live:
+            queue.put_nowait(data)
+        return queue
+
+    mocker.patch.object(hub, "subscribe", AsyncMock(side_effect=subscribe))
+    mocker.patch.object(hub, "unsubscribe", AsyncMock())
+    hub._redis = mocker.MagicMock(xrange=AsyncMock(return_value=[]))
+    return hub
+
+
+def _live(event_id, **payload):
+    return json.dumps({**payload, "event_id": event_id})
+
+
+@pytest.mark.asyncio
+async def test_job_events_replays_then_skips_duplicate_live_events(hub):
+    hub.redis.xrange.return_value = [("5-0", {"data": json.dumps({"type": "STEP_STARTED"})}),
+                                     ("6-0", {"data": json.dumps({"type": "STEP_COMPLETED"})})]
+    hub.live.append(_live("6-0", type="STEP_COMPLETED"))
+    hub.live.append(_live("7-0", type="JOB_COMPLETED"))
+
+    events = job_events(hub, "job-1", "4-0")
+    got = [json.loads(await events.__anext__()) for _ in range(3)]
+    await events.aclose()
+
+    assert [e["event_id"] for e in got] == ["5-0", "6-0", "7-0"]
+    hub.redis.xrange.assert_awaited_once_with("events:job-1", min="(4-0", max="+")
+    hub.unsubscribe.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_sse_frames_end_after_terminal_event(hub):
+    hub.live.append(_live("1-0", type="STEP_STARTED"))
+    hub.live.append(_live("2-0", type="JOB_COMPLETED"))
+
+    frames = [f async for f in sse_frames(hub, "job-1")]
+
+    assert frames[0].startswith("id: 1-0\nevent: STEP_STARTED\n")
+    assert frames[1].startswith("id: 2-0\nevent: JOB_COMPLETED\n")
+    assert len(frames) == 2
+    hub.unsubscribe.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_sse_frames_send_keepalive_when_idle(hub):
+    frames = sse_frames(hub, "job-1", keepalive_s=0.01)
+    assert await frames.__anext__() == ": keepalive\n\n"
+    await frames.aclose()
+    hub.unsubscribe.assert_awaited_once()
@@ -0,0 +1,57 @@
+import json
+import time
+import pytest
+from unittest.mock import MagicMock
+from app.config import SERVICES
+from app.services import health_service
+from app.services.health_service import HealthService
+from app.services.http_service_client import service_replicas
+
+
+@pytest.fixture
+def r(mocker):
+    return mocker.patch.object(health_service, "r")
+
+
+def _mock_all(requests_mock, status=200):
+    for conf in SERVICES.values():
+        for rep in service_replicas(conf):
+            requests_mock.get(rep["url"].rstrip("/") + conf.get("health_path", "/health"), status_code=status)
+
+
+def test_probe_all_reports_every_service_with_latency(requests_mock):
+    _mock_all(requests_mock)
+    requests_mock.get("http://image-gen:9000/health", status_code=503)
+
+    results = HealthService().probe_all()
+
+    assert set(results) == set(SERVICES)
+    assert results["image_gen"]["ok"] is False
+    assert results["image_gen"]["status_code"] == 503
+    assert results["fast_chat_llm"]["ok"] is True
+    assert all("latency_ms" in res and "checked_at" in res for res in results.values())
+
+
+def test_run_once_ejects_failing_replicas(requests_mock, mocker, r):
+    conf = {**SERVICES["prompt_enhancer"], "base_url": ["http://pe-1:9000", "http://pe-2:9000"]}
+    mocker.patch.dict(SERVICES, {"prompt_enhancer": conf})
+    _mock_all(requests_mock)
+    requests_mock.get("http://pe-2:9000/health", exc=ConnectionError("refused"))
+    limiter = MagicMock(slot=lambda name, i, count: f"{name}#{i}")
+
+    results = HealthService(limiter).run_once()
+
+    assert results["prompt_enhancer"]["ok"] is True
+    limiter.eject.assert_called_once_with("prompt_enhancer#1", 20)
+    r.pipeline.return_value.hset.assert_called_once()
+
+
+def test_is_down_ignores_stale_results(r):
+    r.hget.return_value = json.dumps({"ok": False, "checked_at": time.time()})
+    assert HealthService().is_down("image_gen") is True
+
+    r.hget.return_value = json.dumps({"ok": False, "checked_at": time.time() - 3600})
+    assert HealthService().is_down("image_gen") is False
+
+    r.hget.return_value = None
+    assert HealthService().is_down("image_gen") is False
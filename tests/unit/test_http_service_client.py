@@ -0,0 +1,160 @@
+import pytest
+from app.config import SERVICES
+from app.services.http_service_client import HTTPServiceClient, ServiceCallError
+
+
+def _envelope(job_id, step_index=0, service_name="prompt_enhancer"):
+    return {"meta": {"job_id": job_id, "step_index": step_index, "service_name": service_name,
+                     "attempt": 1, "timestamp": 0},
+            "payload": {"params": {}, "context": {}}}
+
+
+def _batch_url(service_name):
+    conf = SERVICES[service_name]
+    return conf["base_url"].rstrip("/") + conf["batching"]["execute_path"]
+
+
+def test_call_batch_splits_per_item_results(requests_mock, batching):
+    requests_mock.post(_batch_url("prompt_enhancer"), json={"status": "SUCCESS", "results": [
+        {"status": "SUCCESS", "data": {"text": "a"}},
+        {"status": "FAILED", "error": {"code": "INVALID_INPUT", "message": "bad prompt", "retryable": False}},
+    ]})
+
+    results = HTTPServiceClient().call_batch(
+        "prompt_enhancer", [_envelope("job-1"), _envelope("job-2")], 120)
+
+    assert results[0]["data"] == {"text": "a"}
+    assert results[0]["metrics"] == {}
+    assert isinstance(results[1], ServiceCallError)
+    assert results[1].code == "INVALID_INPUT"
+    assert results[1].retryable is False
+    assert requests_mock.last_request.json()["items"][1]["meta"]["job_id"] == "job-2"
+
+
+def test_call_batch_busy_backend_fails_whole_batch(requests_mock, batching):
+    requests_mock.post(_batch_url("prompt_enhancer"), status_code=503)
+
+    with pytest.raises(ServiceCallError) as exc:
+        HTTPServiceClient().call_batch("prompt_enhancer", [_envelope("job-1")], 120)
+    assert exc.value.code == "RESOURCE_EXHAUSTED"
+    assert exc.value.retryable is True
+
+
+def test_call_batch_rejects_mismatched_results(requests_mock, batching):
+    requests_mock.post(_batch_url("prompt_enhancer"), json={"status": "SUCCESS", "results": []})
+
+    with pytest.raises(ServiceCallError) as exc:
+        HTTPServiceClient().call_batch("prompt_enhancer", [_envelope("job-1")], 120)
+    assert exc.value.code == "BAD_RESPONSE"
+
+
+def test_call_keeps_retry_after(requests_mock):
+    conf = SERVICES["image_gen"]
+    requests_mock.post(conf["base_url"] + conf["execute_path"], status_code=429, headers={"Retry-After": "42"})
+
+    with pytest.raises(ServiceCallError) as exc:
+        HTTPServiceClient().call("image_gen", _envelope("job-1", service_name="image_gen"), 360)
+    assert exc.value.code == "RESOURCE_EXHAUSTED"
+    assert exc.value.retry_after == 42.0
+
+
+def test_call_aborts_when_cancelled(requests_mock, mocker):
+    import time as _time
+    mocker.patch("app.services.http_service_client.CANCEL_POLL_INTERVAL_S", 0.01)
+    conf = SERVICES["model_3d_gen"]
+
+    def slow(request, context):
+        _time.sleep(0.3)
+        return {"status": "SUCCESS", "data": {}}
+    requests_mock.post(conf["base_url"] + conf["execute_path"], json=slow)
+
+    with pytest.raises(ServiceCallError) as exc:
+        HTTPServiceClient().call("model_3d_gen", _envelope("job-1", service_name="model_3d_gen"), 420,
+                                 cancel_check=lambda: True)
+    assert exc.value.code == "CANCELLED"
+
+
+def _execute_url(service_name):
+    conf = SERVICES[service_name]
+    return conf["base_url"].rstrip("/") + conf["execute_path"]
+
+
+def test_call_streams_ndjson_and_assembles_data(requests_mock):
+    body = "\n".join([
+        '{"progress": 0.1, "delta": {"text": "Hel"}}',
+        '',
+        '{"delta": {"text": "lo"}, "message": "writing"}',
+        '{"status": "SUCCESS", "metrics": {"tokens": 2}}',
+    ])
+    requests_mock.post(_execute_url("fast_chat_llm"), text=body, headers={"Content-Type": "application/x-ndjson"})
+    updates = []
+
+    out = HTTPServiceClient().call("fast_chat_llm", _envelope("job-1", service_name="fast_chat_llm"), 180,
+                                   on_progress=updates.append)
+
+    assert out["data"] == {"text": "Hello"}
+    assert out["metrics"] == {"tokens": 2}
+    assert updates == [{"progress": 0.1, "message": None, "partial": {"text": "Hel"}},
+                       {"progress": None, "message": "writing", "partial": {"text": "Hello"}}]
+    assert "application/x-ndjson" in requests_mock.last_request.headers["Accept"]
+
+
+def test_call_streams_sse(requests_mock):
+    body = ('event: progress\ndata: {"progress": 0.5}\n\n'
+            ': keepalive\n\n'
+            'data: {"status": "SUCCESS", "data": {"url": "s3://x"}}\n\n')
+    requests_mock.post(_execute_url("image_gen"), text=body, headers={"Content-Type": "text/event-stream"})
+    updates = []
+
+    out = HTTPServiceClient().call("image_gen", _envelope("job-1", service_name="image_gen"), 360,
+                                   on_progress=updates.append)
+
+    assert out["data"] == {"url": "s3://x"}
+    assert [u["progress"] for u in updates] == [0.5]
+
+
+@pytest.mark.parametrize("ctype, body", [
+    ("text/event-stream", 'data: {"delta": {"text": "café"}}\n\n'
+                          'data: {"status": "SUCCESS", "data": {"text": "café ☃"}}\n\n'),
+    ("application/x-ndjson", '{"delta": {"text": "café"}}\n{"status": "SUCCESS", "data": {"text": "café ☃"}}\n'),
+])
+def test_call_stream_decodes_utf8_without_charset(requests_mock, ctype, body):
+    requests_mock.post(_execute_url("fast_chat_llm"), content=body.encode("utf-8"), headers={"Content-Type": ctype})
+    updates = []
+
+    out = HTTPServiceClient().call("fast_chat_llm", _envelope("job-1", service_name="fast_chat_llm"), 180,
+                                   on_progress=updates.append)
+
+    assert out["data"] == {"text": "café ☃"}
+    assert updates[0]["partial"] == {"text": "café"}
+
+
+def test_call_stream_falls_back_to_plain_json(requests_mock):
+    requests_mock.post(_execute_url("image_gen"), json={"status": "SUCCESS", "data": {"url": "s3://y"}})
+
+    out = HTTPServiceClient().call("image_gen", _envelope("job-1", service_name="image_gen"), 360,
+                                   on_progress=lambda u: None)
+
+    assert out["data"] == {"url": "s3://y"}
+
+
+def test_call_stream_without_result_is_retryable(requests_mock):
+    requests_mock.post(_execute_url("fast_chat_llm"), text='{"delta": {"text": "Hel"}}\n',
+                       headers={"Content-Type": "application/x-ndjson"})
+
+    with pytest.raises(ServiceCallError) as exc:
+        HTTPServiceClient().call("fast_chat_llm", _envelope("job-1", service_name="fast_chat_llm"), 180,
+                                 on_progress=lambda u: None)
+    assert exc.value.code == "BAD_RESPONSE"
+    assert exc.value.retryable is True
+
+
+def test_call_stream_checks_cancel_between_chunks(requests_mock, mocker):
+    mocker.patch("app.services.http_service_client.CANCEL_POLL_INTERVAL_S", 0)
+    requests_mock.post(_execute_url("fast_chat_llm"), text='{"delta": {"text": "a"}}\n{"status": "SUCCESS"}\n',
+                       headers={"Content-Type": "application/x-ndjson"})
+
+    with pytest.raises(ServiceCallError) as exc:
+        HTTPServiceClient().call("fast_chat_llm", _envelope("job-1", service_name="fast_chat_llm"), 180,
+                                 cancel_check=lambda: True, on_progress=lambda u: None)
+    assert exc.value.code == "CANCELLED"
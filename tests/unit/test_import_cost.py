@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+# generous: catches the API pulling in the worker stack again, not machine noise
+API_IMPORT_BUDGET_S = float(os.getenv("API_IMPORT_BUDGET_S", "5"))
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - t0
+from app.core import redis_clients
+from app.services.pubsub_hub import hub
+print(json.dumps({
+    "import_s": elapsed,
+    "modules": [m for m in ("worker.tasks", "app.services.orchestrator_service") if m in sys.modules],
+    "redis_clients": [redis_clients._shared._client is not None, hub._redis is not None],
+}))
+"""
+
+
+def test_api_import_is_light():
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, check=True, capture_output=True, text=True)
+    report = json.loads(out.stdout.strip().splitlines()[-1])
+
+    assert report["modules"] == []
+    assert report["redis_clients"] == [False, False]
+    assert report["import_s"] < API_IMPORT_BUDGET_S
@@ -1,6 +1,9 @@
+import time
+from datetime import datetime, timezone
 import pytest
-from app.repositories.job_repository import JobRepository
+from app.repositories.job_repository import JobRepository, month_start
 from app.models.enums import JobStatus
+from app.models.job import Job, JobArchive
 
 def test_create_job(session):
     repo = JobRepository(session)
@@ -27,3 +30,138 @@ def test_job_transitions(session):
     cleared = repo.get("job-2")
     assert cleared.status == JobStatus.RUNNING
     assert cleared.error_code is None
+
+def test_save_step_persists_context(session):
+    repo = JobRepository(session)
+    job = repo.create("job-3", "text_only", {})
+    repo.save_step(job, "step_0_prompt_enhancer", {"status": "SUCCESS", "data": {"text": "x"}})
+
+    session.expire_all()
+    reloaded = repo.get("job-3")
+    assert reloaded.context["step_0_prompt_enhancer"]["data"] == {"text": "x"}
+
+def test_defer_persists_context_and_stages_step(session):
+    from sqlmodel import select
+    from app.models.outbox import OutboxMessage
+    repo = JobRepository(session)
+    job = repo.create("job-4", "text_only", {})
+    job.context["step_0_prompt_enhancer__health_deferrals"] = 1
+    repo.defer(job, 10)
+
+    session.expire_all()
+    assert repo.get("job-4").context["step_0_prompt_enhancer__health_deferrals"] == 1
+    assert [m.countdown for m in session.exec(select(OutboxMessage))][-1] == 10
+
+def test_schedule_retry_then_resume(session):
+    repo = JobRepository(session)
+    job = repo.create("job-4", "text_only", {})
+    job.context["step_0_prompt_enhancer__retries"] = 1
+    repo.schedule_retry(job, "SERVICE_TIMEOUT", "slow", 1234.0)
+
+    session.expire_all()
+    waiting = repo.get("job-4")
+    assert waiting.status == JobStatus.WAITING_RETRY
+    assert waiting.next_retry_at == 1234.0
+    assert waiting.context["step_0_prompt_enhancer__retries"] == 1
+
+    repo.clear_failure(waiting)
+    assert repo.get("job-4").next_retry_at is None
+
+def test_archive_terminal_moves_old_finished_jobs(session):
+    repo = JobRepository(session)
+    old_done = repo.create("job-5", "text_only", {})
+    repo.set_status(old_done, JobStatus.COMPLETED)
+    old_running = repo.create("job-6", "text_only", {})
+    repo.set_status(old_running, JobStatus.RUNNING)
+    cutoff = time.time() + 1
+    recent = repo.create("job-7", "text_only", {})
+    repo.set_status(recent, JobStatus.FAILED)
+    recent.updated_at = cutoff + 60
+    session.add(recent)
+    session.commit()
+
+    assert repo.archive_terminal(cutoff, limit=100) == 1
+
+    assert session.get(Job, "job-5") is None
+    assert session.get(JobArchive, "job-5").status == JobStatus.COMPLETED
+    assert session.get(Job, "job-6") is not None
+    assert session.get(Job, "job-7") is not None
+
+def test_get_falls_back_to_archive_and_resume_restores(session):
+    repo = JobRepository(session)
+    job = repo.create("job-8", "text_only", {"prompt": "x"})
+    repo.fail(job, "SERVICE_UNREACHABLE", "down", True)
+    repo.archive_terminal(time.time() + 1, limit=100)
+    session.expire_all()
+
+    archived = repo.get("job-8")
+    assert archived.status == JobStatus.FAILED
+    assert archived.context["initial_input"] == {"prompt": "x"}
+
+    repo.clear_failure(archived)
+    assert session.get(Job, "job-8").status == JobStatus.RUNNING
+
+    # finishing again and re-archiving replaces the stale archived copy
+    repo.set_status(archived, JobStatus.COMPLETED)
+    assert repo.archive_terminal(time.time() + 1, limit=100) == 1
+    assert session.get(JobArchive, "job-8").status == JobStatus.COMPLETED
+
+def test_partition_maintenance_is_a_noop_without_postgres(session):
+    repo = JobRepository(session)
+    assert repo.ensure_partitions(3) == []
+    assert repo.drop_empty_partitions(time.time()) == []
+
+def test_month_start_rolls_over_the_year():
+    dec = datetime(2026, 12, 15, tzinfo=timezone.utc).timestamp()
+    assert month_start(dec) == datetime(2026, 12, 1, tzinfo=timezone.utc)
+    assert month_start(dec, 1) == datetime(2027, 1, 1, tzinfo=timezone.utc)
+
+def _failed(repo, job_id, feature, step, code, priority="medium", retryable=True):
+    job = repo.create(job_id, feature, {}, priority=priority)
+    job.current_step_index = step
+    repo.fail(job, code, "down", retryable)
+    return job
+
+def test_park_resumable_selects_by_service_code_and_window(session):
+    repo = JobRepository(session)
+    features = {"full_pipeline": ["prompt_enhancer", "fast_chat_llm", "image_gen"], "text_only": ["prompt_enhancer"]}
+    _failed(repo, "hit", "full_pipeline", 2, "RESOURCE_EXHAUSTED")
+    _failed(repo, "other-step", "full_pipeline", 1, "RESOURCE_EXHAUSTED")
+    _failed(repo, "other-code", "full_pipeline", 2, "INVALID_INPUT")
+    _failed(repo, "final", "full_pipeline", 2, "SERVICE_UNREACHABLE", retryable=False)
+    codes = ["RESOURCE_EXHAUSTED", "SERVICE_UNREACHABLE"]
+
+    assert repo.count_resumable(features, "image_gen", codes, until=time.time() - 60) == 0
+    assert repo.count_resumable(features, "image_gen", codes) == 1
+    assert repo.park_resumable(features, "image_gen", codes) == 1
+
+    session.expire_all()
+    parked = repo.get("hit")
+    assert parked.status == JobStatus.WAITING_RETRY and parked.next_retry_at is None
+    assert repo.get("other-step").status == JobStatus.FAILED
+    assert repo.has_parked()
+
+def test_parked_jobs_are_released_by_priority_with_fresh_counters(session):
+    from app.models.outbox import OutboxMessage
+    from sqlmodel import select
+    repo = JobRepository(session)
+    features = {"text_only": ["prompt_enhancer", "fast_chat_llm"]}
+    for job_id, priority in (("low-1", "low"), ("high-1", "high"), ("medium-1", "medium")):
+        job = _failed(repo, job_id, "text_only", 1, "RESOURCE_EXHAUSTED", priority=priority)
+        job.context["step_1_fast_chat_llm__attempts"] = 3
+        job.context["step_1_fast_chat_llm__retries"] = 3
+        repo.save_step(job, "step_0_prompt_enhancer", {"status": "SUCCESS"})
+    repo.park_resumable(features, "fast_chat_llm")
+
+    jobs = repo.parked(features, "fast_chat_llm", limit=2)
+    assert [j.id for j in jobs] == ["high-1", "medium-1"]
+
+    repo.release_parked(jobs, "fast_chat_llm")
+    session.expire_all()
+    high = repo.get("high-1")
+    assert high.next_retry_at is not None
+    assert "step_1_fast_chat_llm__attempts" not in high.context
+    assert high.context["step_0_prompt_enhancer"] == {"status": "SUCCESS"}
+    assert repo.count_due_retries(features, "fast_chat_llm") == 2
+    assert [m.job_id for m in session.exec(select(OutboxMessage))] == ["high-1", "medium-1"]
+    assert [j.id for j in repo.parked(features, "fast_chat_llm", limit=10)] == ["low-1"]
@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest
+from app.core import metrics
+from app.core.metrics import RedisStateCollector, queue_depth
+
+
+def test_queue_depth_counts_priority_sublists():
+    client = MagicMock()
+    client.pipeline.return_value.execute.return_value = [3] + [1] * 9
+
+    assert queue_depth(client, "high_priority") == 12
+    keys = [c.args[0] for c in client.pipeline.return_value.llen.call_args_list]
+    assert keys[0] == "high_priority"
+    assert "high_priority\x06\x169" in keys
+    assert len(keys) == 10
+
+
+def test_redis_state_collector_reports_leases_and_queues(mocker):
+    collector = RedisStateCollector()
+    collector.redis = MagicMock()
+    collector.redis.mget.side_effect = lambda keys: ["2"] + [None] * (len(keys) - 1)
+    collector.redis.pipeline.return_value.execute.return_value = [4] + [0] * 9
+    reg = CollectorRegistry()
+    reg.register(collector)
+
+    text = generate_latest(reg).decode()
+
+    assert 'cao_leases_in_use{service="prompt_enhancer",slot="prompt_enhancer"} 2.0' in text
+    assert 'cao_lease_limit{service="prompt_enhancer",slot="prompt_enhancer"} 5.0' in text
+    assert 'cao_queue_depth{queue="high_priority"} 4.0' in text
+
+
+def test_metrics_endpoint(client, mocker):
+    mocker.patch.object(metrics, "registry", CollectorRegistry)
+    mocker.patch.object(metrics, "_api_registry", None)
+    mocker.patch.object(RedisStateCollector, "collect", return_value=iter([]))
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+
+def test_db_commits_are_labelled_by_step(session):
+    def count():
+        return REGISTRY.get_sample_value("cao_db_commit_seconds_count",
+                                         {"service": "image_gen", "priority": "low"}) or 0
+    metrics.instrument_db_commits()
+    before = count()
+
+    metrics.label_commits(session, "image_gen", "low")
+    session.commit()
+
+    assert count() == before + 1
@@ -1,8 +1,9 @@
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import ANY, MagicMock
 from app.services.orchestrator_service import OrchestratorService
 from app.models.enums import JobStatus, StepStatus
 from app.services.http_service_client import ServiceCallError
+from app.config import SERVICES
 
 def test_orchestrator_execute_success(session, mocker):
     # Mock dependencies
@@ -26,7 +27,7 @@ def test_orchestrator_execute_success(session, mocker):
     repo.bump_step_index.side_effect = bump_side_effect
     
     # Mock limiter lease
-    limiter.acquire.return_value = "lease-token"
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
     
     # Mock service client response
     client.call.return_value = {"status": "SUCCESS", "data": {"result": "ok"}}
@@ -60,3 +61,404 @@ def test_orchestrator_max_attemps(session, mocker):
     assert result == "FAILED"
     from unittest.mock import ANY
     repo.fail.assert_called_with(job, "MAX_STEP_ATTEMPTS", ANY, False)
+
+
+def _text_only_job():
+    job = MagicMock()
+    job.id = "job-1"
+    job.feature_name = "text_only"
+    job.status = JobStatus.PENDING
+    job.current_step_index = 0
+    job.context = {"initial_input": {"prompt": "a cat"}}
+    return job
+
+
+def _bump(j):
+    j.current_step_index += 1
+
+
+def test_orchestrator_coalesced_follower_reuses_leader_output():
+    repo, ws, limiter, client, coalescer = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    coalescer.input_hash.return_value = "h"
+    coalescer.try_lead.return_value = False
+    coalescer.wait.return_value = {"status": "SUCCESS", "leader": "job-0",
+                                   "out": {"status": "SUCCESS", "data": {"text": "shared"}, "metrics": {}}}
+
+    service = OrchestratorService(repo, ws, limiter, client, coalescer)
+    result = service.execute_one_step("job-1")
+
+    assert result == "OK"
+    limiter.acquire_replica.assert_not_called()
+    client.call.assert_not_called()
+    step_key, payload = repo.save_step.call_args[0][1:]
+    assert step_key == "step_0_prompt_enhancer"
+    assert payload["data"] == {"text": "shared"}
+    assert payload["metrics"]["coalesced_from"] == "job-0"
+
+
+def test_orchestrator_coalesced_follower_propagates_failure():
+    repo, ws, limiter, client, coalescer = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    coalescer.try_lead.return_value = False
+    coalescer.wait.return_value = {"status": "FAILED", "leader": "job-0",
+                                   "error": {"code": "SERVICE_TIMEOUT", "message": "timed out", "retryable": True}}
+
+    service = OrchestratorService(repo, ws, limiter, client, coalescer)
+    result = service.execute_one_step("job-1")
+
+    assert result == "RETRY_SCHEDULED"
+    repo.schedule_retry.assert_called_with(job, "SERVICE_TIMEOUT", "timed out", ANY)
+    client.call.assert_not_called()
+
+
+def test_orchestrator_coalesced_follower_falls_back_on_timeout():
+    repo, ws, limiter, client, coalescer = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {"text": "own"}, "metrics": {}}
+    coalescer.try_lead.return_value = False
+    coalescer.wait.return_value = None
+
+    service = OrchestratorService(repo, ws, limiter, client, coalescer)
+    result = service.execute_one_step("job-1")
+
+    assert result == "OK"
+    client.call.assert_called_once()
+    coalescer.publish_result.assert_not_called()
+    limiter.release.assert_called_with("prompt_enhancer", "lease-token")
+
+
+def test_orchestrator_coalescing_leader_publishes_outcome():
+    repo, ws, limiter, client, coalescer = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.side_effect = ServiceCallError("SERVICE_UNREACHABLE", "down", True)
+    coalescer.input_hash.return_value = "h"
+    coalescer.try_lead.return_value = True
+
+    service = OrchestratorService(repo, ws, limiter, client, coalescer)
+    result = service.execute_one_step("job-1")
+
+    assert result == "RETRY_SCHEDULED"
+    coalescer.publish_error.assert_called_with("prompt_enhancer", "h", "job-1",
+                                               "SERVICE_UNREACHABLE", "down", True, None, None)
+    coalescer.abandon.assert_not_called()
+
+
+def test_orchestrator_batched_service_skips_own_lease(batching):
+    repo, ws, limiter, client, batcher = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    batcher.submit.return_value = {"status": "SUCCESS", "data": {"text": "b"}, "metrics": {"batch_size": 3}}
+
+    service = OrchestratorService(repo, ws, limiter, client, batcher=batcher)
+    result = service.execute_one_step("job-1")
+
+    assert result == "OK"
+    limiter.acquire_replica.assert_not_called()
+    limiter.release.assert_not_called()
+    client.call.assert_not_called()
+    assert repo.save_step.call_args[0][2]["metrics"]["batch_size"] == 3
+
+
+def test_orchestrator_multi_replica_records_and_ejects(mocker):
+    conf = {**SERVICES["prompt_enhancer"],
+            "base_url": ["http://pe-1:9000", {"url": "http://pe-2:9000", "limit": 2}]}
+    mocker.patch.dict(SERVICES, {"prompt_enhancer": conf})
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (1, "prompt_enhancer#1", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+
+    service = OrchestratorService(repo, ws, limiter, client)
+    assert service.execute_one_step("job-1") == "OK"
+
+    replicas = limiter.acquire_replica.call_args[0][1]
+    assert replicas == [{"url": "http://pe-1:9000", "limit": 5}, {"url": "http://pe-2:9000", "limit": 2}]
+    assert client.call.call_args.kwargs["replica"] == 1
+    assert repo.save_step.call_args[0][2]["metrics"]["replica"] == "http://pe-2:9000"
+    limiter.release.assert_called_with("prompt_enhancer#1", "lease-token")
+
+    job.current_step_index = 0
+    client.call.side_effect = ServiceCallError("SERVICE_UNREACHABLE", "down", True)
+    assert service.execute_one_step("job-1") == "RETRY_SCHEDULED"
+    limiter.eject.assert_called_once_with("prompt_enhancer#1", 30)
+
+
+def test_orchestrator_open_circuit_defers_without_attempt_or_lease():
+    repo, ws, limiter, client, breaker = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    breaker.allow.return_value = ("DENY", 12.3)
+
+    service = OrchestratorService(repo, ws, limiter, client, breaker=breaker)
+    result = service.execute_one_step("job-1")
+
+    assert result == "DEFERRED"
+    assert service.countdown == 13
+    limiter.acquire_replica.assert_not_called()
+    client.call.assert_not_called()
+    repo.fail.assert_not_called()
+    assert "step_0_prompt_enhancer__attempts" not in job.context
+
+
+def test_orchestrator_reports_call_outcome_to_breaker():
+    repo, ws, limiter, client, breaker = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    breaker.allow.return_value = ("PROBE", 0.0)
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.side_effect = ServiceCallError("SERVICE_TIMEOUT", "slow", True)
+
+    service = OrchestratorService(repo, ws, limiter, client, breaker=breaker)
+    assert service.execute_one_step("job-1") == "RETRY_SCHEDULED"
+    breaker.record.assert_called_once_with("prompt_enhancer", "SERVICE_TIMEOUT")
+
+
+def test_orchestrator_retry_honors_retry_after():
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.side_effect = ServiceCallError("RESOURCE_EXHAUSTED", "busy", True, retry_after=120)
+
+    service = OrchestratorService(repo, ws, limiter, client)
+    assert service.execute_one_step("job-1") == "RETRY_SCHEDULED"
+
+    assert service.countdown >= 120
+    assert job.context["step_0_prompt_enhancer__retries"] == 1
+    repo.fail.assert_not_called()
+    assert ws.publish.call_args[0][1]["type"] == "STEP_RETRY_SCHEDULED"
+
+
+def test_orchestrator_retry_capped_by_max_step_attempts():
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    job.context["step_0_prompt_enhancer__attempts"] = 2
+    repo.get.return_value = job
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.side_effect = ServiceCallError("SERVICE_TIMEOUT", "slow", True)
+
+    service = OrchestratorService(repo, ws, limiter, client)
+    assert service.execute_one_step("job-1") == "FAILED"
+    repo.fail.assert_called_with(job, "SERVICE_TIMEOUT", "slow", True)
+    repo.schedule_retry.assert_not_called()
+
+
+def test_orchestrator_cancel_mid_call_releases_lease():
+    repo, ws, limiter, client, cancellation = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.side_effect = ServiceCallError("CANCELLED", "Job cancelled", False)
+
+    service = OrchestratorService(repo, ws, limiter, client, cancellation=cancellation)
+    assert service.execute_one_step("job-1") == "CANCELLED"
+
+    assert client.call.call_args.kwargs["cancel_check"] is not None
+    limiter.release.assert_called_once_with("prompt_enhancer", "lease-token")
+    repo.fail.assert_not_called()
+    repo.schedule_retry.assert_not_called()
+
+
+def test_orchestrator_flushes_events_before_blocking_calls():
+    calls = MagicMock()
+    repo, ws, limiter, client = MagicMock(), calls.ws, calls.limiter, calls.client
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+
+    assert OrchestratorService(repo, ws, limiter, client).execute_one_step("job-1") == "OK"
+
+    order = [name for name, _, _ in calls.mock_calls
+             if name in ("ws.publish", "ws.flush", "limiter.acquire_replica", "client.call")]
+    assert order[:5] == ["ws.publish", "ws.flush", "limiter.acquire_replica", "ws.publish", "ws.flush"]
+    assert order[5] == "client.call"
+
+
+def test_orchestrator_defers_when_service_reported_down():
+    repo, ws, limiter, client, health = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    health.is_down.return_value = True
+
+    service = OrchestratorService(repo, ws, limiter, client, health=health)
+
+    assert service.execute_one_step("job-1") == "DEFERRED"
+    assert service.countdown == 10
+    limiter.acquire_replica.assert_not_called()
+    assert "step_0_prompt_enhancer__attempts" not in job.context
+
+
+def test_orchestrator_dispatches_once_health_deferrals_are_spent(mocker):
+    mocker.patch("app.services.orchestrator_service.HEALTH_MAX_DEFERRALS", 2)
+    repo, ws, limiter, client, health = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    health.is_down.return_value = True
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+    service = OrchestratorService(repo, ws, limiter, client, health=health)
+
+    assert [service.execute_one_step("job-1") for _ in range(2)] == ["DEFERRED", "DEFERRED"]
+    assert job.context["step_0_prompt_enhancer__health_deferrals"] == 2
+
+    assert service.execute_one_step("job-1") == "OK"
+    assert job.context["step_0_prompt_enhancer__attempts"] == 1
+
+
+def test_orchestrator_records_trace_spans():
+    from app.services.trace_service import TraceService
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+    tracer = TraceService(sample_rate=1.0)
+    tracer.start("job-1")
+
+    assert OrchestratorService(repo, ws, limiter, client, tracer=tracer).execute_one_step("job-1") == "OK"
+
+    assert [name for name, _, _ in tracer._spans] == ["publish", "acquire", "publish", "call", "save", "publish",
+                                                      "save"]
+    assert tracer._attrs == {"step_index": 0, "service": "prompt_enhancer", "attempt": 1}
+    assert "trace" not in str(job.context)
+
+
+def test_orchestrator_uses_runtime_config_snapshot(mocker):
+    from app.services import config_service
+    mocker.patch.object(config_service, "_current",
+                        config_service.build(2, {"services": {"prompt_enhancer": {"limit": 9, "timeout": 7}}}))
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+
+    assert OrchestratorService(repo, ws, limiter, client).execute_one_step("job-1") == "OK"
+
+    _, replicas, _, wait_timeout = limiter.acquire_replica.call_args[0]
+    assert replicas[0]["limit"] == 9
+    assert wait_timeout == 7
+
+
+def test_orchestrator_relays_streamed_progress_throttled(mocker):
+    mocker.patch("app.services.orchestrator_service.STREAM_PROGRESS_INTERVAL_S", 60)
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    job.current_step_index = 1  # fast_chat_llm streams
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "fast_chat_llm", "lease-token")
+
+    def streaming_call(*args, on_progress=None, **kwargs):
+        on_progress({"progress": None, "message": None, "partial": {"text": "Hel"}})
+        on_progress({"progress": None, "message": None, "partial": {"text": "Hello"}})  # throttled
+        return {"status": "SUCCESS", "data": {"text": "Hello"}, "metrics": {}}
+    client.call.side_effect = streaming_call
+
+    assert OrchestratorService(repo, ws, limiter, client).execute_one_step("job-1") == "OK"
+
+    progress = [c.args[1] for c in ws.publish.call_args_list if c.args[1]["type"] == "STEP_PROGRESS"]
+    assert progress == [{"type": "STEP_PROGRESS", "job_id": "job-1", "step_name": "fast_chat_llm",
+                         "step_index": 1, "total_steps": 2, "partial": {"text": "Hel"}}]
+    repo.save_step.assert_called_once_with(job, "step_1_fast_chat_llm", ANY)
+    assert repo.save_step.call_args.args[2]["data"] == {"text": "Hello"}
+
+
+def test_orchestrator_streams_instead_of_batching(mocker, caplog):
+    conf = {**SERVICES["fast_chat_llm"], "stream": True,
+            "batching": {"max_batch_size": 8, "max_wait_ms": 50, "execute_path": "/v1/execute_batch"}}
+    mocker.patch.dict(SERVICES, {"fast_chat_llm": conf})
+    mocker.patch("app.services.orchestrator_service._STREAM_OVER_BATCHING", set())
+    repo, ws, limiter, client, batcher = MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    job.current_step_index = 1
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "fast_chat_llm", "lease-token")
+
+    def streaming_call(*args, on_progress=None, **kwargs):
+        on_progress({"progress": 0.5, "message": None, "partial": {"text": "Hel"}})
+        return {"status": "SUCCESS", "data": {"text": "Hello"}, "metrics": {}}
+    client.call.side_effect = streaming_call
+
+    assert OrchestratorService(repo, ws, limiter, client, batcher=batcher).execute_one_step("job-1") == "OK"
+
+    batcher.submit.assert_not_called()
+    assert [c.args[1]["type"] for c in ws.publish.call_args_list].count("STEP_PROGRESS") == 1
+    assert "fast_chat_llm is configured to both stream and batch" in caplog.text
+
+
+def test_orchestrator_does_not_stream_non_streaming_services():
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+
+    OrchestratorService(repo, ws, limiter, client).execute_one_step("job-1")
+
+    assert client.call.call_args.kwargs["on_progress"] is None
+
+
+def test_orchestrator_queues_next_step_with_the_bump():
+    calls = MagicMock()
+    repo, ws, limiter, client = calls.repo, calls.ws, MagicMock(), MagicMock()
+    job = _text_only_job()
+    job.priority = "high"
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+
+    assert OrchestratorService(repo, ws, limiter, client).execute_one_step("job-1") == "OK"
+
+    order = [name for name, _, _ in calls.mock_calls
+             if name in ("repo.save_step", "ws.flush", "repo.stage_step", "repo.bump_step_index")]
+    assert order[-4:] == ["repo.save_step", "ws.flush", "repo.stage_step", "repo.bump_step_index"]
+    repo.stage_step.assert_called_once_with("job-1", "high")
+
+
+def test_orchestrator_last_step_queues_nothing():
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    job.current_step_index = 1
+    repo.get.return_value = job
+    repo.bump_step_index.side_effect = _bump
+    limiter.acquire_replica.return_value = (0, "fast_chat_llm", "lease-token")
+    client.call.return_value = {"status": "SUCCESS", "data": {}, "metrics": {}}
+
+    assert OrchestratorService(repo, ws, limiter, client).execute_one_step("job-1") == "OK"
+
+    repo.stage_step.assert_not_called()
+
+
+def test_orchestrator_retry_is_queued_with_its_countdown():
+    repo, ws, limiter, client = MagicMock(), MagicMock(), MagicMock(), MagicMock()
+    job = _text_only_job()
+    job.priority = "low"
+    repo.get.return_value = job
+    limiter.acquire_replica.return_value = (0, "prompt_enhancer", "lease-token")
+    client.call.side_effect = ServiceCallError("RESOURCE_EXHAUSTED", "busy", True, retry_after=120)
+
+    service = OrchestratorService(repo, ws, limiter, client)
+    assert service.execute_one_step("job-1") == "RETRY_SCHEDULED"
+
+    repo.stage_step.assert_called_once_with("job-1", "low", countdown=service.countdown)
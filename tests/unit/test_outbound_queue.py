@@ -0,0 +1,90 @@
+import json
+import pytest
+from prometheus_client import REGISTRY
+from app.services.outbound_queue import OutboundQueue
+
+
+def _event(type_, job_id="job-1", step_index=0, **fields):
+    return json.dumps({"type": type_, "job_id": job_id, "step_index": step_index, **fields})
+
+
+@pytest.mark.asyncio
+async def test_waiting_events_conflate_per_step():
+    q = OutboundQueue(limit=10)
+    q.put_nowait(_event("WAITING_FOR_SLOT", message="first"))
+    q.put_nowait(_event("STEP_STARTED"))
+    q.put_nowait(_event("WAITING_FOR_SLOT", message="second"))
+    q.put_nowait(_event("WAITING_FOR_SLOT", step_index=1))
+
+    out = [json.loads(q.get_nowait()) for _ in range(q.qsize())]
+    assert [(e["type"], e.get("message")) for e in out[:2]] == [("STEP_STARTED", None), ("WAITING_FOR_SLOT", "second")]
+    assert out[2]["step_index"] == 1
+    assert q.conflated == 1
+
+    # once delivered, the next waiting event is queued again rather than merged
+    q.put_nowait(_event("WAITING_FOR_SLOT"))
+    assert q.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_conflation_keeps_event_ids_in_order():
+    q = OutboundQueue(limit=10)
+    q.put_nowait(_event("WAITING_FOR_SLOT", event_id="1-0"))
+    q.put_nowait(_event("STEP_STARTED", event_id="2-0"))
+    q.put_nowait(_event("STEP_RETRY_SCHEDULED", event_id="3-0"))
+    q.put_nowait(_event("WAITING_FOR_SLOT", event_id="4-0"))
+
+    ids = [json.loads(q.get_nowait())["event_id"] for _ in range(q.qsize())]
+    # a client skipping ids <= the last one it saw still gets every event
+    assert ids == ["2-0", "3-0", "4-0"]
+
+
+@pytest.mark.asyncio
+async def test_conflating_a_full_queue_does_not_drop():
+    q = OutboundQueue(limit=2)
+    q.put_nowait(_event("WAITING_FOR_SLOT", event_id="1-0"))
+    q.put_nowait(_event("STEP_STARTED", event_id="2-0"))
+    q.put_nowait(_event("WAITING_FOR_SLOT", event_id="3-0"))
+
+    assert q.dropped == 0 and not q.stalled.is_set()
+    assert [json.loads(q.get_nowait())["event_id"] for _ in range(q.qsize())] == ["2-0", "3-0"]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_and_stalls_but_keeps_terminal_events():
+    q = OutboundQueue(limit=2)
+    q.put_nowait(_event("STEP_STARTED"))
+    q.put_nowait(_event("STEP_COMPLETED"))
+    q.put_nowait(_event("STEP_STARTED", step_index=1))
+    assert q.dropped == 1
+    assert q.stalled.is_set()
+
+    q.put_nowait(_event("JOB_COMPLETED"))
+    assert q.qsize() == 3
+    assert json.loads(q.get_nowait())["type"] == "STEP_STARTED"
+
+
+@pytest.mark.asyncio
+async def test_accept_filters_before_queueing():
+    q = OutboundQueue(limit=1, accept=lambda e: e.get("job_id") == "wanted")
+    q.put_nowait(_event("STEP_STARTED", job_id="other"))
+    q.put_nowait(_event("STEP_STARTED", job_id="wanted"))
+    assert q.qsize() == 1
+    assert not q.stalled.is_set()
+
+
+def _exported(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.asyncio
+async def test_conflated_and_dropped_events_are_exported():
+    conflated = _exported("cao_ws_outbound_events_total", outcome="conflated")
+    dropped = _exported("cao_ws_outbound_events_total", outcome="dropped")
+    q = OutboundQueue(limit=1)
+    q.put_nowait(_event("WAITING_FOR_SLOT"))
+    q.put_nowait(_event("WAITING_FOR_SLOT"))
+    q.put_nowait(_event("STEP_STARTED"))
+
+    assert _exported("cao_ws_outbound_events_total", outcome="conflated") == conflated + 1
+    assert _exported("cao_ws_outbound_events_total", outcome="dropped") == dropped + 1
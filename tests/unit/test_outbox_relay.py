@@ -0,0 +1,94 @@
+import time
+from contextlib import nullcontext
+from unittest.mock import MagicMock
+import psycopg2
+import pytest
+from sqlmodel import select
+from app.models.outbox import OutboxMessage
+from app.repositories.job_repository import JobRepository
+from worker import outbox_relay
+
+
+@pytest.fixture
+def enqueue(mocker):
+    mocker.patch.object(outbox_relay.celery_app, "producer_or_acquire", return_value=nullcontext("producer"))
+    return mocker.patch.object(outbox_relay, "enqueue_job_step")
+
+
+def test_stage_step_commits_with_the_job(session):
+    repo = JobRepository(session)
+    repo.stage_step("job-1", "high")
+    repo.create("job-1", "text_only", {}, priority="high", user_id="u1")
+
+    message = session.exec(select(OutboxMessage)).one()
+    assert (message.job_id, message.priority, message.sent_at) == ("job-1", "high", None)
+
+
+def test_staged_step_is_dropped_on_rollback(session):
+    repo = JobRepository(session)
+    repo.stage_step("job-1", "high")
+    session.rollback()
+
+    assert session.exec(select(OutboxMessage)).all() == []
+
+
+def test_relay_publishes_and_marks_sent(session, enqueue):
+    repo = JobRepository(session)
+    repo.enqueue_step("job-1", "high")
+    repo.enqueue_step("job-2", "low", countdown=30)
+
+    assert outbox_relay.relay_batch(session, limit=10) == 2
+
+    first, second = enqueue.call_args_list
+    assert first.args == ("job-1", "high") and first.kwargs["countdown"] is None
+    assert second.args == ("job-2", "low") and 28 <= second.kwargs["countdown"] <= 30
+    assert second.kwargs["producer"] == "producer"
+    assert all(m.sent_at for m in session.exec(select(OutboxMessage)))
+    assert outbox_relay.relay_batch(session, limit=10) == 0
+
+
+def test_relay_leaves_unpublished_rows_for_the_next_pass(session, enqueue):
+    repo = JobRepository(session)
+    repo.enqueue_step("job-1", "high")
+    repo.enqueue_step("job-2", "high")
+    enqueue.side_effect = [None, ConnectionError("broker down")]
+
+    with pytest.raises(ConnectionError):
+        outbox_relay.relay_batch(session, limit=10)
+
+    sent = {m.job_id: m.sent_at for m in session.exec(select(OutboxMessage))}
+    assert sent["job-1"] and sent["job-2"] is None
+
+
+def test_purge_sent_keeps_recent_and_unsent(session):
+    session.add(OutboxMessage(job_id="old", priority="high", sent_at=time.time() - 100))
+    session.add(OutboxMessage(job_id="new", priority="high", sent_at=time.time()))
+    session.add(OutboxMessage(job_id="unsent", priority="high"))
+    session.commit()
+
+    assert outbox_relay.purge_sent(session, time.time() - 50) == 1
+    assert {m.job_id for m in session.exec(select(OutboxMessage))} == {"new", "unsent"}
+
+
+def test_relay_listens_again_after_the_listener_drops(session, enqueue, mocker):
+    relay = outbox_relay.OutboxRelay(engine=session.get_bind(), poll_s=0)
+    dropped, fresh = MagicMock(), MagicMock()
+    dropped.poll.side_effect = psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def listen():
+        if relay._listen.call_count == 2:
+            relay.stop()
+        return [dropped, fresh][relay._listen.call_count - 1]
+
+    def select_(rl, wl, xl, timeout):
+        if outbox_relay.select.select.call_count >= 5:
+            relay.stop()  # never LISTENed again: don't spin forever
+        return rl, [], []
+    mocker.patch.object(relay, "_listen", side_effect=listen)
+    mocker.patch.object(outbox_relay.select, "select", side_effect=select_)
+
+    relay.run()
+
+    assert relay._listen.call_count == 2
+    dropped.close.assert_called_once()
+    fresh.poll.assert_called_once()
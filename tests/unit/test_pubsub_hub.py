@@ -0,0 +1,63 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.services.pubsub_hub import PubSubHub
+
+
+@pytest.fixture
+def hub(mocker):
+    hub = PubSubHub()
+    pubsub = MagicMock()
+    pubsub.subscribe = AsyncMock()
+    pubsub.unsubscribe = AsyncMock()
+    pubsub.get_message = AsyncMock(return_value=None)
+    pubsub.close = AsyncMock()
+    hub._pubsub = pubsub
+    hub._redis = MagicMock(close=AsyncMock())
+    return hub
+
+
+@pytest.mark.asyncio
+async def test_hub_subscribes_once_per_channel(hub):
+    q1 = await hub.subscribe("ws:job-1")
+    q2 = await hub.subscribe("ws:job-1")
+    hub._pubsub.subscribe.assert_awaited_once_with("ws:job-1")
+
+    hub._dispatch("ws:job-1", "evt")
+    assert q1.get_nowait() == "evt"
+    assert q2.get_nowait() == "evt"
+
+    await hub.unsubscribe("ws:job-1", q1)
+    hub._pubsub.unsubscribe.assert_not_awaited()
+    await hub.unsubscribe("ws:job-1", q2)
+    hub._pubsub.unsubscribe.assert_awaited_once_with("ws:job-1")
+    assert hub.subscriber_count() == 0
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_hub_dispatch_only_reaches_channel_subscribers(hub):
+    q1 = await hub.subscribe("ws:job-1")
+    q2 = await hub.subscribe("ws:job-2")
+
+    hub._dispatch("ws:job-2", "evt")
+
+    assert q1.empty()
+    assert q2.get_nowait() == "evt"
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_hub_pattern_subscribers_share_a_queue(hub):
+    hub._pubsub.psubscribe = AsyncMock()
+    hub._pubsub.punsubscribe = AsyncMock()
+    queue = await hub.psubscribe("ws:*")
+    await hub.subscribe("ws:job-1", queue)
+
+    hub._dispatch("ws:*", "evt-a", hub._psubscribers)
+    hub._dispatch("ws:job-1", "evt-b")
+    assert [queue.get_nowait(), queue.get_nowait()] == ["evt-a", "evt-b"]
+
+    await hub.punsubscribe("ws:*", queue)
+    hub._pubsub.punsubscribe.assert_awaited_once_with("ws:*")
+    assert hub.subscriber_count() == 1
+    await hub.close()
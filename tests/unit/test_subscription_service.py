@@ -0,0 +1,93 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.routers.websocket import _handle_command
+from app.services.subscription_service import SubscriptionService
+
+
+@pytest.fixture
+def hub():
+    return MagicMock(subscribe=AsyncMock(), unsubscribe=AsyncMock(),
+                     psubscribe=AsyncMock(), punsubscribe=AsyncMock())
+
+
+def _event(event_id, **fields):
+    return json.dumps({**fields, "event_id": event_id})
+
+
+@pytest.mark.asyncio
+async def test_job_id_subscription_uses_job_channels(hub):
+    subs = SubscriptionService(hub)
+    await subs.subscribe(job_ids=["a", "b"])
+    await subs.subscribe(job_ids=["b"], types=["JOB_COMPLETED"])
+
+    assert sorted(c.args[0] for c in hub.subscribe.await_args_list) == ["ws:a", "ws:b"]
+    hub.psubscribe.assert_not_awaited()
+
+    await subs.unsubscribe(job_ids=["b"])
+    hub.unsubscribe.assert_awaited_once_with("ws:b", subs.queue)
+
+
+@pytest.mark.asyncio
+async def test_filter_subscription_matches_and_dedupes(hub):
+    subs = SubscriptionService(hub, allow_filters=True)
+    await subs.subscribe(user_id="u1", types=["JOB_ERROR"])
+    await subs.subscribe(job_ids=["a"])
+    hub.psubscribe.assert_awaited_once_with("ws:*", subs.queue)
+
+    wanted = {"event_id": "1-0", "job_id": "x", "user_id": "u1", "type": "JOB_ERROR"}
+    assert subs.wants(wanted)
+    assert not subs.wants(wanted)  # same event via a second channel
+    assert not subs.wants({"event_id": "2-0", "job_id": "x", "user_id": "u2", "type": "JOB_ERROR"})
+    assert not subs.wants({"event_id": "3-0", "job_id": "x", "user_id": "u1", "type": "STEP_STARTED"})
+    assert subs.wants({"event_id": "4-0", "job_id": "a", "type": "STEP_STARTED"})
+
+
+@pytest.mark.asyncio
+async def test_queue_keeps_only_wanted_events(hub):
+    subs = SubscriptionService(hub, allow_filters=True)
+    await subs.subscribe(feature_name="full_pipeline")
+    subs.queue.put_nowait(_event("1-0", feature_name="full_pipeline"))
+    subs.queue.put_nowait(_event("2-0", feature_name="other"))
+    subs.queue.put_nowait(_event("3-0", feature_name="full_pipeline"))
+
+    assert [json.loads(e)["event_id"] for e in subs.drain(10)] == ["1-0", "3-0"]
+
+
+@pytest.mark.asyncio
+async def test_close_releases_every_channel(hub):
+    subs = SubscriptionService(hub, allow_filters=True)
+    await subs.subscribe(job_ids=["a"])
+    await subs.subscribe(feature_name="f")
+    await subs.close()
+
+    hub.unsubscribe.assert_awaited_once_with("ws:a", subs.queue)
+    hub.punsubscribe.assert_awaited_once_with("ws:*", subs.queue)
+
+
+@pytest.mark.asyncio
+async def test_handle_command_replies(hub):
+    subs = SubscriptionService(hub)
+    reply = await _handle_command(subs, json.dumps({"action": "subscribe", "job_ids": ["a"]}))
+    assert reply["type"] == "SUBSCRIBED"
+
+    reply = await _handle_command(subs, json.dumps({"action": "unsubscribe",
+                                                    "subscription_id": reply["subscription_id"]}))
+    assert reply["type"] == "UNSUBSCRIBED"
+
+    assert (await _handle_command(subs, json.dumps({"action": "subscribe"})))["type"] == "ERROR"
+    assert (await _handle_command(subs, json.dumps({"action": "subscribe",
+                                                    "types": ["NOPE"]})))["type"] == "ERROR"
+    assert (await _handle_command(subs, "not json"))["type"] == "ERROR"
+
+
+@pytest.mark.asyncio
+async def test_filter_subscription_needs_internal_key(hub):
+    subs = SubscriptionService(hub)
+    reply = await _handle_command(subs, json.dumps({"action": "subscribe", "user_id": "u1"}))
+    assert reply["type"] == "ERROR"
+    hub.psubscribe.assert_not_awaited()
+
+    # filters narrowing explicit job ids stay open
+    reply = await _handle_command(subs, json.dumps({"action": "subscribe", "job_ids": ["a"], "user_id": "u1"}))
+    assert reply["type"] == "SUBSCRIBED"
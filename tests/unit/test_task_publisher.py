@@ -0,0 +1,43 @@
+import re
+from pathlib import Path
+from app.services import task_publisher
+
+
+def test_enqueue_sends_by_name_to_priority_queue(mocker):
+    send_task = mocker.patch.object(task_publisher.celery_app, "send_task")
+    send_task.return_value.id = "task-1"
+    remember = mocker.patch.object(task_publisher.CancellationService, "remember_task")
+
+    task_publisher.enqueue_job_step("job-1", "low", countdown=5)
+
+    name = send_task.call_args[0][0]
+    kwargs = send_task.call_args[1]
+    assert name == "worker.tasks.execute_job_step"
+    assert kwargs["args"] == ["job-1"]
+    assert kwargs["queue"] == "low_priority" and kwargs["countdown"] == 5
+    remember.assert_called_once_with("job-1", "task-1")
+
+
+def test_task_name_matches_worker_registration():
+    import worker.tasks
+    assert worker.tasks.execute_job_step.name == task_publisher.EXECUTE_JOB_STEP
+
+
+def test_periodic_tasks_go_to_a_consumed_queue():
+    compose = (Path(__file__).parents[2] / "docker-compose.yml").read_text()
+    consumed = {q for qs in re.findall(r"worker -Q (\S+)", compose) for q in qs.split(",")}
+    router = task_publisher.celery_app.amqp.router
+
+    for entry in task_publisher.celery_app.conf.beat_schedule.values():
+        queue = router.route({}, entry["task"])["queue"].name
+        assert queue in consumed, f"{entry['task']} goes to {queue}, which no worker consumes"
+
+
+def test_partition_and_archive_tasks_are_scheduled_on_maintenance_queue():
+    from app.config import QUEUE_MAINTENANCE
+    router = task_publisher.celery_app.amqp.router
+    scheduled = {e["task"] for e in task_publisher.celery_app.conf.beat_schedule.values()}
+
+    for task in ("worker.tasks.archive_terminal_jobs", "worker.tasks.maintain_job_partitions"):
+        assert task in scheduled
+        assert router.route({}, task)["queue"].name == QUEUE_MAINTENANCE
@@ -0,0 +1,79 @@
+import json
+import pytest
+from app.services import trace_service
+from app.services.trace_service import TraceService
+
+
+@pytest.fixture
+def r(mocker):
+    return mocker.patch.object(trace_service, "r")
+
+
+def test_sampling_is_per_job_and_deterministic():
+    tracer = TraceService(sample_rate=0.5)
+    picks = [tracer.sampled(f"job-{i}") for i in range(200)]
+
+    assert picks == [tracer.sampled(f"job-{i}") for i in range(200)]
+    assert 60 < sum(picks) < 140
+    assert not TraceService(sample_rate=0).sampled("job-1")
+    assert TraceService(sample_rate=1.0).sampled("job-1")
+
+
+def test_unsampled_job_records_nothing(r):
+    tracer = TraceService(sample_rate=0)
+    tracer.start("job-1")
+    with tracer.span("call"):
+        pass
+    tracer.finish("OK")
+
+    r.pipeline.assert_not_called()
+
+
+def test_finish_stores_compact_record_with_ttl(r):
+    pipe = r.pipeline.return_value
+    tracer = TraceService(sample_rate=1.0)
+    tracer.start("job-1")
+    tracer.add("queue", tracer._t0 - 2.0, tracer._t0)
+    tracer.annotate(step_index=1, service="image_gen", attempt=2)
+    with tracer.span("call"):
+        pass
+    tracer.finish("OK")
+
+    key, field, raw = pipe.hset.call_args[0]
+    record = json.loads(raw)
+    assert key == "trace:job-1"
+    assert field.startswith("1.2.")
+    assert record["r"] == "OK" and record["d"] >= 2000
+    assert [s[0] for s in record["s"]] == ["queue", "call"]
+    assert record["s"][0][1:] == [0, 2000]
+    assert record["a"] == {"step_index": 1, "service": "image_gen", "attempt": 2}
+    pipe.expire.assert_called_once_with("trace:job-1", trace_service.TRACE_TTL_S)
+    assert not tracer.active
+
+
+def test_get_returns_runs_oldest_first(r):
+    r.hgetall.return_value = {
+        "1.1.2000": json.dumps({"t": 2000, "r": "OK", "d": 40, "s": [["call", 5, 30]],
+                                "a": {"step_index": 1, "service": "image_gen", "attempt": 1}}),
+        "0.1.1000": json.dumps({"t": 1000, "r": "OK", "d": 10, "s": []}),
+    }
+
+    runs = TraceService().get("job-1")
+
+    assert [run["started_at"] for run in runs] == [1.0, 2.0]
+    assert runs[1]["service"] == "image_gen"
+    assert runs[1]["spans"] == [{"name": "call", "offset_ms": 5, "duration_ms": 30}]
+
+
+def test_otlp_export_failure_is_swallowed(r, requests_mock):
+    requests_mock.post("http://collector:4318/v1/traces", status_code=500)
+    tracer = TraceService(sample_rate=1.0, otlp_endpoint="http://collector:4318/v1/traces")
+    tracer.start("job-1")
+    with tracer.span("call"):
+        pass
+    tracer.finish("OK")
+
+    body = requests_mock.last_request.json()
+    spans = body["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["step", "call"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
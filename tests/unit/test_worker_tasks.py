@@ -0,0 +1,43 @@
+from contextlib import nullcontext
+import pytest
+from app.models.enums import JobStatus
+from app.repositories.job_repository import JobRepository
+from worker import tasks
+
+
+@pytest.fixture
+def run_step(session, mocker):
+    mocker.patch.object(tasks, "Session", return_value=nullcontext(session))
+    mocker.patch.object(tasks, "TraceService")
+    mocker.patch("app.services.ws_service.r")
+    publish = mocker.patch.object(tasks.WSService, "publish")
+    orchestrator = mocker.patch.object(tasks, "OrchestratorService").return_value
+    orchestrator.config.features = {"text_only": ["prompt_enhancer", "fast_chat_llm"]}
+    return orchestrator, publish
+
+
+def test_last_step_completes_job_and_publishes_event(session, run_step):
+    orchestrator, publish = run_step
+    repo = JobRepository(session)
+    job = repo.create("job-1", "text_only", {}, priority="high", user_id="u1")
+    job.current_step_index = 2
+    orchestrator.execute_one_step.return_value = "OK"
+
+    assert tasks.execute_job_step.run("job-1") == "OK"
+
+    assert repo.get("job-1").status == JobStatus.COMPLETED
+    (job_id, event), kwargs = publish.call_args
+    assert (job_id, event["type"], kwargs["job"].id) == ("job-1", "JOB_COMPLETED", "job-1")
+
+
+def test_intermediate_step_does_not_complete_job(session, run_step):
+    orchestrator, publish = run_step
+    repo = JobRepository(session)
+    job = repo.create("job-1", "text_only", {}, priority="high", user_id="u1")
+    job.current_step_index = 1
+    orchestrator.execute_one_step.return_value = "OK"
+
+    tasks.execute_job_step.run("job-1")
+
+    assert repo.get("job-1").status != JobStatus.COMPLETED
+    publish.assert_not_called()
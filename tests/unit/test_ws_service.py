@@ -0,0 +1,90 @@
+import json
+import pytest
+from app.services import ws_service
+from app.services.ws_service import WSService
+
+
+@pytest.fixture
+def r(mocker):
+    return mocker.patch.object(ws_service, "r")
+
+
+def _sent(client):
+    """(stream key, payload, ttl, publish flag) per evalsha call on `client`."""
+    return [(c.args[2], json.loads(c.args[4]), c.args[5], c.args[7]) for c in client.evalsha.call_args_list]
+
+
+def test_publish_appends_and_publishes(r):
+    WSService().publish("job-1", {"type": "STEP_STARTED", "job_id": "job-1"})
+    args = r.evalsha.call_args.args
+    assert args[1:4] == (1, "events:job-1", 500)
+    assert json.loads(args[4])["type"] == "STEP_STARTED"
+    assert args[5:8] == (86400, "ws:job-1", 1)
+
+
+@pytest.mark.parametrize("payload", [
+    {"type": "STEP_COMPLETED", "job_id": "job-1", "partial": [], "progress": 0.1 + 0.2, "text": "café ☃"},
+    {},
+])
+def test_live_message_matches_replayed_event(r, payload):
+    from app.services.event_stream import _with_event_id
+    WSService().publish("job-1", payload)
+    args = r.evalsha.call_args.args
+
+    live = args[8] + "1700000000000-0" + '"}'  # what PUBLISH_LUA sends
+    assert live == _with_event_id(args[4], "1700000000000-0")
+    assert json.loads(live) == {**payload, "event_id": "1700000000000-0"}
+
+
+def test_publish_shortens_ttl_on_terminal_events(r):
+    WSService().publish("job-1", {"type": "JOB_COMPLETED", "job_id": "job-1"})
+    assert r.evalsha.call_args.args[5] == 3600
+
+    WSService().publish("job-1", {"type": "JOB_ERROR", "action": "RETRY_AVAILABLE"})
+    assert r.evalsha.call_args.args[5] == 86400
+
+
+def test_buffered_events_flush_in_order_through_one_pipeline(r):
+    ws = WSService()
+    with ws.buffered():
+        ws.publish("job-1", {"type": "WAITING_FOR_SLOT"})
+        ws.publish("job-2", {"type": "STEP_STARTED"})
+        ws.publish("job-1", {"type": "STEP_STARTED"})
+        r.evalsha.assert_not_called()
+        r.pipeline.assert_not_called()
+
+    pipe = r.pipeline.return_value
+    assert [(key, p["type"]) for key, p, _, _ in _sent(pipe)] == [
+        ("events:job-1", "WAITING_FOR_SLOT"), ("events:job-2", "STEP_STARTED"), ("events:job-1", "STEP_STARTED")]
+    pipe.execute.assert_called_once()
+    r.evalsha.assert_not_called()
+
+
+def test_explicit_flush_sends_what_is_buffered_so_far(r):
+    ws = WSService()
+    with ws.buffered():
+        ws.publish("job-1", {"type": "WAITING_FOR_SLOT"})
+        ws.flush()
+        assert r.pipeline.return_value.execute.call_count == 1
+        ws.publish("job-1", {"type": "STEP_STARTED"})
+    assert r.pipeline.return_value.execute.call_count == 2
+
+
+def test_buffer_flushes_when_block_raises(r):
+    ws = WSService()
+    with pytest.raises(RuntimeError):
+        with ws.buffered():
+            ws.publish("job-1", {"type": "JOB_ERROR"})
+            raise RuntimeError("boom")
+    r.pipeline.return_value.execute.assert_called_once()
+
+
+def test_skip_unwatched_logs_without_publishing(r):
+    pipe = r.pipeline.return_value
+    pipe.execute.side_effect = [[0, [("ws:job-1", 1), ("ws:job-2", 0)]], None]
+    ws = WSService(skip_unwatched=True)
+    with ws.buffered():
+        ws.publish("job-1", {"type": "STEP_STARTED"})
+        ws.publish("job-2", {"type": "STEP_STARTED"})
+
+    assert {key: flag for key, _, _, flag in _sent(pipe)} == {"events:job-1": 1, "events:job-2": 0}
@@ -0,0 +1,165 @@
+"""
+Outbox relay: publishes the job steps recorded in the `outbox` table.
+
+Job changes that make a step due (job creation, a step index bump, a retry
+or deferral, a resume, a promotion) write an OutboxMessage in the same
+transaction, so a crash between the commit and the publish can no longer
+leave a job that nothing will run. This process claims unsent rows in id
+order with FOR UPDATE SKIP LOCKED (several relays can run side by side),
+publishes them over one broker connection and marks them sent in the same
+transaction. Dispatch is at least once: a relay dying between publishing
+and committing re-sends that batch. A duplicate of a step already recorded
+as SUCCESS is skipped by the orchestrator, but two copies delivered while
+the step is pending can both run it; the service call's Idempotency-Key
+(job, step index, service) is what lets the service dedupe those.
+
+It wakes on the `outbox` NOTIFY sent by an insert trigger, and polls every
+OUTBOX_POLL_S in case one was missed (LISTEN needs a session, so behind
+PgBouncer in transaction mode it only polls).
+
+    python -m worker.outbox_relay
+"""
+import logging
+import math
+import select
+import signal
+import threading
+import time
+
+from sqlalchemy import delete, select as sa_select, update
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from app.celery_app import celery_app
+from app.config import DB_PGBOUNCER, OUTBOX_BATCH_SIZE, OUTBOX_POLL_S, OUTBOX_RETENTION_S
+from app.core.db import make_engine
+from app.models.outbox import OutboxMessage
+from app.services.task_publisher import enqueue_job_step
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "outbox"
+PURGE_INTERVAL_S = 60.0
+
+
+def relay_batch(session: Session, limit: int = OUTBOX_BATCH_SIZE) -> int:
+    """Publish up to `limit` unsent messages; returns how many were sent."""
+    messages = session.execute(
+        sa_select(OutboxMessage)
+        .where(OutboxMessage.sent_at.is_(None))
+        .order_by(OutboxMessage.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not messages:
+        session.rollback()
+        return 0
+
+    sent = []
+    try:
+        with celery_app.producer_or_acquire() as producer:
+            for m in messages:
+                now = time.time()
+                due_at = m.created_at + (m.countdown or 0)
+                countdown = math.ceil(due_at - now) if due_at > now else None
+                enqueue_job_step(m.job_id, m.priority, countdown=countdown, due_at=due_at, producer=producer)
+                sent.append(m.id)
+    finally:
+        # rows that failed to publish stay unsent and are retried on the next pass
+        if sent:
+            session.execute(update(OutboxMessage).where(OutboxMessage.id.in_(sent)).values(sent_at=time.time()))
+        session.commit()
+    return len(sent)
+
+
+def purge_sent(session: Session, older_than: float) -> int:
+    result = session.execute(delete(OutboxMessage).where(OutboxMessage.sent_at < older_than))
+    session.commit()
+    return result.rowcount
+
+
+class OutboxRelay:
+    def __init__(self, engine=None, batch_size: int = OUTBOX_BATCH_SIZE, poll_s: float = OUTBOX_POLL_S):
+        self.engine = engine or make_engine("worker")
+        self.batch_size = batch_size
+        self.poll_s = poll_s
+        self.stopping = threading.Event()
+        self._listener = None
+
+    def _listen(self):
+        if DB_PGBOUNCER or self.engine.dialect.name != "postgresql":
+            return None
+        conn = self.engine.raw_connection()
+        conn.detach()  # held for the relay's lifetime, outside the pool
+        dbapi = conn.driver_connection
+        dbapi.autocommit = True
+        with dbapi.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        return dbapi
+
+    def _wait(self):
+        if self._listener is None:
+            self.stopping.wait(self.poll_s)
+            return
+        if select.select([self._listener], [], [], self.poll_s)[0]:
+            self._listener.poll()
+            self._listener.notifies.clear()
+
+    def _close_listener(self):
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except Exception:
+                pass
+            self._listener = None
+
+    def run_once(self) -> int:
+        with Session(self.engine) as session:
+            return relay_batch(session, self.batch_size)
+
+    def run(self):
+        purged_at = 0.0
+        while not self.stopping.is_set():
+            try:
+                if self._listener is None:
+                    self._listener = self._listen()
+                # listening before reading, so nothing committed in between is missed
+                sent = self.run_once()
+                if time.time() - purged_at > PURGE_INTERVAL_S:
+                    with Session(self.engine) as session:
+                        purge_sent(session, time.time() - OUTBOX_RETENTION_S)
+                    purged_at = time.time()
+                if sent < self.batch_size:
+                    try:
+                        self._wait()
+                    except Exception:
+                        # e.g. psycopg2.OperationalError from poll() after a Postgres restart:
+                        # drop the connection so the next pass LISTENs again
+                        logger.warning("outbox relay lost its LISTEN connection; reconnecting", exc_info=True)
+                        self._close_listener()
+                        self.stopping.wait(self.poll_s)
+            except OperationalError:
+                logger.warning("outbox relay lost the database; retrying", exc_info=True)
+                self._close_listener()
+                self.stopping.wait(self.poll_s)
+            except Exception:
+                # broker outage: unsent rows stay in the outbox
+                logger.exception("outbox relay failed to publish; retrying")
+                self.stopping.wait(self.poll_s)
+        self._close_listener()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    relay = OutboxRelay()
+    signal.signal(signal.SIGTERM, relay.stop)
+    signal.signal(signal.SIGINT, relay.stop)
+    logger.info("outbox relay started")
+    relay.run()
+
+
+if __name__ == "__main__":
+    main()
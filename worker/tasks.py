@@ -1,20 +1,32 @@
 import time
 import redis
+from typing import Optional
 from celery import Task
 from sqlalchemy.exc import OperationalError
-from sqlmodel import Session, create_engine
+from sqlmodel import Session
 
 from app.celery_app import celery_app
-from app.config import DATABASE_URL, FEATURES, SERVICES, JOB_STUCK_SECONDS, REDIS_URL
+from app.config import (JOB_STUCK_SECONDS, JOB_ARCHIVE_AFTER_S, JOB_ARCHIVE_BATCH_SIZE, JOB_ARCHIVE_MAX_BATCHES,
+                        JOB_PARTITIONS_AHEAD)
+from app.core.db import make_engine
 from app.repositories.job_repository import JobRepository
 from app.services.ws_service import WSService
-from app.services.limiter_service import LimiterService, r as redis_conn
-from app.services.http_service_client import HTTPServiceClient
+from app.services.limiter_service import LimiterService
+from app.services.http_service_client import HTTPServiceClient, service_replicas
 from app.services.orchestrator_service import OrchestratorService
-from app.models.enums import JobStatus
+from app.services.coalescing_service import CoalescingService
+from app.services.batching_service import BatchingService
+from app.services.circuit_breaker_service import CircuitBreakerService
+from app.services.cancellation_service import CancellationService
+from app.services.health_service import HealthService
+from app.services import config_service
+from app.services.trace_service import TraceService
+from app.services.bulk_resume_service import BulkResumeService
+from app.models.enums import JobStatus, WebSocketEvent
+from app.core.metrics import QUEUE_WAIT_SECONDS, instrument_db_commits, priority_of_queue
 
-engine = create_engine(DATABASE_URL)
-r = redis.from_url(REDIS_URL, decode_responses=True)
+engine = make_engine("worker")
+instrument_db_commits()
 
 class BaseTaskWithRetry(Task):
     autoretry_for = (redis.exceptions.RedisError, OperationalError)
@@ -22,45 +34,61 @@ class BaseTaskWithRetry(Task):
     retry_backoff = True
 
 @celery_app.task(bind=True, base=BaseTaskWithRetry, acks_late=True)
-def execute_job_step(self, job_id: str):
-    from app.config import QUEUE_HIGH, QUEUE_MEDIUM, QUEUE_LOW
-    
+def execute_job_step(self, job_id: str, enqueued_at: Optional[float] = None):
+    tracer = TraceService()
+    tracer.start(job_id)
+    if enqueued_at and not self.request.retries:
+        now = time.time()
+        queue = (self.request.delivery_info or {}).get("routing_key")
+        QUEUE_WAIT_SECONDS.labels(priority_of_queue(queue)).observe(max(0.0, now - enqueued_at))
+        tracer.add("queue", min(enqueued_at, now), now)
+
     with Session(engine) as session:
         repo = JobRepository(session)
+        limiter = LimiterService()
+        client = HTTPServiceClient()
+        breaker = CircuitBreakerService()
+        ws = WSService()
         orchestrator = OrchestratorService(
             repo=repo,
-            ws=WSService(),
-            limiter=LimiterService(),
-            client=HTTPServiceClient()
+            ws=ws,
+            limiter=limiter,
+            client=client,
+            coalescer=CoalescingService(),
+            batcher=BatchingService(limiter, client, breaker),
+            breaker=breaker,
+            cancellation=CancellationService(),
+            health=HealthService(),
+            tracer=tracer,
         )
 
-        result = orchestrator.execute_one_step(job_id)
-        if result in ("OK", "SKIPPED_ALREADY_DONE"):
-            # queue next step to same priority queue
-            job = repo.get(job_id)
-            if not job:
-                return "JOB_NOT_FOUND"
-            recipe = FEATURES[job.feature_name]
-            if job.current_step_index < len(recipe):
-                # Route to priority queue based on job's current priority
-                queue_map = {
-                    "high": QUEUE_HIGH,
-                    "medium": QUEUE_MEDIUM,
-                    "low": QUEUE_LOW
-                }
-                target_queue = queue_map.get(job.priority, QUEUE_MEDIUM)
-                execute_job_step.apply_async(args=[job_id], queue=target_queue)
-            else:
-                repo.set_status(job, JobStatus.COMPLETED)
+        # events go out in one pipeline, flushed before blocking calls and before the step's
+        # outcome commits (which queues the next run through the outbox)
+        with ws.buffered():
+            result = orchestrator.execute_one_step(job_id)
+            if result in ("OK", "SKIPPED_ALREADY_DONE"):
+                job = repo.get(job_id)
+                if not job:
+                    return "JOB_NOT_FOUND"
+                recipe = orchestrator.config.features[job.feature_name]
+                if job.current_step_index >= len(recipe):
+                    repo.set_status(job, JobStatus.COMPLETED)
+                    ws.publish(job_id, {"type": WebSocketEvent.JOB_COMPLETE, "job_id": job_id,
+                                        "message": "Job completed"}, job=job)
+            with tracer.span("publish"):
+                ws.flush()
+        tracer.finish(result)
         return result
 
 @celery_app.task
 def reap_expired_leases():
-    # recompute counters from leases
+    # recompute counters from leases, per replica slot
     from app.services.limiter_service import r as rr
-    for svc in SERVICES.keys():
-        leases = rr.keys(f"lease:{svc}:*")
-        rr.set(f"conc:{svc}", len(leases))
+    limiter = LimiterService()
+    for svc, conf in config_service.current().services.items():
+        for slot in limiter.slots(svc, service_replicas(conf)):
+            leases = rr.keys(f"lease:{slot}:*")
+            rr.set(f"conc:{slot}", len(leases))
 
 @celery_app.task
 def sanity_check_stuck_jobs():
@@ -70,19 +98,20 @@ def sanity_check_stuck_jobs():
         rows = session.exec("SELECT id, last_progress_at FROM job WHERE status='RUNNING'").all()
         repo = JobRepository(session)
         ws = WSService()
-        for job_id, last_prog in rows:
-            if now - float(last_prog) > JOB_STUCK_SECONDS:
-                job = repo.get(job_id)
-                if not job or job.status != JobStatus.RUNNING:
-                    continue
-                repo.fail(job, "STUCK_DETECTED", f"No progress > {JOB_STUCK_SECONDS}s", True)
-                ws.publish(job_id, {
-                    "type": "JOB_ERROR",
-                    "job_id": job_id,
-                    "error_code": "STUCK_DETECTED",
-                    "message": "Job paused due to inactivity. You can resume.",
-                    "action": "RETRY_AVAILABLE"
-                })
+        with ws.buffered():
+            for job_id, last_prog in rows:
+                if now - float(last_prog) > JOB_STUCK_SECONDS:
+                    job = repo.get(job_id)
+                    if not job or job.status != JobStatus.RUNNING:
+                        continue
+                    repo.fail(job, "STUCK_DETECTED", f"No progress > {JOB_STUCK_SECONDS}s", True)
+                    ws.publish(job_id, {
+                        "type": WebSocketEvent.ERROR,
+                        "job_id": job_id,
+                        "error_code": "STUCK_DETECTED",
+                        "message": "Job paused due to inactivity. You can resume.",
+                        "action": "RETRY_AVAILABLE"
+                    }, job=job)
 
 @celery_app.task
 def promote_waiting_jobs():
@@ -91,44 +120,73 @@ def promote_waiting_jobs():
     Low → Medium after 30 min
     Medium → High after 60 min
     """
-    from app.config import QUEUE_HIGH, QUEUE_MEDIUM, QUEUE_LOW
-    
     with Session(engine) as session:
         repo = JobRepository(session)
         ws = WSService()
         
         jobs_to_promote = repo.get_jobs_for_promotion()
-        
-        for job in jobs_to_promote:
-            old_priority = job.priority
-            
-            # Determine new priority
-            if job.priority == "low":
-                new_priority = "medium"
-            elif job.priority == "medium":
-                new_priority = "high"
-            else:
-                continue  # Already high
-            
-            # Promote job
-            repo.promote_job(job, new_priority)
-            
-            # Notify via WebSocket
-            ws.publish(job.id, {
-                "type": "JOB_PROMOTED",
-                "job_id": job.id,
-                "old_priority": old_priority,
-                "new_priority": new_priority,
-                "message": f"Job promoted from {old_priority} to {new_priority} due to wait time"
-            })
-            
-            # If job is still pending, re-queue to higher priority queue
-            if job.status == JobStatus.PENDING:
-                queue_map = {
-                    "high": QUEUE_HIGH,
-                    "medium": QUEUE_MEDIUM,
-                    "low": QUEUE_LOW
-                }
-                new_queue = queue_map[new_priority]
-                # Re-queue with higher priority
-                execute_job_step.apply_async(args=[job.id], queue=new_queue)
+        requeue = []
+
+        with ws.buffered():
+            for job in jobs_to_promote:
+                old_priority = job.priority
+
+                # Determine new priority
+                if job.priority == "low":
+                    new_priority = "medium"
+                elif job.priority == "medium":
+                    new_priority = "high"
+                else:
+                    continue  # Already high
+
+                # Promote job
+                repo.promote_job(job, new_priority)
+
+                # Notify via WebSocket
+                ws.publish(job.id, {
+                    "type": WebSocketEvent.JOB_PROMOTED,
+                    "job_id": job.id,
+                    "old_priority": old_priority,
+                    "new_priority": new_priority,
+                    "message": f"Job promoted from {old_priority} to {new_priority} due to wait time"
+                }, job=job)
+
+                # If job is still pending, re-queue to higher priority queue
+                if job.status == JobStatus.PENDING:
+                    requeue.append((job.id, new_priority))
+
+        # after the flush, so a re-queued step's events follow its promotion event
+        for job_id, new_priority in requeue:
+            repo.stage_step(job_id, new_priority)
+        session.commit()
+
+@celery_app.task
+def ramp_resumed_jobs():
+    """Release jobs parked by a bulk resume as their services free up (see BulkResumeService)."""
+    with Session(engine) as session:
+        ws = WSService()
+        with ws.buffered():
+            return BulkResumeService().ramp(JobRepository(session), ws)
+
+@celery_app.task
+def archive_terminal_jobs():
+    """Move terminal jobs older than JOB_ARCHIVE_AFTER_S to job_archive, a batch per transaction."""
+    cutoff = time.time() - JOB_ARCHIVE_AFTER_S
+    moved = 0
+    with Session(engine) as session:
+        repo = JobRepository(session)
+        for _ in range(JOB_ARCHIVE_MAX_BATCHES):
+            n = repo.archive_terminal(cutoff, JOB_ARCHIVE_BATCH_SIZE)
+            moved += n
+            if n < JOB_ARCHIVE_BATCH_SIZE:
+                break
+    return moved
+
+@celery_app.task
+def maintain_job_partitions():
+    """Create upcoming monthly job partitions; drop old ones the archiver has emptied."""
+    with Session(engine) as session:
+        repo = JobRepository(session)
+        created = repo.ensure_partitions(JOB_PARTITIONS_AHEAD)
+        dropped = repo.drop_empty_partitions(time.time() - JOB_ARCHIVE_AFTER_S)
+    return {"created": created, "dropped": dropped}